@@ -4,7 +4,7 @@ import sys
 import argparse
 import os
 
-from compass import list, setup, clean, suite, cache
+from compass import list, setup, clean, suite, cache, perf
 from compass.version import __version__
 import compass.run.serial as run_serial
 
@@ -25,6 +25,7 @@ The available compass commands are:
     clean   Clean up a test case
     suite   Manage a regression test suite
     run     Run a suite, test case or step
+    perf    Show the performance history of steps
 
  To get help on an individual command, run:
 
@@ -50,7 +51,8 @@ The available compass commands are:
                 'setup': setup.main,
                 'clean': clean.main,
                 'suite': suite.main,
-                'run': run_serial.main}
+                'run': run_serial.main,
+                'perf': perf.main}
     if allow_cache:
         commands['cache'] = cache.main
 
@@ -1,15 +1,32 @@
+import fcntl
+import hashlib
 import os
+import re
 import tempfile
 import requests
 import progressbar
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 import importlib.resources
+from contextlib import contextmanager
 
+# a hexadecimal SHA-256 checksum
+_checksum_regex = re.compile(r'^[0-9a-f]{64}$')
 
-def download(url, dest_path, config, exceptions=True):
+# the number of bytes to read from a download at a time
+_chunk_size = 1024**2
+
+
+def download(url, dest_path, config, exceptions=True, checksum=None,  # noqa: C901, E501
+             progress=True):
     """
     Download a file from a URL to the given path or path name
 
+    The file is downloaded to a temporary ``<dest_path>.part`` file that is
+    renamed once the download is complete, so an interrupted download can be
+    resumed (if the server supports HTTP ``Range`` requests) and will never be
+    mistaken for a complete file.
+
     Parameters
     ----------
     url : str
@@ -26,6 +43,16 @@ def download(url, dest_path, config, exceptions=True):
     exceptions : bool, optional
         Whether to raise exceptions when the download fails
 
+    checksum : str, optional
+        The SHA-256 checksum (as a hexadecimal string, optionally prefixed by
+        ``sha256:``) that the downloaded file must have.  If not provided and
+        the ``check_checksum`` config option is ``True``, a published checksum
+        is read from ``<url>.sha256`` if the server has one.
+
+    progress : bool, optional
+        Whether to display a progress bar.  This should be ``False`` when
+        several files are being downloaded at once.
+
     Returns
     -------
     dest_path : str
@@ -39,6 +66,10 @@ def download(url, dest_path, config, exceptions=True):
     do_download = config.getboolean('download', 'download')
     check_size = config.getboolean('download', 'check_size')
     verify = config.getboolean('download', 'verify')
+    if config.has_option('download', 'check_checksum'):
+        check_checksum = config.getboolean('download', 'check_checksum')
+    else:
+        check_checksum = False
 
     if not do_download:
         if not os.path.exists(dest_path):
@@ -49,10 +80,6 @@ def download(url, dest_path, config, exceptions=True):
     if not check_size and os.path.exists(dest_path):
         return dest_path
 
-    session = requests.Session()
-    if not verify:
-        session.verify = False
-
     # dest_path contains full path, so we need to make the relevant
     # subdirectories if they do not exist already
     directory = os.path.dirname(dest_path)
@@ -61,80 +88,201 @@ def download(url, dest_path, config, exceptions=True):
     except OSError:
         pass
 
-    try:
-        response = session.get(url, stream=True)
-        total_size = response.headers.get('content-length')
-    except requests.exceptions.RequestException:
-        if exceptions:
-            raise
-        else:
-            print(f'  {url} could not be reached!')
-            return None
+    # only one process (or thread) at a time downloads a given file, e.g.
+    # when test cases that share a database are set up in parallel
+    with _download_lock(dest_path):
+        if not check_size and os.path.exists(dest_path):
+            # the file was downloaded while we were waiting
+            return dest_path
 
-    try:
-        response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        if exceptions:
-            raise
-        else:
-            print(f'ERROR while downloading {in_file_name}:')
-            print(e)
-            return None
+        session = requests.Session()
+        if not verify:
+            session.verify = False
 
-    if total_size is None:
-        # no content length header
-        if not os.path.exists(dest_path):
-            dest_dir = os.path.dirname(dest_path)
-            with open(dest_path, 'wb') as f:
-                print(f'Downloading {in_file_name}\n'
-                      f'  to {dest_dir}...')
-                try:
-                    f.write(response.content)
-                except requests.exceptions.RequestException:
-                    if exceptions:
-                        raise
-                    else:
-                        print(f'  {in_file_name} failed!')
-                        return None
-                else:
-                    print('  {in_file_name} done.')
-    else:
-        # we can do the download in chunks and use a progress bar, yay!
+        part_path = f'{dest_path}.part'
+
+        try:
+            response, resume_size = _start_download(session, url, dest_path,
+                                                    part_path)
+            total_size = response.headers.get('content-length')
+        except requests.exceptions.RequestException:
+            if exceptions:
+                raise
+            else:
+                print(f'  {url} could not be reached!')
+                return None
 
-        total_size = int(total_size)
-        if os.path.exists(dest_path) and \
-                total_size == os.path.getsize(dest_path):
-            # we already have the file, so just return
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            if exceptions:
+                raise
+            else:
+                print(f'ERROR while downloading {in_file_name}:')
+                print(e)
+                return None
+
+        if total_size is not None:
+            total_size = int(total_size) + resume_size
+            if os.path.exists(dest_path) and \
+                    total_size == os.path.getsize(dest_path):
+                # we already have the file, so just return
+                response.close()
+                return dest_path
+        elif os.path.exists(dest_path):
+            # no content length header, so we have to trust the existing file
+            response.close()
             return dest_path
 
+        if checksum is None and check_checksum:
+            checksum = _get_published_checksum(session, url)
+
         if out_file_name == in_file_name:
             file_names = in_file_name
         else:
             file_names = f'{in_file_name} as {out_file_name}'
         dest_dir = os.path.dirname(dest_path)
-        print(f'Downloading {file_names} ({_sizeof_fmt(total_size)})\n'
-              f'  to {dest_dir}')
-        widgets = [progressbar.Percentage(), ' ', progressbar.Bar(),
-                   ' ', progressbar.ETA()]
-        bar = progressbar.ProgressBar(widgets=widgets,
-                                      max_value=total_size).start()
-        size = 0
-        with open(dest_path, 'wb') as f:
-            try:
-                for data in response.iter_content(chunk_size=4096):
-                    size += len(data)
-                    f.write(data)
-                    bar.update(size)
-                bar.finish()
-            except requests.exceptions.RequestException:
-                if exceptions:
-                    raise
-                else:
-                    print(f'  {in_file_name} failed!')
-                    return None
+        if total_size is None:
+            print(f'Downloading {file_names}\n'
+                  f'  to {dest_dir}...')
+        else:
+            print(f'Downloading {file_names} ({_sizeof_fmt(total_size)})\n'
+                  f'  to {dest_dir}')
+        if resume_size > 0:
+            print(f'  resuming after {_sizeof_fmt(resume_size)}')
+
+        try:
+            size, digest = _write_download(response, part_path, resume_size,
+                                           total_size, progress)
+        except requests.exceptions.RequestException:
+            if exceptions:
+                raise
+            else:
+                print(f'  {in_file_name} failed!')
+                return None
+
+        message = None
+        if total_size is not None and size != total_size:
+            message = f'{in_file_name} is {size} bytes but should be ' \
+                      f'{total_size} bytes'
+        elif checksum is not None and digest != _parse_checksum(checksum):
+            # the partial file is corrupt, so don't try to resume it
+            os.remove(part_path)
+            message = f'{in_file_name} has SHA-256 checksum {digest} but ' \
+                      f'should be {_parse_checksum(checksum)}'
+        if message is not None:
+            if exceptions:
+                raise OSError(message)
             else:
-                print(f'  {in_file_name} done.')
-    return dest_path
+                print(f'  {in_file_name} failed: {message}')
+                return None
+
+        os.replace(part_path, dest_path)
+        print(f'  {in_file_name} done.')
+        return dest_path
+
+
+class DownloadManager:
+    """
+    A manager for downloading files concurrently.  Each file is downloaded in
+    a background thread as soon as it is added, and each destination path is
+    only downloaded once.
+
+    Attributes
+    ----------
+    config : compass.config.CompassConfigParser
+        Configuration options used for downloading
+
+    max_workers : int
+        The maximum number of files to download at once
+    """
+
+    def __init__(self, config, max_workers=None):
+        """
+        Create a download manager
+
+        Parameters
+        ----------
+        config : compass.config.CompassConfigParser
+            Configuration options used for downloading
+
+        max_workers : int, optional
+            The maximum number of files to download at once, by default from
+            the ``parallel_downloads`` config option in the ``download``
+            section
+        """
+        if max_workers is None:
+            if config.has_option('download', 'parallel_downloads'):
+                max_workers = config.getint('download', 'parallel_downloads')
+            else:
+                max_workers = 1
+        self.config = config
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures = dict()
+        self._callbacks = list()
+
+    def add(self, url, dest_path, config=None, checksum=None):
+        """
+        Start downloading a file (if it isn't already being downloaded)
+
+        Parameters
+        ----------
+        url : str
+            The URL (including file name) to download
+
+        dest_path : str
+            The path (including file name) where the downloaded file should be
+            saved
+
+        config : compass.config.CompassConfigParser, optional
+            Configuration options to use for this download, if they differ
+            from those of the manager
+
+        checksum : str, optional
+            The SHA-256 checksum the downloaded file must have
+
+        Returns
+        -------
+        dest_path : str
+            The absolute path where the file will be downloaded
+        """
+        dest_path = os.path.abspath(dest_path)
+        if dest_path not in self._futures:
+            if config is None:
+                config = self.config
+            self._futures[dest_path] = self._executor.submit(
+                download, url, dest_path, config, checksum=checksum,
+                progress=self.max_workers == 1)
+        return dest_path
+
+    def add_callback(self, callback, *args):
+        """
+        Add a function to call once all downloads have completed
+
+        Parameters
+        ----------
+        callback : callable
+            The function to call
+
+        *args
+            The arguments to the function
+        """
+        self._callbacks.append((callback, args))
+
+    def wait(self):
+        """
+        Wait for all downloads to complete, raising the first exception from
+        a failed download (if any), then call any callbacks
+        """
+        try:
+            for future in self._futures.values():
+                future.result()
+        finally:
+            self._executor.shutdown()
+        for callback, args in self._callbacks:
+            callback(*args)
+        self._callbacks = list()
 
 
 def symlink(target, link_name, overwrite=True):
@@ -209,6 +357,161 @@ def package_path(package, resource):
         importlib.resources.files(package) / file_name)
 
 
+@contextmanager
+def _download_lock(dest_path):
+    """
+    Hold an exclusive lock on ``<dest_path>.lock`` while downloading a file,
+    so other processes setting up test cases wait rather than writing to the
+    same partial file.  The lock file is removed afterwards.  If the file
+    can't be locked (e.g. in a read-only database or on a file system without
+    ``flock`` support), the download proceeds without a lock.
+    """
+    lock_path = f'{dest_path}.lock'
+    handle = _acquire_lock(lock_path)
+    try:
+        yield
+    finally:
+        if handle is not None:
+            # remove the lock file while we still hold the lock, so processes
+            # waiting for it know to lock a new one
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            os.close(handle)
+
+
+def _acquire_lock(lock_path):
+    """
+    Get an exclusive lock on a lock file, returning its file descriptor or
+    ``None`` if it can't be locked
+    """
+    while True:
+        try:
+            handle = os.open(lock_path, os.O_RDONLY | os.O_CREAT, 0o664)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        except OSError:
+            os.close(handle)
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+            return None
+        try:
+            if os.path.samestat(os.fstat(handle), os.stat(lock_path)):
+                return handle
+        except FileNotFoundError:
+            pass
+        # the process that held the lock removed the lock file, so try again
+        os.close(handle)
+
+
+def _start_download(session, url, dest_path, part_path):
+    """
+    Start a streaming download, resuming from a partial file if there is one
+    and the server supports it.  Returns the response and the number of bytes
+    already downloaded.
+    """
+    if os.path.exists(dest_path):
+        # we only need to check the size of the existing file
+        resume_size = 0
+    elif os.path.exists(part_path):
+        resume_size = os.path.getsize(part_path)
+    else:
+        resume_size = 0
+
+    response = _get(session, url, resume_size)
+    if response.status_code == 416:
+        # the partial file can't be resumed, so start over
+        resume_size = 0
+        response = _get(session, url, resume_size)
+    elif resume_size > 0 and response.status_code != 206:
+        # the server ignored the range request, so start over
+        resume_size = 0
+    return response, resume_size
+
+
+def _write_download(response, part_path, resume_size, total_size, progress):
+    """
+    Write a download to a partial file, appending if resuming.  Returns the
+    size and SHA-256 checksum of the full file.
+    """
+    sha = hashlib.sha256()
+    if resume_size > 0:
+        with open(part_path, 'rb') as f:
+            for data in iter(lambda: f.read(_chunk_size), b''):
+                sha.update(data)
+
+    if progress and total_size is not None:
+        # we can use a progress bar, yay!
+        widgets = [progressbar.Percentage(), ' ', progressbar.Bar(),
+                   ' ', progressbar.ETA()]
+        bar = progressbar.ProgressBar(widgets=widgets,
+                                      max_value=total_size).start()
+    else:
+        bar = None
+
+    size = resume_size
+    mode = 'ab' if resume_size > 0 else 'wb'
+    with open(part_path, mode) as f:
+        for data in response.iter_content(chunk_size=_chunk_size):
+            size += len(data)
+            f.write(data)
+            sha.update(data)
+            if bar is not None:
+                bar.update(size)
+    if bar is not None:
+        bar.finish()
+
+    return size, sha.hexdigest()
+
+
+def _get(session, url, resume_size):
+    """
+    Start a streaming download, requesting only the bytes after
+    ``resume_size`` if it is nonzero
+    """
+    if resume_size > 0:
+        headers = {'Range': f'bytes={resume_size}-'}
+    else:
+        headers = None
+    return session.get(url, stream=True, headers=headers)
+
+
+def _get_published_checksum(session, url):
+    """
+    Get the SHA-256 checksum published at ``<url>.sha256`` (in the format
+    written by ``sha256sum``), or ``None`` if there isn't one.  Anything
+    other than a valid checksum (e.g. an HTML page for a missing file) is
+    ignored.
+    """
+    try:
+        response = session.get(f'{url}.sha256')
+    except requests.exceptions.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    tokens = response.text.split()
+    if len(tokens) == 0:
+        return None
+    checksum = tokens[0].lower()
+    if _checksum_regex.match(checksum) is None:
+        return None
+    return checksum
+
+
+def _parse_checksum(checksum):
+    """ Get the hexadecimal SHA-256 checksum from a checksum string """
+    checksum = checksum.strip().lower()
+    if checksum.startswith('sha256:'):
+        checksum = checksum[len('sha256:'):]
+    return checksum
+
+
 # From https://stackoverflow.com/a/1094933/7728169
 def _sizeof_fmt(num, suffix='B'):
     """
@@ -6,7 +6,8 @@ from jinja2 import Template
 
 
 def write_job_script(config, machine, target_cores, min_cores, work_dir,
-                     suite='', pre_run_commands='', post_run_commands=''):
+                     suite='', pre_run_commands='', post_run_commands='',
+                     run_command=None):
     """
 
     Parameters
@@ -37,6 +38,9 @@ def write_job_script(config, machine, target_cores, min_cores, work_dir,
     post_run_commands : str, optional
         Optional commands to be inserted into job script after calling of
         compass run
+
+    run_command : str, optional
+        The command(s) the job runs in place of ``compass run``
     """
 
     if config.has_option('parallel', 'account'):
@@ -90,13 +94,17 @@ def write_job_script(config, machine, target_cores, min_cores, work_dir,
             job_name = f'compass_{suite}'
     wall_time = config.get('job', 'wall_time')
 
+    if run_command is None:
+        run_command = f'compass run {suite}'
+
     template = Template(resources.read_text(
         'compass.job', 'job_script.template'))
 
     text = template.render(job_name=job_name, account=account,
                            nodes=f'{nodes}', wall_time=wall_time, qos=qos,
                            partition=partition, constraint=constraint,
-                           suite=suite, pre_run_commands=pre_run_commands,
+                           run_command=run_command,
+                           pre_run_commands=pre_run_commands,
                            post_run_commands=post_run_commands)
     text = _clean_up_whitespace(text)
     if suite == '':
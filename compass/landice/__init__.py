@@ -1,19 +1,3 @@
-from compass.landice.tests.antarctica import Antarctica
-from compass.landice.tests.calving_dt_convergence import CalvingDtConvergence
-from compass.landice.tests.circular_shelf import CircularShelf
-from compass.landice.tests.dome import Dome
-from compass.landice.tests.eismint2 import Eismint2
-from compass.landice.tests.ensemble_generator import EnsembleGenerator
-from compass.landice.tests.enthalpy_benchmark import EnthalpyBenchmark
-from compass.landice.tests.greenland import Greenland
-from compass.landice.tests.humboldt import Humboldt
-from compass.landice.tests.hydro_radial import HydroRadial
-from compass.landice.tests.ismip6_forcing import Ismip6Forcing
-from compass.landice.tests.ismip6_run import Ismip6Run
-from compass.landice.tests.kangerlussuaq import Kangerlussuaq
-from compass.landice.tests.koge_bugt_s import KogeBugtS
-from compass.landice.tests.mismipplus import MISMIPplus
-from compass.landice.tests.thwaites import Thwaites
 from compass.mpas_core import MpasCore
 
 
@@ -28,19 +12,24 @@ class Landice(MpasCore):
         """
         super().__init__(name='landice')
 
-        self.add_test_group(Antarctica(mpas_core=self))
-        self.add_test_group(CalvingDtConvergence(mpas_core=self))
-        self.add_test_group(CircularShelf(mpas_core=self))
-        self.add_test_group(Dome(mpas_core=self))
-        self.add_test_group(Eismint2(mpas_core=self))
-        self.add_test_group(EnsembleGenerator(mpas_core=self))
-        self.add_test_group(EnthalpyBenchmark(mpas_core=self))
-        self.add_test_group(Greenland(mpas_core=self))
-        self.add_test_group(Humboldt(mpas_core=self))
-        self.add_test_group(HydroRadial(mpas_core=self))
-        self.add_test_group(Ismip6Forcing(mpas_core=self))
-        self.add_test_group(Ismip6Run(mpas_core=self))
-        self.add_test_group(Kangerlussuaq(mpas_core=self))
-        self.add_test_group(KogeBugtS(mpas_core=self))
-        self.add_test_group(MISMIPplus(mpas_core=self))
-        self.add_test_group(Thwaites(mpas_core=self))
+        # test groups are only imported when they are needed
+        tests = 'compass.landice.tests'
+        self.add_test_group_class(f'{tests}.antarctica', 'Antarctica')
+        self.add_test_group_class(f'{tests}.calving_dt_convergence',
+                                  'CalvingDtConvergence')
+        self.add_test_group_class(f'{tests}.circular_shelf', 'CircularShelf')
+        self.add_test_group_class(f'{tests}.dome', 'Dome')
+        self.add_test_group_class(f'{tests}.eismint2', 'Eismint2')
+        self.add_test_group_class(f'{tests}.ensemble_generator',
+                                  'EnsembleGenerator')
+        self.add_test_group_class(f'{tests}.enthalpy_benchmark',
+                                  'EnthalpyBenchmark')
+        self.add_test_group_class(f'{tests}.greenland', 'Greenland')
+        self.add_test_group_class(f'{tests}.humboldt', 'Humboldt')
+        self.add_test_group_class(f'{tests}.hydro_radial', 'HydroRadial')
+        self.add_test_group_class(f'{tests}.ismip6_forcing', 'Ismip6Forcing')
+        self.add_test_group_class(f'{tests}.ismip6_run', 'Ismip6Run')
+        self.add_test_group_class(f'{tests}.kangerlussuaq', 'Kangerlussuaq')
+        self.add_test_group_class(f'{tests}.koge_bugt_s', 'KogeBugtS')
+        self.add_test_group_class(f'{tests}.mismipplus', 'MISMIPplus')
+        self.add_test_group_class(f'{tests}.thwaites', 'Thwaites')
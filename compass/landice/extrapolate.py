@@ -1,6 +1,7 @@
 import sys
 
 import numpy as np
+import scipy.sparse
 from netCDF4 import Dataset
 
 
@@ -36,6 +37,14 @@ def extrapolate_variable(nc_file, var_name, extrap_method, set_value=None):
     xCell = dataset.variables["yCell"][:]
     yCell = dataset.variables["xCell"][:]
 
+    neighbors = np.asarray(cellsOnCell) - 1
+    maxEdges = neighbors.shape[1]
+    edgeMask = (np.arange(maxEdges) <
+                np.asarray(nEdgesOnCell)[:, np.newaxis])
+    # Important: ignore the phantom "neighbors" that are off the edge of the
+    # mesh (0 values in cellsOnCell)
+    validNeighbors = np.logical_and(edgeMask, neighbors >= 0)
+
     # Define region of good data to extrapolate from.
     # Different methods for different variables
     if var_name in ["effectivePressure", "beta", "muFriction"]:
@@ -44,12 +53,9 @@ def extrapolate_variable(nc_file, var_name, extrap_method, set_value=None):
         extrap_method == "min"
 
         # grow mask by one cell oceanward of GL
-        for iCell in range(nCells):
-            for n in range(nEdgesOnCell[iCell]):
-                jCell = cellsOnCell[iCell, n] - 1
-                if (groundedMask[jCell] == 1):
-                    keepCellMask[iCell] = 1
-                    continue
+        groundedNeighbors = np.logical_and(
+            edgeMask, np.asarray(groundedMask)[neighbors] == 1)
+        keepCellMask[np.any(groundedNeighbors, axis=1)] = 1
         # ensure zero muFriction does not get extrapolated
         keepCellMask *= (varValue > 0)
     elif var_name in ["floatingBasalMassBal"]:
@@ -59,66 +65,81 @@ def extrapolate_variable(nc_file, var_name, extrap_method, set_value=None):
     else:
         keepCellMask = (thickness > 0.0)
 
-    # make a copy to edit that will be used later
-    keepCellMaskNew = np.copy(keepCellMask)
+    keepCellMask = np.array(keepCellMask, dtype=bool)
 
-    # recursive extrapolation steps:
-    # 1) find cell A with mask = 0
-    # 2) find how many surrounding cells have nonzero mask, and their
-    #    indices (this will give us the cells from upstream)
-    # 3) use the values for nonzero mask upstream cells to extrapolate
-    #    the value for cell A
-    # 4) change the mask for A from 0 to 1
-    # 5) Update mask
-    # 6) go to step 1)
+    # extrapolation proceeds one "frontier" at a time:
+    # 1) find the cells with mask = 0 that have at least one neighbor with
+    #    nonzero mask (the frontier)
+    # 2) use the values of the neighbors with nonzero mask to extrapolate
+    #    the values for all cells in the frontier at once
+    # 3) change the mask for the frontier from 0 to 1
+    # 4) the next frontier is made up of the cells with mask = 0 that are
+    #    adjacent to the current frontier
+    # 5) go to step 2)
 
     print("Start {} extrapolation using {} method".format(var_name,
                                                           extrap_method))
     if extrap_method == 'value':
         varValue[np.where(np.logical_not(keepCellMask))] = float(set_value)
     else:
+        xCell = np.asarray(xCell)
+        yCell = np.asarray(yCell)
+
+        # a sparse matrix whose row j has the indices of the cells that have
+        # cell j as a neighbor
+        cells, edges = np.nonzero(validNeighbors)
+        cellsAdjacentTo = scipy.sparse.csr_matrix(
+            (np.ones(len(cells), dtype=np.int8),
+             (neighbors[cells, edges], cells)),
+            shape=(nCells, nCells))
+
+        hasKeepNeighbor = np.any(
+            np.logical_and(validNeighbors, keepCellMask[neighbors]), axis=1)
+        frontier = np.nonzero(np.logical_and(np.logical_not(keepCellMask),
+                                             hasKeepNeighbor))[0]
+
         while np.count_nonzero(keepCellMask) != nCells:
-            keepCellMask = np.copy(keepCellMaskNew)
-            searchCells = np.where(keepCellMask == 0)[0]
-            varValueOld = np.copy(varValue)
-
-            for iCell in searchCells:
-                neighborcellID = cellsOnCell[iCell, :nEdgesOnCell[iCell]] - 1
-                # Important: ignore the phantom "neighbors" that are off
-                # the edge of the mesh (0 values in cellsOnCell)
-                neighborcellID = neighborcellID[neighborcellID >= 0]
-
-                mask_for_idx = keepCellMask[neighborcellID]  # active cellmask
-                mask_nonzero_idx, = np.nonzero(mask_for_idx)
-
-                # id for nonzero beta cells
-                nonzero_id = neighborcellID[mask_nonzero_idx]
-                nonzero_num = np.count_nonzero(mask_for_idx)
-
-                assert len(nonzero_id) == nonzero_num
-
-                if nonzero_num > 0:
-                    x_i = xCell[iCell]
-                    y_i = yCell[iCell]
-                    x_adj = xCell[nonzero_id]
-                    y_adj = yCell[nonzero_id]
-                    var_adj = varValueOld[nonzero_id]
-                    if extrap_method == 'idw':
-                        ds = np.sqrt((x_i - x_adj)**2 + (y_i - y_adj)**2)
-                        assert np.count_nonzero(ds) == len(ds)
-                        var_interp = 1.0 / sum(1.0 / ds) * \
-                            sum(1.0 / ds * var_adj)
-                        varValue[iCell] = var_interp
-                    elif extrap_method == 'min':
-                        varValue[iCell] = np.min(var_adj)
-                    else:
-                        sys.exit("ERROR: invalid extrapolation scheme! "
-                                 "Set option m as idw or min!")
-
-                    keepCellMaskNew[iCell] = 1
-
-            # print ("{0:8d} cells left for extrapolation in total {1:8d} "
-            # "cells".format(nCells-np.count_nonzero(keepCellMask),  nCells))
+            if len(frontier) == 0:
+                print("WARNING: {} cells could not be reached by "
+                      "extrapolation".format(
+                          nCells - np.count_nonzero(keepCellMask)))
+                break
+
+            frontierNeighbors = neighbors[frontier, :]
+            useNeighbor = np.logical_and(validNeighbors[frontier, :],
+                                         keepCellMask[frontierNeighbors])
+            var_adj = varValue[frontierNeighbors]
+
+            if extrap_method == 'idw':
+                dx = xCell[frontier, np.newaxis] - xCell[frontierNeighbors]
+                dy = yCell[frontier, np.newaxis] - yCell[frontierNeighbors]
+                ds = np.sqrt(dx**2 + dy**2)
+                assert np.count_nonzero(ds[useNeighbor]) == \
+                    np.count_nonzero(useNeighbor)
+                ds = np.where(useNeighbor, ds, 1.0)
+                # sum over neighbors in order so results are identical to
+                # extrapolating one cell at a time
+                sumWeights = np.zeros(len(frontier))
+                sumWeightedVar = np.zeros(len(frontier))
+                for n in range(maxEdges):
+                    use = useNeighbor[:, n]
+                    weights = 1.0 / ds[:, n]
+                    sumWeights[use] += weights[use]
+                    sumWeightedVar[use] += weights[use] * var_adj[use, n]
+                var_interp = 1.0 / sumWeights * sumWeightedVar
+            elif extrap_method == 'min':
+                var_interp = np.min(np.where(useNeighbor, var_adj, np.inf),
+                                    axis=1)
+            else:
+                sys.exit("ERROR: invalid extrapolation scheme! "
+                         "Set option m as idw or min!")
+
+            varValue[frontier] = var_interp
+            keepCellMask[frontier] = True
+
+            # the cells with mask = 0 adjacent to the frontier
+            candidates = np.unique(cellsAdjacentTo[frontier, :].indices)
+            frontier = candidates[np.logical_not(keepCellMask[candidates])]
 
     # Put updated array back into file
     dataset.variables[var_name][0, :] = varValue
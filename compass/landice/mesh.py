@@ -3,6 +3,7 @@ import time
 import jigsawpy
 import mpas_tools.io
 import numpy as np
+import scipy.ndimage
 import xarray
 from geometric_features import FeatureCollection, GeometricFeatures
 from mpas_tools.io import write_netcdf
@@ -12,13 +13,13 @@ from mpas_tools.mesh.creation import build_planar_mesh
 from netCDF4 import Dataset
 
 
-def gridded_flood_fill(field, iStart=None, jStart=None):
+def gridded_flood_fill(field, iStart=None, jStart=None, connectivity=4,
+                       method='queue'):
     """
     Generic flood-fill routine to create mask of connected elements
     in the desired input array (field) from a gridded dataset. This
     is generally used to remove glaciers and ice-fields that are not
-    connected to the ice sheet. Note that there may be more efficient
-    algorithms.
+    connected to the ice sheet.
 
     Parameters
     ----------
@@ -26,14 +27,27 @@ def gridded_flood_fill(field, iStart=None, jStart=None):
         Array from gridded dataset to use for flood-fill.
         Usually ice thickness.
 
-    iStart : int
-        x index from which to start flood fill for field.
+    iStart : int or list of int
+        x index (or indices) from which to start flood fill for field.
         Defaults to the center x coordinate.
 
-    jStart : int
-        y index from which to start flood fill.
+    jStart : int or list of int
+        y index (or indices) from which to start flood fill.
         Defaults to the center y coordinate.
 
+    connectivity : {4, 8}, optional
+        Whether grid cells are connected only to their 4 nearest neighbors
+        or also to the 4 diagonal neighbors
+
+    method : {'queue', 'label'}, optional
+        With ``'queue'``, cells are searched one "generation" of neighbors at
+        a time, in the same order as the original flood-fill algorithm,
+        including its treatment of the edges of the grid (neighbors past the
+        last index are clipped to the last index and those before the first
+        index wrap around to the last index).  With ``'label'``, connected
+        components are found with :py:func:`scipy.ndimage.label`, which is
+        faster but treats the edges of the grid as boundaries.
+
     Returns
     -------
     flood_mask : numpy.ndarray
@@ -43,43 +57,84 @@ def gridded_flood_fill(field, iStart=None, jStart=None):
     """
 
     sz = field.shape
-    searched_mask = np.zeros(sz)
-    flood_mask = np.zeros(sz)
     if iStart is None and jStart is None:
         iStart = sz[0] // 2
         jStart = sz[1] // 2
+    iStart = np.atleast_1d(iStart).astype(int)
+    jStart = np.atleast_1d(jStart).astype(int)
+
+    if connectivity not in [4, 8]:
+        raise ValueError(f'Unexpected connectivity {connectivity}')
+
+    if method == 'queue':
+        flood_mask = _flood_fill_queue(field, iStart, jStart, connectivity)
+    elif method == 'label':
+        flood_mask = _flood_fill_label(field, iStart, jStart, connectivity)
+    else:
+        raise ValueError(f'Unexpected flood-fill method {method}')
+
+    return flood_mask
+
+
+def _flood_fill_queue(field, iStart, jStart, connectivity):
+    """
+    Flood fill one generation of neighbors at a time, with each cell added to
+    the search queue at most once (apart from the starting cells)
+    """
+    sz = field.shape
+    searched_mask = np.zeros(sz, dtype=bool)
+    flood_mask = np.zeros(sz)
     flood_mask[iStart, jStart] = 1
 
-    neighbors = np.array([[1, 0], [-1, 0], [0, 1], [0, -1]])
-
-    lastSearchList = np.ravel_multi_index([[iStart], [jStart]],
-                                          sz, order='F')
-
-    cnt = 0
-    while len(lastSearchList) > 0:
-        cnt += 1
-        newSearchList = np.array([], dtype='i')
-
-        for iii in range(len(lastSearchList)):
-            [i, j] = np.unravel_index(lastSearchList[iii], sz, order='F')
-            # search neighbors
-            for n in neighbors:
-                ii = min(i + n[0], sz[0] - 1)  # don't go out of bounds
-                jj = min(j + n[1], sz[1] - 1)  # subscripts to neighbor
-                # only consider unsearched neighbors
-                if searched_mask[ii, jj] == 0:
-                    searched_mask[ii, jj] = 1  # mark as searched
-
-                    if field[ii, jj] > 0.0:
-                        flood_mask[ii, jj] = 1  # mark as ice
-                        # add to list of newly found  cells
-                        newSearchList = np.append(newSearchList,
-                                                  np.ravel_multi_index(
-                                                      [[ii], [jj]], sz,
-                                                      mode='clip',
-                                                      order='F')[0])
-        lastSearchList = newSearchList
+    neighbors = [[1, 0], [-1, 0], [0, 1], [0, -1]]
+    if connectivity == 8:
+        neighbors.extend([[1, 1], [1, -1], [-1, 1], [-1, -1]])
+    neighbors = np.array(neighbors)
+
+    lastSearchI = iStart
+    lastSearchJ = jStart
+    while len(lastSearchI) > 0:
+        # the neighbors of each cell in the last search list, in the order
+        # they are searched
+        ii = np.minimum(lastSearchI[:, np.newaxis] + neighbors[:, 0],
+                        sz[0] - 1).ravel()
+        jj = np.minimum(lastSearchJ[:, np.newaxis] + neighbors[:, 1],
+                        sz[1] - 1).ravel()
+        # a neighbor index of -1 refers to the last index
+        iWrap = np.mod(ii, sz[0])
+        jWrap = np.mod(jj, sz[1])
+
+        # only consider unsearched neighbors the first time they are found
+        _, first = np.unique(iWrap * sz[1] + jWrap, return_index=True)
+        first = np.sort(first)
+        first = first[np.logical_not(searched_mask[iWrap[first],
+                                                   jWrap[first]])]
+        iWrap = iWrap[first]
+        jWrap = jWrap[first]
+        searched_mask[iWrap, jWrap] = True
+
+        # mark as ice and add to list of newly found cells
+        isIce = field[iWrap, jWrap] > 0.0
+        flood_mask[iWrap[isIce], jWrap[isIce]] = 1
+        lastSearchI = np.maximum(ii[first][isIce], 0)
+        lastSearchJ = np.maximum(jj[first][isIce], 0)
+
+    return flood_mask
+
 
+def _flood_fill_label(field, iStart, jStart, connectivity):
+    """
+    Flood fill by labeling connected components
+    """
+    if connectivity == 4:
+        structure = scipy.ndimage.generate_binary_structure(2, 1)
+    else:
+        structure = scipy.ndimage.generate_binary_structure(2, 2)
+    # the search starts from the starting cells regardless of their values
+    in_mask = field > 0.0
+    in_mask[iStart, jStart] = True
+    labels, _ = scipy.ndimage.label(in_mask, structure=structure)
+    flood_mask = np.isin(labels, labels[iStart, jStart]).astype(float)
     return flood_mask
 
 
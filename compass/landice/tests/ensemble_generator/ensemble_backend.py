@@ -0,0 +1,386 @@
+import getpass
+import json
+import os
+import subprocess
+import time
+
+from compass.job import write_job_script
+
+# the possible states of an ensemble member in the manifest
+PENDING = 'pending'
+SUBMITTED = 'submitted'
+RUNNING = 'running'
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+# the file in each member's work directory where the member records its state
+STATUS_FILENAME = 'ensemble_status'
+
+
+def get_backend(config, work_dir, logger):
+    """
+    Get the backend for running ensemble members given by the ``backend``
+    config option in the ``ensemble`` section
+
+    Parameters
+    ----------
+    config : compass.config.CompassConfigParser
+        Configuration options for the ensemble
+
+    work_dir : str
+        The work directory of the ensemble manager, where job scripts and
+        the member run script are written
+
+    logger : logging.Logger
+        A logger for output
+
+    Returns
+    -------
+    backend : compass.landice.tests.ensemble_generator.ensemble_backend.EnsembleBackend
+        The backend for running ensemble members
+    """  # noqa: E501
+    backend = config.get('ensemble', 'backend')
+    backends = {'slurm': SlurmBackend,
+                'slurm_array': SlurmArrayBackend,
+                'local': LocalBackend}
+    if backend not in backends:
+        raise ValueError(f'Unknown ensemble backend {backend}, expected one '
+                         f'of: {", ".join(backends)}')
+    return backends[backend](config, work_dir, logger)
+
+
+class EnsembleBackend:
+    """
+    A base class for backends that run ensemble members.  Each backend
+    implements two methods:
+
+    ``submit(members)`` submits (or runs) the ensemble members given by
+    their manifest entries and returns a dictionary with the job ID of each
+    member.
+
+    ``get_queued_jobs()`` returns a set with the IDs of jobs that are
+    pending or running.
+
+    Attributes
+    ----------
+    config : compass.config.CompassConfigParser
+        Configuration options for the ensemble
+
+    work_dir : str
+        The work directory of the ensemble manager
+
+    logger : logging.Logger
+        A logger for output
+
+    member_script : str
+        The script that runs a single member and records its state
+
+    waits_for_members : bool
+        Whether ``submit()`` returns only after the members have finished
+    """
+    waits_for_members = False
+
+    def __init__(self, config, work_dir, logger):
+        """
+        Create the backend
+
+        Parameters
+        ----------
+        config : compass.config.CompassConfigParser
+            Configuration options for the ensemble
+
+        work_dir : str
+            The work directory of the ensemble manager
+
+        logger : logging.Logger
+            A logger for output
+        """
+        self.config = config
+        self.work_dir = work_dir
+        self.logger = logger
+        self.member_script = os.path.join(work_dir, 'run_member.sh')
+        _write_member_script(self.member_script,
+                             config.get('ensemble', 'member_command'))
+
+
+class SlurmBackend(EnsembleBackend):
+    """
+    A backend that submits ensemble members as Slurm jobs, packing
+    ``members_per_job`` members into each job
+    """
+    def submit(self, members):
+        """
+        Submit ensemble members as Slurm jobs
+
+        Parameters
+        ----------
+        members : dict
+            The manifest entries of the members to submit
+
+        Returns
+        -------
+        job_ids : dict
+            The job ID of each member
+        """
+        members_per_job = self.config.getint('ensemble', 'members_per_job')
+        names = list(members)
+        job_ids = dict()
+        for start in range(0, len(names), members_per_job):
+            job_names = names[start:start + members_per_job]
+            commands = [f'bash {self.member_script} '
+                        f'{members[name]["work_dir"]} &'
+                        for name in job_names]
+            commands.append('wait')
+            script = self._write_job_script(job_names[0], len(job_names),
+                                            '\n'.join(commands))
+            job_id = self._sbatch([script])
+            self.logger.info(f'Submitted {", ".join(job_names)} as job '
+                             f'{job_id}.')
+            for name in job_names:
+                job_ids[name] = job_id
+        return job_ids
+
+    def get_queued_jobs(self):
+        """
+        Get the IDs of this user's jobs that are pending or running in the
+        Slurm queue
+
+        Returns
+        -------
+        job_ids : set of str
+            The job IDs (without array task indices)
+        """
+        output = subprocess.check_output(
+            ['squeue', '-h', '-u', getpass.getuser(), '-o', '%F'])
+        return set(output.decode('utf-8').split())
+
+    def _write_job_script(self, name, member_count, run_command):
+        """
+        Write a job script for the given number of members
+        """
+        config = self.config
+        machine = config.get('deploy', 'machine')
+        ntasks = config.getint('ensemble', 'ntasks')
+        config.set('job', 'job_name', f'uq_{name}')
+        write_job_script(config, machine,
+                         target_cores=member_count * ntasks,
+                         min_cores=member_count * ntasks,
+                         work_dir=self.work_dir, suite=name,
+                         run_command=run_command)
+        return os.path.join(self.work_dir, f'job_script.{name}.sh')
+
+    def _sbatch(self, args):
+        """
+        Submit a job script and return the job ID
+        """
+        output = subprocess.check_output(['sbatch', '--parsable'] + args,
+                                         cwd=self.work_dir)
+        # the output is "job_id" or "job_id;cluster"
+        return output.decode('utf-8').strip().split(';')[0]
+
+
+class SlurmArrayBackend(SlurmBackend):
+    """
+    A backend that submits ensemble members as tasks of a Slurm array job,
+    running at most ``max_concurrent`` members at a time
+    """
+    def submit(self, members):
+        """
+        Submit ensemble members as a Slurm array job
+
+        Parameters
+        ----------
+        members : dict
+            The manifest entries of the members to submit
+
+        Returns
+        -------
+        job_ids : dict
+            The job ID of each member
+        """
+        names = list(members)
+        work_dirs = ' '.join(members[name]['work_dir'] for name in names)
+        run_command = f'work_dirs=({work_dirs})\n' \
+                      f'bash {self.member_script} ' \
+                      f'${{work_dirs[$SLURM_ARRAY_TASK_ID]}}'
+        script = self._write_job_script(names[0], 1, run_command)
+        array = f'0-{len(names) - 1}'
+        max_concurrent = self.config.getint('ensemble', 'max_concurrent')
+        if max_concurrent > 0:
+            array = f'{array}%{max_concurrent}'
+        job_id = self._sbatch([f'--array={array}', script])
+        self.logger.info(f'Submitted {len(names)} members as array job '
+                         f'{job_id}.')
+        return {name: job_id for name in names}
+
+
+class LocalBackend(EnsembleBackend):
+    """
+    A backend that runs ensemble members as local processes, at most
+    ``max_concurrent`` at a time, and waits for them to finish.  This stands
+    in for Slurm, e.g. for testing the ensemble manager.
+    """
+    waits_for_members = True
+
+    def submit(self, members):
+        """
+        Run ensemble members as local processes
+
+        Parameters
+        ----------
+        members : dict
+            The manifest entries of the members to run
+
+        Returns
+        -------
+        job_ids : dict
+            The job ID of each member, ``local.<pid>``
+        """
+        max_concurrent = self.config.getint('ensemble', 'max_concurrent')
+        if max_concurrent <= 0:
+            max_concurrent = len(members)
+        pending = list(members)
+        running = dict()
+        job_ids = dict()
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < max_concurrent:
+                name = pending.pop(0)
+                work_dir = members[name]['work_dir']
+                with open(os.path.join(work_dir, 'ensemble_member.log'),
+                          'w') as log_file:
+                    process = subprocess.Popen(
+                        ['bash', self.member_script, work_dir],
+                        stdout=log_file, stderr=subprocess.STDOUT)
+                running[name] = process
+                job_ids[name] = f'local.{process.pid}'
+                self.logger.info(f'Started {name} as process {process.pid}.')
+            time.sleep(0.1)
+            for name, process in list(running.items()):
+                if process.poll() is not None:
+                    self.logger.info(f'{name} finished with exit code '
+                                     f'{process.returncode}.')
+                    running.pop(name)
+        return job_ids
+
+    def get_queued_jobs(self):
+        """
+        Local members are finished by the time ``submit()`` returns, so no
+        jobs are ever queued
+
+        Returns
+        -------
+        job_ids : set of str
+            An empty set
+        """
+        return set()
+
+
+def read_manifest(filename):
+    """
+    Read the manifest of ensemble members
+
+    Parameters
+    ----------
+    filename : str
+        The manifest file
+
+    Returns
+    -------
+    manifest : dict
+        The entry for each member, with the member's ``work_dir``, ``state``,
+        ``job_id``, number of ``attempts`` and ``submit_time``.  An empty
+        dictionary if the manifest doesn't exist yet.
+    """
+    if not os.path.exists(filename):
+        return dict()
+    with open(filename) as handle:
+        return json.load(handle)
+
+
+def write_manifest(filename, manifest):
+    """
+    Write the manifest of ensemble members, replacing the old one only once
+    the new one has been written completely
+
+    Parameters
+    ----------
+    filename : str
+        The manifest file
+
+    manifest : dict
+        The entry for each member
+    """
+    temp_filename = f'{filename}.tmp'
+    with open(temp_filename, 'w') as handle:
+        json.dump(manifest, handle, indent=4)
+    os.replace(temp_filename, filename)
+
+
+def update_member_states(manifest, queued_jobs):
+    """
+    Update the state of each member in the manifest from the state it has
+    recorded in its work directory and from the jobs still in the queue
+
+    Parameters
+    ----------
+    manifest : dict
+        The entry for each member
+
+    queued_jobs : set of str
+        The IDs of jobs that are pending or running
+    """
+    for entry in manifest.values():
+        state = entry['state']
+        if state in [PENDING, COMPLETE]:
+            continue
+        status = read_member_status(entry['work_dir'])
+        queued = entry['job_id'] in queued_jobs
+        if status is not None:
+            state = status
+            if state == RUNNING and not queued:
+                # the job ended (e.g. timed out) before the member did
+                state = FAILED
+        elif not queued:
+            # the job left the queue without starting the member
+            state = PENDING
+        entry['state'] = state
+
+
+def read_member_status(work_dir):
+    """
+    Read the state a member has recorded in its work directory
+
+    Parameters
+    ----------
+    work_dir : str
+        The work directory of the member
+
+    Returns
+    -------
+    status : str or None
+        ``running``, ``complete`` or ``failed``, or ``None`` if the member
+        has not started
+    """
+    filename = os.path.join(work_dir, STATUS_FILENAME)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as handle:
+        return handle.read().strip()
+
+
+def _write_member_script(filename, member_command):
+    """
+    Write a script that runs a member in the work directory given as its
+    argument, recording whether it is running, complete or failed
+    """
+    text = f'#!/bin/bash\n' \
+           f'cd "$1" || exit 1\n' \
+           f'echo {RUNNING} > {STATUS_FILENAME}\n' \
+           f'if {member_command}; then\n' \
+           f'    echo {COMPLETE} > {STATUS_FILENAME}\n' \
+           f'else\n' \
+           f'    echo {FAILED} > {STATUS_FILENAME}\n' \
+           f'    exit 1\n' \
+           f'fi\n'
+    with open(filename, 'w') as handle:
+        handle.write(text)
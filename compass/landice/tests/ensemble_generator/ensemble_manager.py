@@ -1,11 +1,25 @@
 import os
+import time
 from importlib.resources import path
 
-from mpas_tools.logging import check_call
-
 from compass.io import symlink
+from compass.landice.tests.ensemble_generator.ensemble_backend import (
+    COMPLETE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    STATUS_FILENAME,
+    SUBMITTED,
+    get_backend,
+    read_manifest,
+    update_member_states,
+    write_manifest,
+)
 from compass.step import Step
 
+# the manifest of ensemble members in the ensemble manager's work directory
+MANIFEST_FILENAME = 'ensemble_manifest.json'
+
 
 class EnsembleManager(Step):
     """
@@ -42,29 +56,94 @@ class EnsembleManager(Step):
                   'plot_ensemble.py') as target:
             symlink(str(target), f'{self.test_case.work_dir}/plot_ensemble.py')
 
+        # The ensemble manager writes its job scripts in its own work
+        # directory, so it needs the script for loading the compass conda env.
+        if 'LOAD_COMPASS_ENV' in os.environ:
+            script_filename = os.environ['LOAD_COMPASS_ENV']
+            symlink(script_filename, os.path.join(self.work_dir,
+                                                  'load_compass_env.sh'))
+
     def run(self):
         """
         Use the ensemble manager to manage and launch jobs for each run
         Each ensemble member is a step of the test case.
-        The ensemble manager submits a job script for each run so that they
-        are run in parallel through SLURM.
-        Eventually we want this function to handle restarts.
+
+        The state of each member is recorded in the manifest
+        ``ensemble_manifest.json``.  Each time the ensemble manager runs, it
+        updates the state of every member in the manifest and submits
+        members that have not been submitted yet, whose jobs left the queue
+        without running them and (if ``resubmit_failed = True``) that
+        failed.  Members that have already been submitted ``max_attempts``
+        times are not submitted again.  Members are submitted with the
+        backend given by the ``backend`` config option.
         """
         logger = self.logger
+        config = self.config
+        manifest_filename = os.path.join(self.work_dir, MANIFEST_FILENAME)
+
+        # Add any runs (steps) that aren't in the manifest yet
+        manifest = read_manifest(manifest_filename)
+        for run, runStep in self.test_case.steps.items():
+            if run != self.name and run not in manifest:
+                manifest[run] = dict(work_dir=runStep.work_dir,
+                                     state=PENDING, job_id=None, attempts=0,
+                                     submit_time=None)
+
+        backend = get_backend(config, self.work_dir, logger)
+        update_member_states(manifest, backend.get_queued_jobs())
 
-        # Determine list of runs (steps) to loop over
-        runs = list()
-        for step in self.test_case.steps:
-            if step != self.name:  # Ignore the step that is the run manager
-                runs.append(step)
-
-        # Now loop over runs and process each
-        for run in runs:
-            # Get step object from 'steps' dictionary
-            runStep = self.test_case.steps[run]
-            os.chdir(runStep.work_dir)
-            # TODO: assess if this run is unrun, partially run, or complete,
-            # and adjust accordingly
-            check_call(['sbatch', 'job_script.sh'], logger)
-            logger.info(f'Run {run} submitted.')
-        logger.info('All runs submitted.')
+        states_to_submit = [PENDING]
+        if config.getboolean('ensemble', 'resubmit_failed'):
+            states_to_submit.append(FAILED)
+        max_attempts = config.getint('ensemble', 'max_attempts')
+        members = dict()
+        exhausted = list()
+        for run, entry in manifest.items():
+            if entry['state'] not in states_to_submit:
+                continue
+            if 0 < max_attempts <= entry['attempts']:
+                exhausted.append(run)
+            else:
+                members[run] = entry
+
+        if len(members) > 0:
+            for entry in members.values():
+                status_filename = os.path.join(entry['work_dir'],
+                                               STATUS_FILENAME)
+                if os.path.exists(status_filename):
+                    os.remove(status_filename)
+            job_ids = backend.submit(members)
+            submit_time = time.time()
+            for run, entry in members.items():
+                entry['state'] = SUBMITTED
+                entry['job_id'] = job_ids[run]
+                entry['attempts'] += 1
+                entry['submit_time'] = submit_time
+            if backend.waits_for_members:
+                update_member_states(manifest, backend.get_queued_jobs())
+        write_manifest(manifest_filename, manifest)
+
+        _log_summary(logger, manifest, submitted=list(members),
+                     exhausted=exhausted)
+
+
+def _log_summary(logger, manifest, submitted, exhausted):
+    """
+    Log the number of members in each state, the members that failed and
+    those that won't be resubmitted because they have reached the maximum
+    number of attempts
+    """
+    logger.info(f'Submitted {len(submitted)} run(s).')
+    counts = dict()
+    for entry in manifest.values():
+        counts[entry['state']] = counts.get(entry['state'], 0) + 1
+    for state in [PENDING, SUBMITTED, RUNNING, COMPLETE, FAILED]:
+        if state in counts:
+            logger.info(f'  {state}: {counts[state]}')
+    failed = [run for run, entry in manifest.items()
+              if entry['state'] == FAILED]
+    if len(failed) > 0:
+        logger.info(f'Failed runs: {", ".join(failed)}')
+    if len(exhausted) > 0:
+        logger.info(f'Runs not resubmitted after the maximum number of '
+                    f'attempts: {", ".join(exhausted)}')
@@ -0,0 +1,264 @@
+import configparser
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+# physical constants
+rhoi = 910.0
+rhosw = 1028.0
+
+# the parameters that may be recorded in each run's run_info.cfg
+PARAMETERS = ['basal_fric_exp', 'von_mises_threshold', 'calv_spd_limit',
+              'mu_scale', 'stiff_scale', 'gamma0', 'meltflux', 'deltaT']
+
+# the time series derived from each run's globalStats.nc
+TIME_SERIES = ['years', 'SLR', 'totalArea', 'floatingArea', 'groundedArea',
+               'groundingLineFlux', 'basalMassBal']
+
+# the signature of a run whose outputs couldn't be read (e.g. because they
+# were being written), which never matches the files so the run is read again
+UNREAD_SIGNATURE = [-2, -2, -2, -2]
+
+
+def aggregate_results(ensemble_dir='.',
+                      results_filename='ensemble_results.nc',
+                      target_year=100.0, workers=None):
+    """
+    Gather the parameter values and quantities of interest (QOIs) from all
+    runs in an ensemble into a table, reading only the outputs of runs that
+    are new or have changed since the table was last written
+
+    Parameters
+    ----------
+    ensemble_dir : str, optional
+        The work directory of the ensemble test case, containing the run
+        directories
+
+    results_filename : str, optional
+        The table of results (relative to ``ensemble_dir``), read to find
+        the runs that have not changed and then updated
+
+    target_year : float, optional
+        The model year (from the start) at which QOIs are computed
+
+    workers : int, optional
+        The number of processes used to read run outputs in parallel.  By
+        default, the number of cores.
+
+    Returns
+    -------
+    ds : xarray.Dataset
+        The table of results with a ``run`` dimension (with a ``run_num``
+        coordinate), holding each parameter (NaN if the run doesn't vary it),
+        the time series of each run (NaN-padded along the ``time``
+        dimension) and the QOIs at ``target_year`` (NaN if a run hasn't
+        reached it)
+    """
+    results_filename = os.path.join(ensemble_dir, results_filename)
+    run_dirs = sorted(path for path in
+                      glob.glob(os.path.join(ensemble_dir, 'run*'))
+                      if os.path.isdir(path))
+    run_names = [os.path.basename(path) for path in run_dirs]
+
+    cached = dict()
+    cached_target_year = None
+    if os.path.exists(results_filename):
+        with xr.open_dataset(results_filename) as ds_cached:
+            ds_cached.load()
+        cached_target_year = ds_cached.attrs['target_year']
+        for index, name in enumerate(ds_cached.run_name.values):
+            cached[str(name)] = _get_cached_run(ds_cached, index)
+
+    runs = dict()
+    to_read = list()
+    for name, run_dir in zip(run_names, run_dirs):
+        signature = _get_signature(run_dir)
+        if name in cached and \
+                cached[name]['signature'] == signature:
+            runs[name] = cached[name]
+        else:
+            to_read.append(run_dir)
+
+    if len(to_read) > 0:
+        print(f'Reading {len(to_read)} new or changed run(s) of '
+              f'{len(run_dirs)}')
+        if workers is None:
+            workers = os.cpu_count()
+        workers = min(workers, len(to_read))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_read_run, to_read))
+        else:
+            results = [_read_run(run_dir) for run_dir in to_read]
+        for run_dir, run in zip(to_read, results):
+            runs[os.path.basename(run_dir)] = run
+
+    ds = _build_table(run_names, runs, target_year)
+
+    if len(to_read) > 0 or set(cached) != set(run_names) or \
+            cached_target_year != target_year:
+        temp_filename = f'{results_filename}.tmp'
+        ds.to_netcdf(temp_filename)
+        os.replace(temp_filename, results_filename)
+
+    return ds
+
+
+def _get_signature(run_dir):
+    """
+    Get the modification times and sizes of the files a run's results are
+    read from, which change whenever the run writes more output
+    """
+    signature = list()
+    for filename in ['run_info.cfg', os.path.join('output', 'globalStats.nc')]:
+        path = os.path.join(run_dir, filename)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.extend([stat.st_mtime_ns, stat.st_size])
+        else:
+            signature.extend([-1, -1])
+    return signature
+
+
+def _read_run(run_dir):
+    """
+    Read the parameter values and time series of a single run.  If they
+    can't be read, the run has no parameter values or time series and is
+    marked to be read again next time.
+    """
+    try:
+        return _read_run_outputs(run_dir)
+    except Exception as e:
+        print(f'Could not read {run_dir}, it will be read again next time: '
+              f'{e}')
+        return dict(signature=list(UNREAD_SIGNATURE),
+                    run_num=int(os.path.basename(run_dir)[3:]),
+                    params=dict(),
+                    series={var: np.zeros(0) for var in TIME_SERIES})
+
+
+def _read_run_outputs(run_dir):
+    """
+    Read the parameter values and time series of a single run, raising an
+    exception if its outputs can't be read
+    """
+    run = dict(signature=_get_signature(run_dir), params=dict())
+
+    run_cfg = configparser.ConfigParser()
+    run_cfg.read(os.path.join(run_dir, 'run_info.cfg'))
+    if 'run_info' in run_cfg:
+        run_info = run_cfg['run_info']
+        run['run_num'] = run_info.getint('run_num')
+        for param in PARAMETERS:
+            if param in run_info:
+                run['params'][param] = run_info.getfloat(param)
+    else:
+        run['run_num'] = int(os.path.basename(run_dir)[3:])
+
+    series = {var: np.zeros(0) for var in TIME_SERIES}
+    fpath = os.path.join(run_dir, 'output', 'globalStats.nc')
+    if os.path.exists(fpath):
+        with netCDF4.Dataset(fpath, 'r') as f:
+            f.set_auto_mask(False)
+            if len(f.dimensions['Time']) == 0:
+                # the run hasn't written any time slices yet
+                run['series'] = series
+                return run
+            VAF = f.variables['volumeAboveFloatation'][:]
+            series['years'] = f.variables['daysSinceStart'][:] / 365.0
+            series['SLR'] = \
+                (VAF[0] - VAF) / 3.62e14 * rhoi / rhosw * 1000.
+            # in km2
+            series['totalArea'] = f.variables['totalIceArea'][:] / 1.0e6
+            series['floatingArea'] = \
+                f.variables['floatingIceArea'][:] / 1.0e6
+            series['groundedArea'] = \
+                f.variables['groundedIceArea'][:] / 1.0e6
+            # in Gt
+            series['groundingLineFlux'] = \
+                f.variables['groundingLineFlux'][:] / 1.0e12
+            series['basalMassBal'] = \
+                f.variables['totalFloatingBasalMassBal'][:] / -1.0e12
+        if len(set(len(values) for values in series.values())) > 1:
+            raise ValueError(f'The time series in {fpath} have different '
+                             f'lengths')
+    run['series'] = series
+    return run
+
+
+def _get_cached_run(ds, index):
+    """
+    Get the parameter values and time series of a run from the table
+    """
+    time_count = int(ds.time_count.values[index])
+    run = dict(signature=[int(value) for value in
+                          ds.signature.values[index, :]],
+               run_num=int(ds.run_num.values[index]),
+               params=dict(),
+               series=dict())
+    for param in PARAMETERS:
+        if param in ds and np.isfinite(ds[param].values[index]):
+            run['params'][param] = float(ds[param].values[index])
+    for var in TIME_SERIES:
+        run['series'][var] = ds[var].values[index, 0:time_count]
+    return run
+
+
+def _build_table(run_names, runs, target_year):
+    """
+    Build the table of results from the parameter values and time series of
+    each run, and compute the QOIs at the target year
+    """
+    nruns = len(run_names)
+    time_counts = np.array([len(runs[name]['series']['years'])
+                            for name in run_names], dtype=int)
+    ntime = max(time_counts.max(initial=0), 1)
+
+    ds = xr.Dataset()
+    ds['run_num'] = ('run', np.array([runs[name]['run_num']
+                                      for name in run_names], dtype=int))
+    ds = ds.set_coords('run_num')
+    ds['run_name'] = ('run', np.array(run_names, dtype=str))
+    ds['signature'] = (('run', 'signature_entry'),
+                       np.array([runs[name]['signature']
+                                 for name in run_names],
+                                dtype=np.int64).reshape(nruns, 4))
+    ds['time_count'] = ('run', time_counts)
+
+    for param in PARAMETERS:
+        values = np.array([runs[name]['params'].get(param, np.nan)
+                           for name in run_names], dtype=float)
+        if np.any(np.isfinite(values)):
+            ds[param] = ('run', values)
+
+    for var in TIME_SERIES:
+        values = np.full((nruns, ntime), np.nan)
+        for index, name in enumerate(run_names):
+            values[index, 0:time_counts[index]] = runs[name]['series'][var]
+        ds[var] = (('run', 'time'), values)
+
+    # the first time index at or after the target year, if any
+    reached = ds.years.values >= target_year
+    has_reached = np.any(reached, axis=1)
+    target_index = np.argmax(reached, axis=1)
+    rows = np.arange(nruns)
+
+    def at_target(var, relative=False):
+        values = ds[var].values[rows, target_index]
+        if relative:
+            values = values - ds[var].values[:, 0]
+        return ('run', np.where(has_reached, values, np.nan))
+
+    ds['target_year'] = at_target('years')
+    ds['SLR_at_target'] = at_target('SLR')
+    ds['totalAreaChange_at_target'] = at_target('totalArea', relative=True)
+    ds['groundedAreaChange_at_target'] = at_target('groundedArea',
+                                                   relative=True)
+    ds['groundingLineFlux_at_target'] = at_target('groundingLineFlux')
+    ds['basalMassBal_at_target'] = at_target('basalMassBal')
+    ds.attrs['target_year'] = target_year
+    return ds
@@ -5,7 +5,11 @@ import os
 from importlib import resources
 from importlib.resources import contents
 
-from compass.mpas_cores import get_mpas_cores
+from compass.mpas_cores import (
+    get_mpas_cores,
+    get_test_cases,
+    get_test_index,
+)
 
 
 def list_cases(test_expr=None, number=None, verbose=False):
@@ -24,59 +28,56 @@ def list_cases(test_expr=None, number=None, verbose=False):
         Whether to print details of each test or just the subdirectories.
         When applied to suites, verbose will list the tests in the suite.
     """
-    mpas_cores = get_mpas_cores()
-
     if number is None:
         print('Testcases:')
 
-    test_cases = []
-    for mpas_core in mpas_cores:
-        for test_group in mpas_core.test_groups.values():
-            for test_case in test_group.test_cases.values():
-                test_cases.append(test_case)
+    # test groups only need to be imported to list the steps of test cases
+    paths = [entry['path'] for entry in get_test_index()]
 
-    for test_number, test_case in enumerate(test_cases):
-        print_number = False
-        print_test = False
+    selected = list()
+    for test_number, path in enumerate(paths):
         if number is not None:
             if number == test_number:
-                print_test = True
-        elif test_expr is None or re.match(test_expr, test_case.path):
-            print_test = True
-            print_number = True
-
-        if print_test:
-            number_string = '{:d}: '.format(test_number).rjust(6)
-            if print_number:
-                prefix = number_string
-            else:
-                prefix = ''
-            if verbose:
-                lines = list()
-                to_print = {'path': test_case.path,
-                            'name': test_case.name,
-                            'MPAS core': test_case.mpas_core.name,
-                            'test group': test_case.test_group.name,
-                            'subdir': test_case.subdir}
-                for key in to_print:
-                    key_string = '{}: '.format(key).ljust(15)
-                    lines.append('{}{}{}'.format(prefix, key_string,
-                                                 to_print[key]))
-                    if print_number:
-                        prefix = '      '
-                lines.append('{}steps:'.format(prefix))
-                for step in test_case.steps.values():
-                    if step.name == step.subdir:
-                        lines.append('{} - {}'.format(prefix, step.name))
-                    else:
-                        lines.append('{} - {}: {}'.format(prefix, step.name,
-                                                          step.subdir))
-                lines.append('')
-                print_string = '\n'.join(lines)
-            else:
-                print_string = '{}{}'.format(prefix, test_case.path)
-
-            print(print_string)
+                selected.append((test_number, path, False))
+        elif test_expr is None or re.match(test_expr, path):
+            selected.append((test_number, path, True))
+
+    if verbose:
+        test_cases = get_test_cases([path for _, path, _ in selected])
+
+    for test_number, path, print_number in selected:
+        number_string = '{:d}: '.format(test_number).rjust(6)
+        if print_number:
+            prefix = number_string
+        else:
+            prefix = ''
+        if verbose:
+            test_case = test_cases[path]
+            lines = list()
+            to_print = {'path': test_case.path,
+                        'name': test_case.name,
+                        'MPAS core': test_case.mpas_core.name,
+                        'test group': test_case.test_group.name,
+                        'subdir': test_case.subdir}
+            for key in to_print:
+                key_string = '{}: '.format(key).ljust(15)
+                lines.append('{}{}{}'.format(prefix, key_string,
+                                             to_print[key]))
+                if print_number:
+                    prefix = '      '
+            lines.append('{}steps:'.format(prefix))
+            for step in test_case.steps.values():
+                if step.name == step.subdir:
+                    lines.append('{} - {}'.format(prefix, step.name))
+                else:
+                    lines.append('{} - {}: {}'.format(prefix, step.name,
+                                                      step.subdir))
+            lines.append('')
+            print_string = '\n'.join(lines)
+        else:
+            print_string = '{}{}'.format(prefix, path)
+
+        print(print_string)
 
 
 def list_machines():
@@ -1,7 +1,12 @@
+import hashlib
 import os
+import shutil
+
+import numpy
 import xarray
 
 from mpas_tools.logging import check_call
+from compass.io import symlink
 from compass.parallel import run_command
 
 
@@ -51,7 +56,8 @@ def run_model(step, update_pio=True, partition_graph=True,
         step.update_namelist_pio(namelist)
 
     if partition_graph:
-        partition(ntasks, config, logger, graph_file=graph_file)
+        partition(ntasks, config, logger, graph_file=graph_file,
+                  base_work_dir=step.base_work_dir)
 
     model = config.get('executables', 'model')
     model_basename = os.path.basename(model)
@@ -60,10 +66,16 @@ def run_model(step, update_pio=True, partition_graph=True,
                 openmp_threads=openmp_threads, config=config, logger=logger)
 
 
-def partition(ntasks, config, logger, graph_file='graph.info'):
+def partition(ntasks, config, logger, graph_file='graph.info',
+              base_work_dir=None):
     """
     Partition the domain for the requested number of tasks
 
+    If the ``partition_cache`` config option in the ``[parallel]`` section is
+    ``True``, partitions are cached in ``partition_cache_dir`` under the
+    SHA-256 checksum of the graph file's contents and the number of tasks,
+    and a cached partition is symlinked rather than being recomputed.
+
     Parameters
     ----------
     ntasks : int
@@ -79,11 +91,44 @@ def partition(ntasks, config, logger, graph_file='graph.info'):
     graph_file : str, optional
         The name of the graph file to partition
 
+    base_work_dir : str, optional
+        The base work directory, used for a relative ``partition_cache_dir``.
+        By default, the current directory.
     """
-    if ntasks > 1:
-        executable = config.get('parallel', 'partition_executable')
-        args = [executable, graph_file, f'{ntasks}']
+    if ntasks <= 1:
+        return
+
+    executable = config.get('parallel', 'partition_executable')
+    part_file = f'{graph_file}.part.{ntasks}'
+    args = [executable, graph_file, f'{ntasks}']
+
+    if not config.has_option('parallel', 'partition_cache') or \
+            not config.getboolean('parallel', 'partition_cache'):
+        check_call(args, logger)
+        return
+
+    cache_dir = config.get('parallel', 'partition_cache_dir')
+    if base_work_dir is not None:
+        cache_dir = os.path.join(base_work_dir, cache_dir)
+    cache_dir = os.path.abspath(
+        os.path.join(cache_dir, _get_file_digest(graph_file)))
+    cached_file = os.path.join(
+        cache_dir, f'{os.path.basename(executable)}.part.{ntasks}')
+
+    if os.path.exists(cached_file):
+        logger.info(f'Using cached partition {cached_file}')
+    else:
+        if os.path.islink(part_file):
+            # a link to a partition that is no longer cached
+            os.remove(part_file)
         check_call(args, logger)
+        os.makedirs(cache_dir, exist_ok=True)
+        # copy to a temporary file first so steps running at the same time
+        # never see a partially written partition
+        temp_file = f'{cached_file}.{os.getpid()}.tmp'
+        shutil.copyfile(part_file, temp_file)
+        os.replace(temp_file, cached_file)
+    symlink(cached_file, part_file)
 
 
 def make_graph_file(mesh_filename, graph_filename='graph.info',
@@ -112,36 +157,92 @@ def make_graph_file(mesh_filename, graph_filename='graph.info',
         nEdgesOnCell = ds.nEdgesOnCell.values
         cellsOnCell = ds.cellsOnCell.values - 1
         if weight_field is not None:
-            if weight_field in ds:
+            if weight_field not in ds:
                 raise ValueError('weight_field {} not found in {}'.format(
                     weight_field, mesh_filename))
             weights = ds[weight_field].values
         else:
             weights = None
 
-    nEdges = 0
-    for i in range(nCells):
-        for j in range(nEdgesOnCell[i]):
-            if cellsOnCell[i][j] != -1:
-                nEdges = nEdges + 1
-
-    nEdges = nEdges/2
+    maxEdges = cellsOnCell.shape[1]
+    # a mask of the valid neighbors of each cell
+    valid = numpy.logical_and(
+        numpy.arange(maxEdges) < nEdgesOnCell[:, numpy.newaxis],
+        cellsOnCell >= 0)
+    neighborCounts = numpy.count_nonzero(valid, axis=1)
+
+    nEdges = numpy.sum(neighborCounts) // 2
+
+    if weights is None:
+        header = '{} {}\n'.format(nCells, nEdges)
+        values = cellsOnCell[valid] + 1
+        rowLengths = neighborCounts
+    else:
+        header = '{} {} 010\n'.format(nCells, nEdges)
+        # the weight of each cell comes before its neighbors
+        values = numpy.concatenate(
+            (weights.astype(int)[:, numpy.newaxis], cellsOnCell + 1), axis=1)
+        valid = numpy.concatenate(
+            (numpy.ones((nCells, 1), dtype=bool), valid), axis=1)
+        values = values[valid]
+        rowLengths = neighborCounts + 1
+
+    with open(graph_filename, 'wb') as graph:
+        graph.write(header.encode('ascii'))
+        graph.write(_format_rows(values, rowLengths))
+
+
+def _get_file_digest(filename):
+    """
+    Compute the SHA-256 checksum of the contents of a file
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as handle:
+        for data in iter(lambda: handle.read(1024**2), b''):
+            sha.update(data)
+    return sha.hexdigest()
 
-    with open(graph_filename, 'w+') as graph:
-        if weights is None:
-            graph.write('{} {}\n'.format(nCells, nEdges))
 
-            for i in range(nCells):
-                for j in range(0, nEdgesOnCell[i]):
-                    if cellsOnCell[i][j] >= 0:
-                        graph.write('{} '.format(cellsOnCell[i][j]+1))
-                graph.write('\n')
-        else:
-            graph.write('{} {} 010\n'.format(nCells, nEdges))
-
-            for i in range(nCells):
-                graph.write('{} '.format(int(weights[i])))
-                for j in range(0, nEdgesOnCell[i]):
-                    if cellsOnCell[i][j] >= 0:
-                        graph.write('{} '.format(cellsOnCell[i][j] + 1))
-                graph.write('\n')
+def _format_rows(values, row_lengths):
+    """
+    Format rows of integers as text in a single buffer, with each value
+    followed by a space and each row followed by a newline.  This is
+    equivalent to writing each value with ``'{} '.format(value)`` but avoids
+    looping over values in python.
+    """
+    values = numpy.asarray(values, dtype=numpy.int64)
+    row_lengths = numpy.asarray(row_lengths, dtype=numpy.int64)
+    nrows = len(row_lengths)
+
+    negative = values < 0
+    magnitude = numpy.abs(values)
+    digits = numpy.ones(values.shape, dtype=numpy.int64)
+    max_magnitude = magnitude.max(initial=0)
+    power = 10
+    while power <= max_magnitude:
+        digits += magnitude >= power
+        power *= 10
+
+    # each value is followed by a space and each row by a newline
+    token_lengths = digits + negative + 1
+    token_ends = numpy.cumsum(token_lengths)
+    row_indices = numpy.repeat(numpy.arange(nrows), row_lengths)
+    token_starts = token_ends - token_lengths + row_indices
+    row_ends = numpy.concatenate(([0], token_ends))[numpy.cumsum(row_lengths)]
+    row_ends += numpy.arange(nrows)
+
+    buffer = numpy.full(numpy.sum(token_lengths) + nrows, ord(' '),
+                        dtype=numpy.uint8)
+    buffer[row_ends] = ord('\n')
+    buffer[token_starts[negative]] = ord('-')
+
+    # fill in the digits, starting with the ones place
+    last_digits = token_starts + negative + digits - 1
+    power = 1
+    for index in range(digits.max(initial=0)):
+        mask = digits > index
+        buffer[last_digits[mask] - index] = \
+            ord('0') + (magnitude[mask] // power) % 10
+        power *= 10
+
+    return buffer.tobytes()
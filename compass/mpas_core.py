@@ -1,4 +1,4 @@
-from importlib import resources
+from importlib import import_module, resources
 import json
 
 
@@ -13,7 +13,13 @@ class MpasCore:
         the name of the MPAS core
 
     test_groups : dict
-        A dictionary of test groups for the MPAS core with their names as keys
+        A dictionary of test groups for the MPAS core with their names as keys.
+        Accessing this attribute imports and constructs any test groups that
+        have not been loaded yet.
+
+    test_group_classes : list of tuple of str
+        The module and class name of each test group in the MPAS core, in the
+        order they were added
 
     cached_files : dict
         A dictionary that maps from output file names in test cases to cached
@@ -32,8 +38,11 @@ class MpasCore:
         """
         self.name = name
 
-        # test groups are added with add_test_groups()
-        self.test_groups = dict()
+        # test groups are added with add_test_group() or (without importing
+        # them until they are needed) with add_test_group_class()
+        self.test_group_classes = list()
+        self._test_groups = dict()
+        self._loaded_classes = dict()
 
         self.cached_files = dict()
         self._read_cached_files()
@@ -47,7 +56,63 @@ class MpasCore:
         test_group : compass.TestGroup
             the test group to add
         """
-        self.test_groups[test_group.name] = test_group
+        self._test_groups[test_group.name] = test_group
+
+    def add_test_group_class(self, module, class_name):
+        """
+        Add a test group to the MPAS core without importing or constructing it
+        until it is needed
+
+        Parameters
+        ----------
+        module : str
+            the module (package) where the test group is defined, e.g.
+            ``compass.ocean.tests.baroclinic_channel``
+
+        class_name : str
+            the name of the test group's class, e.g. ``BaroclinicChannel``
+        """
+        self.test_group_classes.append((module, class_name))
+
+    def load_test_group(self, module, class_name):
+        """
+        Import and construct a test group that was added with
+        ``add_test_group_class()`` if it hasn't been already
+
+        Parameters
+        ----------
+        module : str
+            the module (package) where the test group is defined
+
+        class_name : str
+            the name of the test group's class
+
+        Returns
+        -------
+        test_group : compass.TestGroup
+            the test group
+        """
+        key = (module, class_name)
+        if key not in self._loaded_classes:
+            test_group_class = getattr(import_module(module), class_name)
+            test_group = test_group_class(mpas_core=self)
+            self.add_test_group(test_group)
+            self._loaded_classes[key] = test_group
+        return self._loaded_classes[key]
+
+    @property
+    def test_groups(self):
+        """
+        All test groups in the MPAS core, in the order they were added
+        """
+        test_groups = dict()
+        for module, class_name in self.test_group_classes:
+            test_group = self.load_test_group(module, class_name)
+            test_groups[test_group.name] = test_group
+        for name, test_group in self._test_groups.items():
+            if name not in test_groups:
+                test_groups[name] = test_group
+        return test_groups
 
     def _read_cached_files(self):
         """ Read in the dictionary of cached files from cached_files.json """
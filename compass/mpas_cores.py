@@ -1,11 +1,24 @@
+import hashlib
+import json
+import os
+
 # import new MPAS cores here
 from compass.landice import Landice
 from compass.ocean import Ocean
 
+# the index of test cases, generated in the compass package when it is missing
+# or out of date
+_index_filename = os.path.join(os.path.dirname(__file__), 'test_index.json')
+
+# the index of test cases once it has been read or generated in this process,
+# keyed by the index file
+_test_indices = dict()
+
 
 def get_mpas_cores():
     """
-    Get a list of all collections of tests for MPAS cores
+    Get a list of all collections of tests for MPAS cores.  Test groups are
+    only imported and constructed when they are needed.
 
     Returns
     -------
@@ -15,3 +28,113 @@ def get_mpas_cores():
     # add new MPAS cores here
     mpas_cores = [Landice(), Ocean()]
     return mpas_cores
+
+
+def get_test_index():
+    """
+    Get the index of all test cases with the MPAS core and test group each
+    belongs to.  The index is read from ``test_index.json`` in the ``compass``
+    package.  If the index is missing or any file in the package has changed
+    since it was generated, all test groups are imported to regenerate it.
+    The index is only read (or generated) once in each process.
+
+    Returns
+    -------
+    test_index : list of dict
+        The ``path``, ``mpas_core``, ``test_group_module`` and
+        ``test_group_class`` of each test case, in the order given by
+        ``compass list``
+    """
+    if _index_filename in _test_indices:
+        return _test_indices[_index_filename]
+
+    fingerprint = _get_package_fingerprint()
+    try:
+        with open(_index_filename) as handle:
+            index = json.load(handle)
+        if index['fingerprint'] == fingerprint:
+            _test_indices[_index_filename] = index['test_cases']
+            return index['test_cases']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    test_index = list()
+    for mpas_core in get_mpas_cores():
+        for module, class_name in mpas_core.test_group_classes:
+            test_group = mpas_core.load_test_group(module, class_name)
+            for test_case in test_group.test_cases.values():
+                test_index.append({'path': test_case.path,
+                                   'mpas_core': mpas_core.name,
+                                   'test_group_module': module,
+                                   'test_group_class': class_name})
+
+    index = {'fingerprint': fingerprint, 'test_cases': test_index}
+    temp_filename = f'{_index_filename}.{os.getpid()}.tmp'
+    try:
+        with open(temp_filename, 'w') as handle:
+            json.dump(index, handle, indent=1)
+        os.replace(temp_filename, _index_filename)
+    except OSError:
+        # the package isn't writable, so the index can't be saved
+        pass
+    _test_indices[_index_filename] = test_index
+    return test_index
+
+
+def get_test_cases(paths):
+    """
+    Get test cases, importing and constructing only the test groups they
+    belong to
+
+    Parameters
+    ----------
+    paths : list of str
+        The relative paths of the test cases
+
+    Returns
+    -------
+    test_cases : dict of compass.TestCase
+        A dictionary of test cases, with their relative paths as keys, in the
+        same order as ``paths``
+    """
+    entries = {entry['path']: entry for entry in get_test_index()}
+    mpas_cores = {mpas_core.name: mpas_core for mpas_core in get_mpas_cores()}
+
+    test_cases = dict()
+    for path in paths:
+        if path not in entries:
+            raise ValueError(f'Test case with path {path} is not in the '
+                             f'list of test cases')
+        entry = entries[path]
+        mpas_core = mpas_cores[entry['mpas_core']]
+        test_group = mpas_core.load_test_group(entry['test_group_module'],
+                                               entry['test_group_class'])
+        for test_case in test_group.test_cases.values():
+            if test_case.path == path:
+                test_cases[path] = test_case
+                break
+        else:
+            raise ValueError(f'Test case with path {path} was not found in '
+                             f'the test group {test_group.name}')
+    return test_cases
+
+
+def _get_package_fingerprint():
+    """
+    Compute a checksum of the contents of all files in the compass package
+    (other than the index itself), which changes whenever test cases may
+    have been added, removed or renamed
+    """
+    sha = hashlib.sha256()
+    package_dir = os.path.dirname(__file__)
+    for root, dirs, files in os.walk(package_dir):
+        dirs[:] = sorted(directory for directory in dirs
+                         if directory != '__pycache__')
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            if path == _index_filename or filename.endswith('.tmp'):
+                continue
+            sha.update(os.path.relpath(path, package_dir).encode('utf-8'))
+            with open(path, 'rb') as handle:
+                sha.update(handle.read())
+    return sha.hexdigest()
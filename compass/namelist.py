@@ -1,5 +1,10 @@
+import os
 from importlib import resources
 
+# namelist files that have already been parsed, keyed by absolute path, with
+# the modification time and size of the file when it was parsed
+_ingest_cache = dict()
+
 
 def parse_replacements(package, namelist):
     """
@@ -30,7 +35,20 @@ def parse_replacements(package, namelist):
 
 
 def ingest(defaults_filename):
-    """ Read the defaults file """
+    """
+    Read the defaults file
+
+    Each file is only parsed once unless it has changed.  The records (the
+    dictionaries of options in each namelist record) are shared with the
+    cache, so they must not be modified directly.  Use ``replace()``, which
+    copies the records it modifies, instead.
+    """
+    path = os.path.abspath(defaults_filename)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if path in _ingest_cache and _ingest_cache[path][0] == key:
+        return dict(_ingest_cache[path][1])
+
     with open(defaults_filename, 'r') as f:
         lines = f.readlines()
 
@@ -45,22 +63,34 @@ def ingest(defaults_filename):
                 opt, val = line.strip('\n').split('=')
                 namelist[record][opt.strip()] = val.strip()
 
-    return namelist
+    _ingest_cache[path] = (key, namelist)
+    return dict(namelist)
 
 
 def replace(namelist, replacements):
-    """ Replace entries in the namelist using the replacements dict """
+    """
+    Replace entries in the namelist using the replacements dict.  Records
+    with replaced entries are copied, so ``namelist`` is not modified.
+    """
     new = dict(namelist)
-    is_not_replaced = [True for key in replacements.keys()]
+
+    # the records that each option is in
+    option_records = dict()
     for record in new:
-        for idx, key in enumerate(replacements):
-            if key in new[record]:
-                new[record][key] = replacements[key]
-                is_not_replaced[idx] = False
-    for idx, key in enumerate(replacements):
-        if is_not_replaced[idx]:
+        for key in new[record]:
+            option_records.setdefault(key, list()).append(record)
+
+    copied = set()
+    for key, value in replacements.items():
+        if key not in option_records:
             print(f'Warning: {key} is not in the namelist and replacements '
                   'will not be used')
+            continue
+        for record in option_records[key]:
+            if record not in copied:
+                new[record] = dict(new[record])
+                copied.add(record)
+            new[record][key] = value
 
     return new
 
@@ -68,6 +98,9 @@ def replace(namelist, replacements):
 def write(namelist, filename):
     """ Write the namelist out """
 
+    # the file will no longer match what was parsed before (if anything)
+    _ingest_cache.pop(os.path.abspath(filename), None)
+
     with open(filename, 'w') as f:
         for record in namelist:
             f.write('&{}\n'.format(record))
@@ -1,26 +1,4 @@
 from compass.mpas_core import MpasCore
-from compass.ocean.tests.baroclinic_channel import BaroclinicChannel
-from compass.ocean.tests.dam_break import DamBreak
-from compass.ocean.tests.drying_slope import DryingSlope
-from compass.ocean.tests.global_convergence import GlobalConvergence
-from compass.ocean.tests.global_ocean import GlobalOcean
-from compass.ocean.tests.gotm import Gotm
-from compass.ocean.tests.hurricane import Hurricane
-from compass.ocean.tests.ice_shelf_2d import IceShelf2d
-from compass.ocean.tests.internal_wave import InternalWave
-from compass.ocean.tests.isomip_plus import IsomipPlus
-from compass.ocean.tests.merry_go_round import MerryGoRound
-from compass.ocean.tests.nonhydro import Nonhydro
-from compass.ocean.tests.overflow import Overflow
-from compass.ocean.tests.planar_convergence import PlanarConvergence
-from compass.ocean.tests.soma import Soma
-from compass.ocean.tests.sphere_transport import SphereTransport
-from compass.ocean.tests.spherical_harmonic_transform import (
-    SphericalHarmonicTransform,
-)
-from compass.ocean.tests.tides import Tides
-from compass.ocean.tests.utility import Utility
-from compass.ocean.tests.ziso import Ziso
 
 
 class Ocean(MpasCore):
@@ -34,23 +12,30 @@ class Ocean(MpasCore):
         """
         super().__init__(name='ocean')
 
-        self.add_test_group(BaroclinicChannel(mpas_core=self))
-        self.add_test_group(DamBreak(mpas_core=self))
-        self.add_test_group(DryingSlope(mpas_core=self))
-        self.add_test_group(GlobalConvergence(mpas_core=self))
-        self.add_test_group(GlobalOcean(mpas_core=self))
-        self.add_test_group(Gotm(mpas_core=self))
-        self.add_test_group(Hurricane(mpas_core=self))
-        self.add_test_group(InternalWave(mpas_core=self))
-        self.add_test_group(IceShelf2d(mpas_core=self))
-        self.add_test_group(IsomipPlus(mpas_core=self))
-        self.add_test_group(MerryGoRound(mpas_core=self))
-        self.add_test_group(Nonhydro(mpas_core=self))
-        self.add_test_group(Overflow(mpas_core=self))
-        self.add_test_group(PlanarConvergence(mpas_core=self))
-        self.add_test_group(Soma(mpas_core=self))
-        self.add_test_group(SphereTransport(mpas_core=self))
-        self.add_test_group(SphericalHarmonicTransform(mpas_core=self))
-        self.add_test_group(Tides(mpas_core=self))
-        self.add_test_group(Utility(mpas_core=self))
-        self.add_test_group(Ziso(mpas_core=self))
+        # test groups are only imported when they are needed
+        tests = 'compass.ocean.tests'
+        self.add_test_group_class(f'{tests}.baroclinic_channel',
+                                  'BaroclinicChannel')
+        self.add_test_group_class(f'{tests}.dam_break', 'DamBreak')
+        self.add_test_group_class(f'{tests}.drying_slope', 'DryingSlope')
+        self.add_test_group_class(f'{tests}.global_convergence',
+                                  'GlobalConvergence')
+        self.add_test_group_class(f'{tests}.global_ocean', 'GlobalOcean')
+        self.add_test_group_class(f'{tests}.gotm', 'Gotm')
+        self.add_test_group_class(f'{tests}.hurricane', 'Hurricane')
+        self.add_test_group_class(f'{tests}.internal_wave', 'InternalWave')
+        self.add_test_group_class(f'{tests}.ice_shelf_2d', 'IceShelf2d')
+        self.add_test_group_class(f'{tests}.isomip_plus', 'IsomipPlus')
+        self.add_test_group_class(f'{tests}.merry_go_round', 'MerryGoRound')
+        self.add_test_group_class(f'{tests}.nonhydro', 'Nonhydro')
+        self.add_test_group_class(f'{tests}.overflow', 'Overflow')
+        self.add_test_group_class(f'{tests}.planar_convergence',
+                                  'PlanarConvergence')
+        self.add_test_group_class(f'{tests}.soma', 'Soma')
+        self.add_test_group_class(f'{tests}.sphere_transport',
+                                  'SphereTransport')
+        self.add_test_group_class(f'{tests}.spherical_harmonic_transform',
+                                  'SphericalHarmonicTransform')
+        self.add_test_group_class(f'{tests}.tides', 'Tides')
+        self.add_test_group_class(f'{tests}.utility', 'Utility')
+        self.add_test_group_class(f'{tests}.ziso', 'Ziso')
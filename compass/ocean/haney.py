@@ -1,9 +1,8 @@
-import xarray
 import numpy
-import progressbar
+import xarray
 
 
-def compute_haney_number(ds_mesh, layer_thickness, ssh, show_progress=False):
+def compute_haney_number(ds_mesh, layer_thickness, ssh, time_chunk=None):
     """
     Compute the Haney number rx1 for each edge, and interpolate it to cells
 
@@ -18,8 +17,11 @@ def compute_haney_number(ds_mesh, layer_thickness, ssh, show_progress=False):
     ssh : xarray.DataArray
         A data array with sea surface height
 
-    show_progress : bool, optional
-        Whether to show a progress bar
+    time_chunk : int, optional
+        The number of time slices to compute at a time.  If provided, the
+        results are lazy (dask) arrays that are computed chunk by chunk when
+        they are written out or reduced.  Otherwise, the chunks of the input
+        arrays (if any) are used.
 
     Returns
     -------
@@ -30,20 +32,81 @@ def compute_haney_number(ds_mesh, layer_thickness, ssh, show_progress=False):
         A data array with the Haney number interpolated to cell centers and
         layer interfaces
     """
+    mesh = _get_haney_mesh(ds_mesh)
+
+    if time_chunk is not None:
+        if 'Time' in layer_thickness.dims:
+            layer_thickness = layer_thickness.chunk({'Time': time_chunk})
+        if 'Time' in ssh.dims:
+            ssh = ssh.chunk({'Time': time_chunk})
+
+    haney_edge, haney_cell = xarray.apply_ufunc(
+        _haney_number, layer_thickness, ssh,
+        kwargs=mesh,
+        input_core_dims=[['nCells', 'nVertLevels'], ['nCells']],
+        output_core_dims=[['nEdges', 'nVertLevels'],
+                          ['nCells', 'nVertLevels']],
+        dask='parallelized',
+        output_dtypes=[float, float],
+        dask_gufunc_kwargs={'output_sizes':
+                            {'nEdges': ds_mesh.sizes['nEdges']}})
+
+    return haney_edge, haney_cell
+
+
+def compute_haney_number_stats(ds_mesh, layer_thickness, ssh,
+                               percentiles=(50., 90., 99.), time_chunk=None):
+    """
+    Compute the maximum and percentiles of the Haney number rx1 over all
+    edges and layer interfaces, without keeping the full field in memory
+
+    Parameters
+    ----------
+    ds_mesh : xarray.Dataset
+        A dataset with the MPAS-Ocean mesh
+
+    layer_thickness : xarray.DataArray
+        A data array with layer thicknesses
+
+    ssh : xarray.DataArray
+        A data array with sea surface height
+
+    percentiles : list of float, optional
+        The percentiles (between 0 and 100) of the Haney number to compute
+
+    time_chunk : int, optional
+        The number of time slices to compute at a time.  Otherwise, the chunks
+        of the input arrays (if any) are used.
 
-    nEdges = ds_mesh.sizes['nEdges']
-    nCells = ds_mesh.sizes['nCells']
+    Returns
+    -------
+    ds_stats : xarray.Dataset
+        A dataset with the maximum ``haneyMax`` and the percentiles
+        ``haneyPercentile`` of the Haney number (at each time, if the layer
+        thickness has a ``Time`` dimension)
+    """
+    haney_edge, _ = compute_haney_number(ds_mesh, layer_thickness, ssh,
+                                         time_chunk=time_chunk)
+    dims = ['nEdges', 'nVertLevels']
+    ds_stats = xarray.Dataset()
+    ds_stats['haneyMax'] = haney_edge.max(dim=dims)
+    quantiles = haney_edge.quantile(numpy.array(percentiles) / 100., dim=dims)
+    quantiles = quantiles.rename({'quantile': 'percentile'})
+    ds_stats['haneyPercentile'] = quantiles.assign_coords(
+        percentile=numpy.array(percentiles, dtype=float))
+    return ds_stats.compute()
+
+
+def _get_haney_mesh(ds_mesh):
+    """
+    Get the mesh arrays and masks needed to compute the Haney number, which
+    are the same at every time
+    """
     nVertLevels = ds_mesh.sizes['nVertLevels']
-    if 'Time' in layer_thickness.dims:
-        nTime = layer_thickness.sizes['Time']
-    else:
-        nTime = 1
-        show_progress = False
 
-    cellsOnEdge = ds_mesh.cellsOnEdge - 1
-    minLevelCell = ds_mesh.minLevelCell - 1
-    maxLevelCell = ds_mesh.maxLevelCell - 1
-    edgesOnCell = ds_mesh.edgesOnCell - 1
+    cellsOnEdge = ds_mesh.cellsOnEdge.values - 1
+    minLevelCell = ds_mesh.minLevelCell.values - 1
+    maxLevelCell = ds_mesh.maxLevelCell.values - 1
 
     internal_mask = numpy.logical_and(cellsOnEdge[:, 0] >= 0,
                                       cellsOnEdge[:, 1] >= 1)
@@ -61,81 +124,69 @@ def compute_haney_number(ds_mesh, layer_thickness, ssh, show_progress=False):
                             maxLevelCell[cell1] < maxLevelEdge)
     maxLevelEdge[mask] = maxLevelCell[cell1][mask]
 
-    vert_index = \
-        xarray.DataArray.from_dict({'dims': ('nVertLevels',),
-                                    'data': numpy.arange(nVertLevels)})
+    vert_index = numpy.arange(nVertLevels)
+
+    cell_mask = numpy.logical_and(
+        vert_index >= minLevelCell[:, numpy.newaxis],
+        vert_index <= maxLevelCell[:, numpy.newaxis])
+
+    edge_mask = numpy.logical_and(
+        vert_index >= minLevelEdge[:, numpy.newaxis],
+        vert_index <= maxLevelEdge[:, numpy.newaxis])
 
-    cell_mask = numpy.logical_and(vert_index >= minLevelCell,
-                                  vert_index <= maxLevelCell)
+    return dict(bottom_depth=ds_mesh.bottomDepth.values,
+                cell_mask=cell_mask, edge_mask=edge_mask,
+                internal_mask=internal_mask,
+                cell0=cell0[internal_mask], cell1=cell1[internal_mask],
+                edges_on_cell=ds_mesh.edgesOnCell.values - 1)
 
-    edge_mask = numpy.logical_and(vert_index >= minLevelEdge,
-                                  vert_index <= maxLevelEdge)
 
-    cell0 = cell0[internal_mask]
-    cell1 = cell1[internal_mask]
+def _haney_number(layer_thickness, ssh, bottom_depth, cell_mask, edge_mask,
+                  internal_mask, cell0, cell1, edges_on_cell):
+    """
+    Compute the Haney number at edges and cells for a block of time slices
+    (or a single time slice) at once
+    """
+    nVertLevels = layer_thickness.shape[-1]
 
-    haney_edge = xarray.DataArray(numpy.zeros((nTime, nEdges, nVertLevels)),
-                                  dims=('Time', 'nEdges', 'nVertLevels'))
+    thickness = numpy.where(cell_mask, layer_thickness, 0.)
 
-    haney_cell = xarray.DataArray(numpy.zeros((nTime, nCells, nVertLevels)),
-                                  dims=('Time', 'nCells', 'nVertLevels'))
+    # the elevation of the bottom of each layer is the bottom depth plus
+    # the (reversed) cumulative sum of the thicknesses of the layers below
+    z_bot = numpy.broadcast_to(-bottom_depth[:, numpy.newaxis],
+                               thickness.shape[:-1] + (1,))
+    z_bot = numpy.concatenate((z_bot, thickness[..., ::-1]), axis=-1)
+    z_bot = numpy.cumsum(z_bot, axis=-1)[..., nVertLevels-1::-1]
 
-    if show_progress:
-        widgets = ['Haney number: ', progressbar.Percentage(), ' ',
-                   progressbar.Bar(), ' ', progressbar.ETA()]
-        bar = progressbar.ProgressBar(widgets=widgets,
-                                      maxval=nTime).start()
-    else:
-        bar = None
+    z_mid = numpy.zeros(thickness.shape[:-1] + (nVertLevels+1,))
+    z_mid[..., 1:] = z_bot + 0.5*thickness
+    z_mid[..., 0] = ssh
 
-    for tIndex in range(nTime):
+    z_mid0 = z_mid[..., cell0, :]
+    z_mid1 = z_mid[..., cell1, :]
 
-        z_mid = numpy.zeros((nCells, nVertLevels+1))
-        if 'Time' in layer_thickness.dims:
-            local_thickness = layer_thickness.isel(Time=tIndex)
-        else:
-            local_thickness = layer_thickness
-        local_thickness = local_thickness.where(cell_mask, 0.).values
-        if 'Time' in ssh.dims:
-            local_ssh = ssh.isel(Time=tIndex)
-        else:
-            local_ssh = ssh
-        local_ssh = local_ssh.values
-        bottom_depth = ds_mesh.bottomDepth.values
-        z_bot = -bottom_depth
-        for zIndex in range(nVertLevels-1, -1, -1):
-            z_mid[:, zIndex+1] = z_bot + 0.5*local_thickness[:, zIndex]
-            z_bot += local_thickness[:, zIndex]
-        z_mid[:, 0] = local_ssh
-
-        dz_vert1 = z_mid[cell0, 0:-1] - z_mid[cell0, 1:]
-        dz_vert2 = z_mid[cell1, 0:-1] - z_mid[cell1, 1:]
-        dz_edge = z_mid[cell1, :] - z_mid[cell0, :]
-
-        dz_vert1[:, 0] *= 2
-        dz_vert2[:, 0] *= 2
-
-        rx1 = numpy.zeros((nEdges, nVertLevels))
-
-        epsilon = 1e-10
-        denom = dz_vert1 + dz_vert2
-        denom[numpy.abs(denom) < epsilon] = epsilon
-
-        rx1[internal_mask, :] = (numpy.abs(dz_edge[:, 0:-1] + dz_edge[:, 1:]) /
-                                 denom)
-
-        haney_edge[tIndex, :, :] = rx1
-        haney_edge[tIndex, :, :] = haney_edge[tIndex, :, :].where(edge_mask)
-        haney_cell[tIndex, :, :] = haney_edge[tIndex, edgesOnCell, :].max(
-            dim='maxEdges')
-        if show_progress:
-            bar.update(tIndex+1)
-    if show_progress:
-        bar.finish()
-
-    if 'Time' not in layer_thickness.dims:
-        # don't need the time dimension
-        haney_edge = haney_edge.isel(Time=0)
-        haney_cell = haney_cell.isel(Time=0)
+    dz_vert1 = z_mid0[..., 0:-1] - z_mid0[..., 1:]
+    dz_vert2 = z_mid1[..., 0:-1] - z_mid1[..., 1:]
+    dz_edge = z_mid1 - z_mid0
+
+    dz_vert1[..., 0] *= 2
+    dz_vert2[..., 0] *= 2
+
+    rx1 = numpy.zeros(thickness.shape[:-2] + edge_mask.shape)
+
+    epsilon = 1e-10
+    denom = dz_vert1 + dz_vert2
+    denom[numpy.abs(denom) < epsilon] = epsilon
+
+    rx1[..., internal_mask, :] = (numpy.abs(dz_edge[..., 0:-1] +
+                                            dz_edge[..., 1:]) / denom)
+
+    haney_edge = numpy.where(edge_mask, rx1, numpy.nan)
+
+    # the maximum over the edges of each cell, skipping NaNs
+    haney_cell = haney_edge[..., edges_on_cell[:, 0], :]
+    for index in range(1, edges_on_cell.shape[1]):
+        haney_cell = numpy.fmax(haney_cell,
+                                haney_edge[..., edges_on_cell[:, index], :])
 
     return haney_edge, haney_cell
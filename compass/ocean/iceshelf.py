@@ -65,7 +65,7 @@ def adjust_ssh(variable, iteration_count, step):
         raise ValueError("Unknown variable to modify: {}".format(variable))
 
     step.update_namelist_pio('namelist.ocean')
-    partition(ntasks, config, logger)
+    partition(ntasks, config, logger, base_work_dir=step.base_work_dir)
 
     for iterIndex in range(iteration_count):
         logger.info(" * Iteration {}/{}".format(iterIndex + 1,
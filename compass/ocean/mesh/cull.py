@@ -1,6 +1,7 @@
 import os
 
 import mpas_tools.io
+import numpy as np
 import xarray as xr
 from geometric_features import (
     FeatureCollection,
@@ -426,34 +427,62 @@ def _cull_mesh_with_logging(logger, with_cavities, with_critical_passages,
 
 
 def _cull_topo():
-    ds_base = xr.open_dataset('base_mesh.nc')
-    ncells_base = ds_base.sizes['nCells']
-    lon_base = ds_base.lonCell.values
-    lat_base = ds_base.latCell.values
-
-    ds_culled = xr.open_dataset('culled_mesh.nc')
-    ncells_culled = ds_culled.sizes['nCells']
-    lon_culled = ds_culled.lonCell.values
-    lat_culled = ds_culled.latCell.values
-
-    # create a map from lat-lon pairs to base-mesh cell indices
-    map_base = dict()
-    for cell_index in range(ncells_base):
-        lon = lon_base[cell_index]
-        lat = lat_base[cell_index]
-        map_base[(lon, lat)] = cell_index
-
-    # create a map from culled- to base-mesh cell indices
-    map_culled_to_base = list()
-    for cell_index in range(ncells_culled):
-        lon = lon_culled[cell_index]
-        lat = lat_culled[cell_index]
-        # each (lon, lat) for a culled cell *must* be in the base mesh
-        map_culled_to_base.append(map_base[(lon, lat)])
-
-    ds_topo = xr.open_dataset('topography.nc')
-    ds_topo = ds_topo.isel(nCells=map_culled_to_base)
-    write_netcdf(ds_topo, 'topography_culled.nc')
+    _cull_cell_files(in_filenames=['topography.nc'],
+                     out_filenames=['topography_culled.nc'],
+                     base_mesh_filename='base_mesh.nc',
+                     culled_mesh_filename='culled_mesh.nc')
+
+
+def _cull_cell_files(in_filenames, out_filenames, base_mesh_filename,
+                     culled_mesh_filename):
+    """
+    Subset fields on base-mesh cells to the culled mesh.  The map from culled
+    to base-mesh cells is computed once and shared between files, and only
+    one variable at a time is read into memory on the base mesh
+    """
+    map_culled_to_base = _map_culled_to_base(base_mesh_filename,
+                                             culled_mesh_filename)
+
+    for in_filename, out_filename in zip(in_filenames, out_filenames):
+        with xr.open_dataset(in_filename) as ds_in:
+            ds_out = ds_in.drop_vars(list(ds_in.data_vars))
+            ds_out = ds_out.isel(nCells=map_culled_to_base,
+                                 missing_dims='ignore')
+            for var_name, da in ds_in.data_vars.items():
+                if 'nCells' in da.dims:
+                    # indexing the full variable in memory is much faster
+                    # than indexing lazily from the file
+                    da = da.load().isel(nCells=map_culled_to_base)
+                ds_out[var_name] = da
+            write_netcdf(ds_out, out_filename)
+
+
+def _map_culled_to_base(base_mesh_filename, culled_mesh_filename):
+    """
+    Find the index of each culled-mesh cell on the base mesh by searching
+    for its (lon, lat) in the sorted (lon, lat) pairs of base-mesh cells
+    """
+    # complex numbers are sorted lexicographically by their real and then
+    # imaginary parts, so they can be used to sort and search (lon, lat) pairs
+    with xr.open_dataset(base_mesh_filename) as ds_base:
+        base = ds_base.lonCell.values + 1j * ds_base.latCell.values
+
+    with xr.open_dataset(culled_mesh_filename) as ds_culled:
+        culled = ds_culled.lonCell.values + 1j * ds_culled.latCell.values
+
+    base_sort = np.argsort(base)
+    base_sorted = base[base_sort]
+
+    indices = np.searchsorted(base_sorted, culled)
+    indices = np.minimum(indices, len(base_sorted) - 1)
+    # each (lon, lat) for a culled cell *must* be in the base mesh
+    missing = base_sorted[indices] != culled
+    if np.any(missing):
+        raise ValueError(f'{np.count_nonzero(missing)} cells in '
+                         f'{culled_mesh_filename} were not found in '
+                         f'{base_mesh_filename}')
+
+    return base_sort[indices]
 
 
 def _land_mask_from_topo(with_cavities, topo_filename, mask_filename):
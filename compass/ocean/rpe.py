@@ -1,12 +1,14 @@
-import xarray
-import xarray.plot
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import xarray
 
 
 def compute_rpe(initial_state_file_name='initial_state.nc',
-                output_file_prefix='output_', num_files=5):
+                output_file_prefix='output_', num_files=5, workers=1):
     """
     Computes the reference (resting) potential energy for the whole domain
+
     Parameters
     ----------
     initial_state_file_name : str
@@ -18,107 +20,110 @@ def compute_rpe(initial_state_file_name='initial_state.nc',
     num_files : int
         Number of files on which to compute rpe
 
+    workers : int, optional
+        The number of processes used to compute the RPE of different output
+        files in parallel
+
     Returns
     -------
     rpe : numpy.ndarray
-          the reference potential energy of size (num_timesteps) x (num_files)
+          the reference potential energy of size (num_files) x (num_timesteps)
+          where ``num_timesteps`` is the largest number of time slices in any
+          output file.  Time slices beyond the end of a shorter file are NaN.
     """
-    gravity = 9.80616
-
     # --- Open and read vars from netCDF file
-    dsInit = xarray.open_dataset(initial_state_file_name)
-    nCells = dsInit.sizes['nCells']
-    nEdges = dsInit.sizes['nEdges']
-    nVertLevels = dsInit.sizes['nVertLevels']
-
-    xCell = dsInit.xCell
-    yCell = dsInit.yCell
-    xEdge = dsInit.xEdge
-    yEdge = dsInit.yEdge
-    areaCell = dsInit.areaCell
-    minLevelCell = dsInit.minLevelCell - 1
-    maxLevelCell = dsInit.maxLevelCell - 1
-    bottomDepth = dsInit.bottomDepth
+    with xarray.open_dataset(initial_state_file_name) as dsInit:
+        nVertLevels = dsInit.sizes['nVertLevels']
+        areaCell = dsInit.areaCell.values
+        minLevelCell = dsInit.minLevelCell.values - 1
+        maxLevelCell = dsInit.maxLevelCell.values - 1
+        bottomDepth = dsInit.bottomDepth.values
+        xEdge = dsInit.xEdge.values
+        yEdge = dsInit.yEdge.values
 
     # --- Compute a few quantities relevant to domain geometry
-    areaCellMatrix = np.tile(areaCell, (nVertLevels, 1)).transpose()
-    bottomMax = np.max(bottomDepth.values)
-    yMin = np.min(yEdge.values)
-    yMax = np.max(yEdge.values)
-    xMin = np.min(xEdge.values)
-    xMax = np.max(xEdge.values)
-    areaDomain = (yMax - yMin) * (xMax - xMin)
-
-    vert_index = \
-        xarray.DataArray.from_dict({'dims': ('nVertLevels',),
-                                    'data': np.arange(nVertLevels)})
-
-    cell_mask = np.logical_and(vert_index >= minLevelCell,
-                               vert_index <= maxLevelCell)
-    cell_mask = np.swapaxes(cell_mask, 0, 1)
-    nCells_1D = len(areaCellMatrix[cell_mask])
-
-    # --- Get number of timesteps, assuming all output files have the same
-    # --- number of timesteps
-    ds = xarray.open_dataset('{}{}.nc'.format(
-                             output_file_prefix, 1))
-    nt = ds.sizes['Time']
-    ds.close()
-
-    # --- Allocations
-    rpe1 = np.zeros(nCells_1D)
-    zMid = np.zeros(nCells_1D)
-    thickness = np.zeros(nCells_1D)
-    rpe = np.ones((num_files, nt))
-
-    for n in range(num_files):
-
-        ds = xarray.open_dataset('{}{}.nc'.format(
-                                 output_file_prefix, n+1))
-
-        xtime = ds.xtime.values
-        hFull = ds.layerThickness
-        densityFull = ds.density
-
-        for tidx, t in enumerate(xtime):
-
-            h = hFull[tidx, :, :].values
-            vol = np.multiply(h, areaCellMatrix)
-            density = densityFull[tidx, :, :].values
-            density_1D = density[cell_mask]
-            vol_1D = vol[cell_mask]
-
-            # --- Density sorting in ascending order
-            sorted_ind = np.argsort(density_1D)
-            density_sorted = density_1D[sorted_ind]
-            vol_sorted = vol_1D[sorted_ind]
-
-            thickness = np.divide(vol_sorted.tolist(), areaDomain)
-
-            # --- RPE computation
-            z = np.append([0.], -np.cumsum(thickness))
-            zMid = z[0:-1] - thickness/2. + bottomMax
-            rpe1 = gravity * np.multiply(
-                       np.multiply(density_sorted, zMid),
-                       vol_sorted)
-
-            rpe[n, tidx] = np.sum(rpe1)/np.sum(areaCell)
-
-        ds.close()
+    bottomMax = np.max(bottomDepth)
+    areaDomain = (np.max(yEdge) - np.min(yEdge)) * \
+        (np.max(xEdge) - np.min(xEdge))
+
+    # --- The flattened indices of the active (cell, level) pairs, shared by
+    # --- every time slice of every file
+    vert_index = np.arange(nVertLevels)
+    cell_mask = np.logical_and(vert_index >= minLevelCell[:, np.newaxis],
+                               vert_index <= maxLevelCell[:, np.newaxis])
+    mask_index = np.flatnonzero(cell_mask)
+    area_1D = np.repeat(areaCell, np.sum(cell_mask, axis=1))
+
+    geom = dict(mask_index=mask_index, area_1D=area_1D,
+                areaDomain=areaDomain, bottomMax=bottomMax,
+                areaTotal=np.sum(areaCell))
+
+    filenames = [f'{output_file_prefix}{n + 1}.nc' for n in range(num_files)]
+    if workers > 1 and num_files > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, num_files)) as \
+                executor:
+            results = list(executor.map(_compute_file_rpe, filenames,
+                                        [geom] * num_files))
+    else:
+        results = [_compute_file_rpe(filename, geom)
+                   for filename in filenames]
+
+    nt = max(len(xtime) for xtime, _ in results)
+    rpe = np.full((num_files, nt), np.nan)
+    xtime = None
+    for n, (file_xtime, file_rpe) in enumerate(results):
+        rpe[n, :len(file_rpe)] = file_rpe
+        if len(file_xtime) == nt and xtime is None:
+            xtime = file_xtime
 
     # --- Write rpe to text file
-    rows = ['{}'.format(t.astype(str)) for t in xtime]
     with open('rpe.txt', 'w+') as csvfile:
         col_headings = 'time'
         for n in range(num_files):
             col_headings += ',output_' + str(n+1)
         col_headings += '\n'
         csvfile.writelines(col_headings)
+        rows = list()
         for tidx, t in enumerate(xtime):
+            row = t
             for n in range(num_files):
-                rows[tidx] += ',%f' % rpe[n, tidx]
-            rows[tidx] += '\n'
+                row += ',%f' % rpe[n, tidx]
+            rows.append(row + '\n')
         csvfile.writelines(rows)
-    csvfile.close()
 
     return rpe
+
+
+def _compute_file_rpe(filename, geom):
+    """
+    Compute the RPE at each time slice in one output file, reading one slice
+    of density and layer thickness at a time
+    """
+    gravity = 9.80616
+
+    mask_index = geom['mask_index']
+    area_1D = geom['area_1D']
+
+    with xarray.open_dataset(filename) as ds:
+        xtime = [t.astype(str) for t in ds.xtime.values]
+        nt = ds.sizes['Time']
+        rpe = np.zeros(nt)
+        for tidx in range(nt):
+            h_1D = ds.layerThickness[tidx, :, :].values.ravel()[mask_index]
+            density_1D = ds.density[tidx, :, :].values.ravel()[mask_index]
+            vol_1D = h_1D * area_1D
+
+            # --- Density sorting in ascending order
+            sorted_ind = np.argsort(density_1D)
+            density_sorted = density_1D[sorted_ind]
+            vol_sorted = vol_1D[sorted_ind]
+
+            thickness = vol_sorted / geom['areaDomain']
+
+            # --- RPE computation
+            zMid = geom['bottomMax'] - np.cumsum(thickness) + thickness / 2.
+            rpe1 = gravity * density_sorted * zMid * vol_sorted
+
+            rpe[tidx] = np.sum(rpe1) / geom['areaTotal']
+
+    return xtime, rpe
@@ -35,7 +35,8 @@ class Analysis(Step):
         nus : list of float
             A list of viscosities
         """
-        super().__init__(test_case=test_case, name='analysis')
+        super().__init__(test_case=test_case, name='analysis',
+                         cpus_per_task=len(nus), min_cpus_per_task=1)
         self.resolution = resolution
         self.nus = nus
 
@@ -59,7 +60,7 @@ class Analysis(Step):
         section = self.config['baroclinic_channel']
         nx = section.getint('nx')
         ny = section.getint('ny')
-        rpe = compute_rpe()
+        rpe = compute_rpe(workers=self.cpus_per_task)
         _plot(nx, ny, self.outputs[0], self.nus, rpe)
 
 
@@ -1,4 +1,8 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from mpas_tools.logging import check_call
 
 
 def get_core_list(ncells, max_cells_per_core=30000, min_cells_per_core=2):
@@ -71,6 +75,86 @@ def get_core_list(ncells, max_cells_per_core=30000, min_cells_per_core=2):
     return cores
 
 
+def make_partitions(graph_filename, cores, logger, workers=1):
+    """
+    Partition a graph file into each of a list of core counts with
+    ``gpmetis``, running up to ``workers`` instances of ``gpmetis`` at a time.
+    Core counts with an existing, valid partition file
+    (``<graph_filename>.part.<ncores>``) are skipped, so an interrupted step
+    can be resumed.
+
+    Parameters
+    ----------
+    graph_filename : str
+        The graph file to partition
+
+    cores : list of int
+        The core counts to partition the graph into
+
+    logger : logging.Logger
+        A logger for output
+
+    workers : int, optional
+        The number of ``gpmetis`` processes to run at once
+    """
+    nvertices = _get_graph_vertex_count(graph_filename)
+    logger.info(f'Partitioning into {len(cores)} core counts with up to '
+                f'{workers} gpmetis processes at a time')
+    if workers > 1:
+        # each thread just waits on its own gpmetis process
+        with ThreadPoolExecutor(max_workers=min(workers, len(cores))) as \
+                executor:
+            futures = [executor.submit(_partition, graph_filename, nvertices,
+                                       ncores, logger)
+                       for ncores in cores]
+            skipped = [future.result() for future in futures]
+    else:
+        skipped = [_partition(graph_filename, nvertices, ncores, logger)
+                   for ncores in cores]
+    if any(skipped):
+        logger.info(f'Skipped {sum(skipped)} core counts with existing '
+                    f'partition files')
+
+
+def _partition(graph_filename, nvertices, ncores, logger):
+    """
+    Partition the graph into the given number of cores, unless a valid
+    partition file already exists, and return whether it was skipped
+    """
+    part_filename = f'{graph_filename}.part.{ncores}'
+    if _is_valid_partition(part_filename, nvertices, ncores):
+        return True
+    check_call(['gpmetis', graph_filename, f'{ncores}'], logger)
+    if not _is_valid_partition(part_filename, nvertices, ncores):
+        raise ValueError(f'gpmetis did not produce a valid partition file '
+                         f'{part_filename}')
+    return False
+
+
+def _get_graph_vertex_count(graph_filename):
+    """
+    Get the number of vertices (cells) from the header of a METIS graph file
+    """
+    with open(graph_filename) as handle:
+        for line in handle:
+            if not line.startswith('%'):
+                return int(line.split()[0])
+    raise ValueError(f'No header found in graph file {graph_filename}')
+
+
+def _is_valid_partition(part_filename, nvertices, ncores):
+    """
+    Whether a partition file exists and has a partition between 0 and
+    ``ncores - 1`` for each vertex, so that it wasn't left incomplete by an
+    interrupted ``gpmetis``
+    """
+    if not os.path.exists(part_filename):
+        return False
+    partition = np.fromfile(part_filename, dtype=int, sep=' ')
+    return (partition.size == nvertices and
+            np.all(partition >= 0) and np.all(partition < ncores))
+
+
 # https://stackoverflow.com/a/22808285
 def _prime_factors(n):
     i = 2
@@ -2,7 +2,6 @@ import os
 from glob import glob
 
 import numpy as np
-from mpas_tools.logging import check_call
 
 from compass.io import symlink
 from compass.ocean.tests.global_ocean.files_for_e3sm.files_for_e3sm_step import (  # noqa: E501
@@ -10,6 +9,7 @@ from compass.ocean.tests.global_ocean.files_for_e3sm.files_for_e3sm_step import
 )
 from compass.ocean.tests.global_ocean.files_for_e3sm.graph_partition import (
     get_core_list,
+    make_partitions,
 )
 
 
@@ -38,12 +38,26 @@ class OceanGraphPartition(FilesForE3SMStep):
         setup input files based on config options
         """
         super().setup()
+        self._set_cpus_per_task()
         graph_filename = self.config.get('files_for_e3sm', 'graph_filename')
         if graph_filename != 'autodetect':
             graph_filename = os.path.normpath(os.path.join(
                 self.test_case.work_dir, graph_filename))
             self.add_input_file(filename='graph.info', target=graph_filename)
 
+    def constrain_resources(self, available_resources):
+        """
+        Constrain ``cpus_per_task`` based on the number of cores available to
+        this step
+
+        Parameters
+        ----------
+        available_resources : dict
+            The total number of cores available to the step
+        """
+        self._set_cpus_per_task()
+        super().constrain_resources(available_resources)
+
     def run(self):
         """
         Run this step of the testcase
@@ -72,10 +86,9 @@ class OceanGraphPartition(FilesForE3SMStep):
         cores = get_core_list(ncells=ncells)
         logger.info(f'Creating graph files between {np.amin(cores)} and '
                     f'{np.amax(cores)}')
-        for ncores in cores:
-            args = ['gpmetis', f'mpas-o.graph.info.{creation_date}',
-                    f'{ncores}']
-            check_call(args, logger)
+        make_partitions(graph_filename=f'mpas-o.graph.info.{creation_date}',
+                        cores=cores, logger=logger,
+                        workers=self.cpus_per_task)
 
         # create link in assembled files directory
 
@@ -88,3 +101,14 @@ class OceanGraphPartition(FilesForE3SMStep):
         for file in files:
             symlink(os.path.abspath(file),
                     f'{inputdata_dir}/{file}')
+
+    def _set_cpus_per_task(self):
+        """
+        Set the number of cores (each running one ``gpmetis`` process at a
+        time) from config options
+        """
+        config = self.config
+        self.cpus_per_task = config.getint(
+            'files_for_e3sm', 'graph_partition_cpus_per_task')
+        self.min_cpus_per_task = config.getint(
+            'files_for_e3sm', 'graph_partition_min_cpus_per_task')
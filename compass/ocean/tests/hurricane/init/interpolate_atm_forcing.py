@@ -1,13 +1,12 @@
 from compass.step import Step
-from mpas_tools.mesh.interpolation import interp_bilin
 from mpas_tools.logging import check_call
 
 import netCDF4
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse
 import datetime
 import os
-import subprocess
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 
@@ -26,6 +25,9 @@ class InterpolateAtmForcing(Step):
     plot_interval : int
         Number of time snaps between plots
 
+    snaps_per_chunk : int
+        Number of time snaps read, interpolated and written at once
+
     wind_file : str
         Name of file for wind velocity data
 
@@ -59,6 +61,7 @@ class InterpolateAtmForcing(Step):
 
         self.plot = True
         self.plot_interval = 100
+        self.snaps_per_chunk = 50
 
         self.wind_file = 'wnd10m.nc'
         self.pres_file = 'prmsl.nc'
@@ -83,47 +86,88 @@ class InterpolateAtmForcing(Step):
 
         self.add_output_file(filename=self.forcing_file)
 
-    def interpolate_data_to_grid(self, grid_file, data_file, var):
+    def get_interp_weights(self, grid_file, data_file):
         """
-        Interpolate time snaps of gridded data field to MPAS mesh
+        Compute bilinear interpolation weights from the gridded data to
+        MPAS cell centers, once for all time snaps.  The gridded data is
+        flipped in latitude and padded with a periodic column in longitude
+        and a row beyond the north pole.  The index of the original data
+        point in each padded grid point is found by padding an array of
+        indices in the same way.
+
+        Returns
+        -------
+        weights : scipy.sparse.csr_matrix
+            A sparse matrix that interpolates the flattened data at a time
+            snap to MPAS cells
+
+        data_grid : tuple
+            The padded longitude and latitude of the data and the index of
+            the original data point at each padded grid point (-1 where the
+            padded data are zero)
+
+        cell_grid : tuple
+            The longitude and latitude of MPAS cells in degrees
         """
 
-        # Open files
-        data_nc = netCDF4.Dataset(data_file, 'r')
-        grid_nc = netCDF4.Dataset(grid_file, 'r')
-
         # Get grid from data file
-        lon_data = data_nc.variables['lon'][:]
+        with netCDF4.Dataset(data_file, 'r') as data_nc:
+            lon_data = data_nc.variables['lon'][:]
+            lat_data = data_nc.variables['lat'][:]
+        ndata = lat_data.size * lon_data.size
         lon_data = np.append(lon_data, 360.0)
-        lat_data = np.flipud(data_nc.variables['lat'][:])
+        lat_data = np.flipud(lat_data)
         lat_data = np.append(lat_data, 180.0-lat_data[-1])
-        time = data_nc.variables['time'][:]
-        nsnaps = time.size
         nlon = lon_data.size
         nlat = lat_data.size
-        data = np.zeros((nsnaps, nlat, nlon))
+
+        index = np.full((nlat, nlon), -1, dtype=np.int64)
+        index[0:-1, 0:-1] = np.flipud(
+            np.arange(ndata).reshape((nlat - 1, nlon - 1)))
+        index[-1, :] = index[-2, ::-1]
+        index[:, -1] = index[:, 0]
 
         # Get grid from grid file
-        lon_grid = grid_nc.variables['lonCell'][:]*180.0/np.pi
-        lat_grid = grid_nc.variables['latCell'][:]*180.0/np.pi
+        with netCDF4.Dataset(grid_file, 'r') as grid_nc:
+            lon_grid = grid_nc.variables['lonCell'][:]*180.0/np.pi
+            lat_grid = grid_nc.variables['latCell'][:]*180.0/np.pi
         ncells = lon_grid.size
-        interp_data = np.zeros((nsnaps, ncells))
 
-        # Interpolate timesnaps
-        for i, t in enumerate(time):
-            print(f'Interpolating {var}: {i}')
-
-            # Get data to interpolate
-            data[i, 0:-1, 0:-1] = np.flipud(data_nc.variables[var][i, :, :])
-            data[i, -1, :] = data[i, -2, ::-1]
-            data[i, :, -1] = data[i, :, 0]
+        # Find the data points bracketing each cell
+        i2 = np.maximum(np.searchsorted(lon_data, lon_grid), 1)
+        j2 = np.maximum(np.searchsorted(lat_data, lat_grid), 1)
+        i1 = i2 - 1
+        j1 = j2 - 1
+
+        dx = lon_data[i2] - lon_data[i1]
+        dy = lat_data[j2] - lat_data[j1]
+        wx1 = (lon_data[i2] - lon_grid) / dx
+        wx2 = (lon_grid - lon_data[i1]) / dx
+        wy1 = (lat_data[j2] - lat_grid) / dy
+        wy2 = (lat_grid - lat_data[j1]) / dy
+
+        cols = np.concatenate((index[j1, i1], index[j1, i2],
+                               index[j2, i1], index[j2, i2]))
+        vals = np.concatenate((wy1 * wx1, wy1 * wx2,
+                               wy2 * wx1, wy2 * wx2))
+        rows = np.tile(np.arange(ncells), 4)
+
+        valid = cols >= 0
+        weights = scipy.sparse.csr_matrix(
+            (vals[valid], (rows[valid], cols[valid])),
+            shape=(ncells, ndata))
+
+        return weights, (lon_data, lat_data, index), (lon_grid, lat_grid)
+
+    def get_xtime(self, data_file):
+        """
+        Get the MPAS xtime strings for the time snaps in a data file
+        """
 
-            interp_data[i, :] = interp_bilin(lon_data, lat_data,
-                                             data[i, :, :],
-                                             lon_grid, lat_grid)
+        with netCDF4.Dataset(data_file, 'r') as data_nc:
+            time = data_nc.variables['time'][:]
+            ref_date = data_nc.variables['time'].getncattr('units')
 
-        # Deal with time
-        ref_date = data_nc.variables['time'].getncattr('units')
         ref_date = ref_date.replace('hours since ', '').replace('.0 +0:00', '')
         ref_date = datetime.datetime.strptime(ref_date, '%Y-%m-%d %H:%M:%S')
         xtime = []
@@ -132,9 +176,31 @@ class InterpolateAtmForcing(Step):
             xtime.append(date.strftime('%Y-%m-%d_%H:%M:%S'+45*' '))
         xtime = np.array(xtime, 'S64')
 
-        return (lon_grid, lat_grid, interp_data), \
-            (lon_data, lat_data, data), \
-            xtime
+        return xtime
+
+    def interpolate_data_to_file(self, weights, data_file, var, out_var):
+        """
+        Interpolate time snaps of gridded data field to MPAS mesh, reading
+        and writing ``snaps_per_chunk`` time snaps at a time
+        """
+
+        data_nc = netCDF4.Dataset(data_file, 'r')
+        out_nc = netCDF4.Dataset(self.forcing_file, 'a')
+
+        field = data_nc.variables[var]
+        nsnaps = field.shape[0]
+        out = out_nc.createVariable(out_var, np.float64, ('Time', 'nCells'))
+
+        for start in range(0, nsnaps, self.snaps_per_chunk):
+            end = min(start + self.snaps_per_chunk, nsnaps)
+            print(f'Interpolating {var}: {start}-{end - 1}')
+
+            data = np.asarray(field[start:end, :, :], dtype=np.float64)
+            data = data.reshape((end - start, weights.shape[1]))
+            out[start:end, :] = (weights @ data.T).T
+
+        out_nc.close()
+        data_nc.close()
 
     def plot_interp_data(self, orig_data, interp_data,
                          var_label, var_abrev, time, i):
@@ -144,9 +210,6 @@ class InterpolateAtmForcing(Step):
 
         plt.switch_backend('agg')
 
-        if not self.plot:
-            return
-
         lon_data = orig_data[0]
         lat_data = orig_data[1]
         lon_grid = interp_data[0]
@@ -188,36 +251,65 @@ class InterpolateAtmForcing(Step):
                     bbox_inches='tight')
         plt.close()
 
-    def write_to_file(self, filename, data, var, xtime):
+    def write_xtime(self, xtime, ncells):
         """
-        Write data to netCDF file
+        Create the forcing file with its dimensions and times
         """
 
-        if os.path.isfile(filename):
-            data_nc = netCDF4.Dataset(filename, 'a',
-                                      format='NETCDF3_64BIT_OFFSET')
-        else:
-            data_nc = netCDF4.Dataset(filename, 'w',
-                                      format='NETCDF3_64BIT_OFFSET')
-
-            # Find dimesions
-            ncells = data.shape[1]
-            nsnaps = data.shape[0]
-
-            # Declare dimensions
-            data_nc.createDimension('nCells', ncells)
-            data_nc.createDimension('StrLen', 64)
-            data_nc.createDimension('Time', None)
-
-            # Create time variable
-            time = data_nc.createVariable('xtime', 'S1', ('Time', 'StrLen'))
-            time[:, :] = netCDF4.stringtochar(xtime)
-
-        # Set variables
-        data_var = data_nc.createVariable(var, np.float64, ('Time', 'nCells'))
-        data_var[:, :] = data[:, :]
+        data_nc = netCDF4.Dataset(self.forcing_file, 'w',
+                                  format='NETCDF3_64BIT_OFFSET')
+
+        # Declare dimensions
+        data_nc.createDimension('nCells', ncells)
+        data_nc.createDimension('StrLen', 64)
+        data_nc.createDimension('Time', None)
+
+        # Create time variable
+        time = data_nc.createVariable('xtime', 'S1', ('Time', 'StrLen'))
+        time[:, :] = netCDF4.stringtochar(xtime)
         data_nc.close()
 
+    def plot_forcing(self, data_grid, cell_grid, xtime):
+        """
+        Plot every ``plot_interval`` time snap of the original and
+        interpolated wind speed and atmospheric pressure
+        """
+
+        lon_data, lat_data, index = data_grid
+
+        wind_nc = netCDF4.Dataset(self.wind_file, 'r')
+        pres_nc = netCDF4.Dataset(self.pres_file, 'r')
+        forcing_nc = netCDF4.Dataset(self.forcing_file, 'r')
+
+        def padded(var, i):
+            data = np.asarray(var[i, :, :], dtype=np.float64).ravel()
+            return np.where(index >= 0, data[index], 0.)
+
+        for i in range(0, len(xtime), self.plot_interval):
+
+            # Plot wind velocity
+            vel_data = np.sqrt(
+                np.square(padded(wind_nc.variables['U_GRD_L103'], i)) +
+                np.square(padded(wind_nc.variables['V_GRD_L103'], i)))
+            vel_interp = np.sqrt(
+                np.square(forcing_nc.variables['windSpeedU'][i, :]) +
+                np.square(forcing_nc.variables['windSpeedV'][i, :]))
+            self.plot_interp_data((lon_data, lat_data, vel_data),
+                                  cell_grid + (vel_interp,),
+                                  'velocity magnitude', 'vel', xtime[i], i)
+
+            # Plot atmopheric pressure
+            press_data = padded(pres_nc.variables['PRMSL_L101'], i)
+            press_interp = forcing_nc.variables['atmosPressure'][i, :]
+            self.plot_interp_data((lon_data, lat_data, press_data),
+                                  cell_grid + (press_interp,),
+                                  'atmospheric pressure', 'pres',
+                                  xtime[i], i)
+
+        forcing_nc.close()
+        pres_nc.close()
+        wind_nc.close()
+
     def run(self):
         """
         Run this step of the test case
@@ -225,47 +317,23 @@ class InterpolateAtmForcing(Step):
         if os.path.isfile(self.forcing_file):
             check_call(['rm', self.forcing_file], logger=self.logger)
 
+        # The wind and pressure data are on the same grid, so the
+        # interpolation weights are computed once
+        weights, data_grid, cell_grid = self.get_interp_weights(
+            self.grid_file, self.wind_file)
+
+        xtime = self.get_xtime(self.wind_file)
+        self.write_xtime(xtime, weights.shape[0])
+
         # Interpolation of u and v velocities
-        u_interp, u_data, xtime = self.interpolate_data_to_grid(
-            self.grid_file,
-            self.wind_file,
-            'U_GRD_L103')
-        self.write_to_file(self.forcing_file, u_interp[2],
-                           'windSpeedU', xtime)
-
-        v_interp,  v_data, xtime = self.interpolate_data_to_grid(
-            self.grid_file,
-            self.wind_file,
-            'V_GRD_L103')
-        self.write_to_file(self.forcing_file, v_interp[2],
-                           'windSpeedV', xtime)
-
-        # Plot wind velocity
-        for i in range(len(xtime)):
-            if i % self.plot_interval == 0:
-                vel_interp = (u_interp[0], u_interp[1], u_interp[2][i, :])
-                vel_interp[2][:] = np.sqrt(np.square(u_interp[2][i, :]) +
-                                           np.square(v_interp[2][i, :]))
-                vel_data = (u_data[0], u_data[1], u_data[2][i, :, :])
-                vel_data[2][:] = np.sqrt(np.square(u_data[2][i, :, :]) +
-                                         np.square(v_data[2][i, :, :]))
-                self.plot_interp_data(vel_data, vel_interp,
-                                      'velocity magnitude', 'vel',
-                                      xtime[i], i)
+        self.interpolate_data_to_file(weights, self.wind_file,
+                                      'U_GRD_L103', 'windSpeedU')
+        self.interpolate_data_to_file(weights, self.wind_file,
+                                      'V_GRD_L103', 'windSpeedV')
 
         # Interpolation of atmospheric pressure
-        p_interp, p_data, xtime = self.interpolate_data_to_grid(
-            self.grid_file,
-            self.pres_file,
-            'PRMSL_L101')
-        self.write_to_file(self.forcing_file, p_interp[2],
-                           'atmosPressure', xtime)
-
-        # Plot atmopheric pressure
-        for i in range(len(xtime)):
-            if i % self.plot_interval == 0:
-                press_data = (p_data[0], p_data[1], p_data[2][i, :])
-                press_interp = (p_interp[0], p_interp[1], p_interp[2][i, :])
-                self.plot_interp_data(press_data,  press_interp,
-                                      'atmospheric pressure', 'pres',
-                                      xtime[i], i)
+        self.interpolate_data_to_file(weights, self.pres_file,
+                                      'PRMSL_L101', 'atmosPressure')
+
+        if self.plot:
+            self.plot_forcing(data_grid, cell_grid, xtime)
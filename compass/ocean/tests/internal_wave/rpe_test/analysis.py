@@ -32,7 +32,8 @@ class Analysis(Step):
         nus : list of float
             A list of viscosities
         """
-        super().__init__(test_case=test_case, name='analysis')
+        super().__init__(test_case=test_case, name='analysis',
+                         cpus_per_task=len(nus), min_cpus_per_task=1)
         self.nus = nus
 
         self.add_input_file(
@@ -52,7 +53,8 @@ class Analysis(Step):
         """
         Run this step of the test case
         """
-        rpe = compute_rpe(num_files=len(self.nus))
+        rpe = compute_rpe(num_files=len(self.nus),
+                          workers=self.cpus_per_task)
         _plot(self.outputs[0], self.nus, rpe)
 
 
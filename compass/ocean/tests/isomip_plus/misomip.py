@@ -1,11 +1,13 @@
 import glob
+import hashlib
 import os
 
 import numpy
+import shapely
 from netCDF4 import Dataset
 from progressbar import ETA, Bar, Percentage, ProgressBar
-from shapely.geometry import LineString, Polygon
 
+from compass.io import symlink
 from compass.step import Step
 
 
@@ -67,284 +69,229 @@ class Misomip(Step):
         # show progress only if we're not writing to a log file
         show_progress = self.log_filename is None
 
+        # the weights are shared between steps with the same mesh
+        weights_dir = os.path.join(
+            self.base_work_dir,
+            self.config.get('isomip_plus_misomip', 'weights_dir'))
+
         _compute_misomip_interp_coeffs(in_dir=in_dir,
-                                       show_progress=show_progress)
+                                       weights_dir=weights_dir)
         _interp_misomip(in_dir=in_dir, sf_dir=sf_dir,
                         out_file_name=self.outputs[0],
                         show_progress=show_progress)
 
 
-def _compute_misomip_interp_coeffs(in_dir, show_progress):  # noqa: C901
-    def getTransectWeights(outFileName, axis):
+def _compute_misomip_interp_coeffs(in_dir, weights_dir):
+    """
+    Compute the weights for interpolating from the MPAS mesh to the MISOMIP
+    grid and transects, or reuse weights cached in a subdirectory of
+    ``weights_dir`` for the same MPAS mesh.  The weights are symlinked into
+    the current directory.
+    """
 
-        if show_progress:
-            pbar = ProgressBar(
-                widgets=[
-                    'compute MPAS and MISOMIP {} transect '
-                    'intersections'.format(axis),
-                    Percentage(),
-                    Bar(),
-                    ETA()],
-                maxval=nCells).start()
-        else:
-            pbar = None
+    meshFileName = '{}/init.nc'.format(in_dir)
+    fileNames = ['horiz_map.nc', 'x_trans_map.nc', 'y_trans_map.nc']
 
-        if axis == 'x':
-            slicePos = xTransect
-            outNOther = outNy
-            outOtherAxis = y
-        else:
-            slicePos = yTransect
-            outNOther = outNx
-            outOtherAxis = x
-
-        sliceCount = numpy.zeros(outNOther, int)
-        cellIndices = []
-        otherIndices = []
-        weights = []
-        sliceIndices = []
-
-        for iCell in range(nCells):
-            verts = verticesOnCell[iCell, 0:nEdgesOnCell[iCell]]
-            verts = numpy.append(verts, verts[0])
-            xVert = xVertex[verts]
-            yVert = yVertex[verts]
-
-            if axis == 'x':
-                sliceAxisVerts = xVert
-                otherAxisVerts = yVert
-            else:
-                sliceAxisVerts = yVert
-                otherAxisVerts = xVert
-
-            if (numpy.amax(sliceAxisVerts) < slicePos) or \
-                    (numpy.amin(sliceAxisVerts) > slicePos):
-                # this polygon doesn't intersect the slice
-                continue
-
-            mpasPolygon = Polygon(zip(xVert, yVert))
-
-            indices = numpy.nonzero(
-                outOtherAxis < numpy.amin(otherAxisVerts))[0]
-            if len(indices) == 0:
-                lower = 0
-            else:
-                lower = indices[-1]
-
-            indices = numpy.nonzero(
-                outOtherAxis > numpy.amax(otherAxisVerts))[0]
-            if len(indices) == 0:
-                upper = outNOther
-            else:
-                upper = indices[0]
-
-            for otherIndex in range(lower, upper):
-                if axis == 'x':
-                    vertices = ((slicePos, outOtherAxis[otherIndex]),
-                                (slicePos, outOtherAxis[otherIndex + 1]))
-                else:
-                    vertices = ((outOtherAxis[otherIndex], slicePos),
-                                (outOtherAxis[otherIndex + 1], slicePos))
-
-                line = LineString(vertices)
-                if not mpasPolygon.intersects(line):
-                    continue
-                length = mpasPolygon.intersection(line).length
-                if length == 0.0:
-                    continue
-
-                cellIndices.append(iCell)
-                otherIndices.append(otherIndex)
-
-                weights.append(length / outDx)
-
-                sliceIndex = sliceCount[otherIndex]
-                sliceCount[otherIndex] += 1
-                sliceIndices.append(sliceIndex)
-            if show_progress:
-                pbar.update(iCell + 1)
+    inFile = Dataset(meshFileName, 'r')
 
-        if show_progress:
-            pbar.finish()
-
-        cellIndices = numpy.array(cellIndices)
-        otherIndices = numpy.array(otherIndices)
-        sliceIndices = numpy.array(sliceIndices)
-        weights = numpy.array(weights)
-
-        # sort the intersections first by otherIndex, then by sliceIndex
-        # for efficiency
-        nSlices = numpy.amax(sliceCount)
-        sortedIndices = numpy.zeros(0, int)
-        for sliceIndex in range(nSlices):
-            intersectionsInSlice = numpy.nonzero(sliceIndices == sliceIndex)[0]
-            indices = numpy.argsort(otherIndices[intersectionsInSlice])
-            sortedIndices = numpy.append(
-                sortedIndices, intersectionsInSlice[indices])
-
-        outFile = Dataset(outFileName, 'w', format='NETCDF4')
-        outFile.createDimension('nIntersections', len(cellIndices))
-        outFile.createVariable('cellIndices', 'i4', ('nIntersections',))
-        if axis == 'x':
-            outFile.createVariable('yIndices', 'i4', ('nIntersections',))
-        else:
-            outFile.createVariable('xIndices', 'i4', ('nIntersections',))
-        outFile.createVariable('sliceIndices', 'i4', ('nIntersections',))
-        outFile.createVariable(
-            'mpasToMisomipWeights', 'f8', ('nIntersections',))
-
-        outVars = outFile.variables
-        outVars['cellIndices'][:] = cellIndices[sortedIndices]
-        if axis == 'x':
-            outVars['yIndices'][:] = otherIndices[sortedIndices]
-        else:
-            outVars['xIndices'][:] = otherIndices[sortedIndices]
+    inVars = inFile.variables
+    nEdgesOnCell = numpy.asarray(inVars['nEdgesOnCell'][:])
+    verticesOnCell = numpy.asarray(inVars['verticesOnCell'][:, :]) - 1
+    xVertex = numpy.asarray(inVars['xIsomipVertex'][:])
+    yVertex = numpy.asarray(inVars['yIsomipVertex'][:])
 
-        outVars['sliceIndices'][:] = sliceIndices[sortedIndices]
-        outVars['mpasToMisomipWeights'][:] = weights[sortedIndices]
+    inFile.close()
 
-        outFile.close()
+    # the weights only depend on the horizontal mesh
+    sha = hashlib.sha256()
+    for array in [nEdgesOnCell, verticesOnCell, xVertex, yVertex]:
+        sha.update(numpy.ascontiguousarray(array).tobytes())
+    cacheDir = os.path.join(weights_dir, sha.hexdigest()[:32])
 
-    meshFileName = '{}/init.nc'.format(in_dir)
-    interpWeightsFileName = 'horiz_map.nc'
-    xTransectFileName = 'x_trans_map.nc'
-    yTransectFileName = 'y_trans_map.nc'
+    if not all([os.path.exists(os.path.join(cacheDir, fileName))
+                for fileName in fileNames]):
 
-    outNx, outNy, outNz, x, y, z, xTransect, yTransect, outDx, outDz = \
-        _get_out_grid(corners=True)
+        polygons, xMin, xMax, yMin, yMax = _get_cell_polygons(
+            nEdgesOnCell, verticesOnCell, xVertex, yVertex)
 
-    inFile = Dataset(meshFileName, 'r')
+        outNx, outNy, outNz, x, y, z, xTransect, yTransect, outDx, outDz = \
+            _get_out_grid(corners=True)
 
-    nCells = len(inFile.dimensions['nCells'])
-    inVars = inFile.variables
-    nEdgesOnCell = inVars['nEdgesOnCell'][:]
-    verticesOnCell = inVars['verticesOnCell'][:, :] - 1
-    xVertex = inVars['xIsomipVertex'][:]
-    yVertex = inVars['yIsomipVertex'][:]
+        os.makedirs(cacheDir, exist_ok=True)
 
-    inFile.close()
-    if not os.path.exists(interpWeightsFileName):
+        # write to temporary files, so other steps never see partial files
+        fileName = os.path.join(cacheDir, fileNames[0])
+        _get_horiz_weights('{}.{}.tmp'.format(fileName, os.getpid()),
+                           polygons, xMin, xMax, yMin, yMax, x, y, outDx)
+        os.replace('{}.{}.tmp'.format(fileName, os.getpid()), fileName)
 
-        cellIndices = []
-        xIndices = []
-        yIndices = []
-        weights = []
-        sliceIndices = []
+        fileName = os.path.join(cacheDir, fileNames[1])
+        _get_transect_weights('{}.{}.tmp'.format(fileName, os.getpid()),
+                              polygons, xMin, xMax, yMin, yMax, xTransect, y,
+                              outDx, axis='x')
+        os.replace('{}.{}.tmp'.format(fileName, os.getpid()), fileName)
 
-        sliceCount = numpy.zeros((outNy, outNx), int)
+        fileName = os.path.join(cacheDir, fileNames[2])
+        _get_transect_weights('{}.{}.tmp'.format(fileName, os.getpid()),
+                              polygons, yMin, yMax, xMin, xMax, yTransect, x,
+                              outDx, axis='y')
+        os.replace('{}.{}.tmp'.format(fileName, os.getpid()), fileName)
 
-        if show_progress:
-            pbar = ProgressBar(
-                widgets=[
-                    'compute MPAS and MISOMIP intersections',
-                    Percentage(),
-                    Bar(),
-                    ETA()],
-                maxval=nCells).start()
-        else:
-            pbar = None
-
-        for iCell in range(nCells):
-            verts = verticesOnCell[iCell, 0:nEdgesOnCell[iCell]]
-            verts = numpy.append(verts, verts[0])
-            xVert = xVertex[verts]
-            yVert = yVertex[verts]
-            mpasPolygon = Polygon(zip(xVert, yVert))
-
-            # find the out indices that bound the MPAS polygon
-            indices = numpy.nonzero(x < numpy.amin(xVert))[0]
-            if len(indices) == 0:
-                xl = 0
-            else:
-                xl = indices[-1]
-
-            indices = numpy.nonzero(x > numpy.amax(xVert))[0]
-            if len(indices) == 0:
-                xu = outNx
-            else:
-                xu = indices[0]
-
-            indices = numpy.nonzero(y < numpy.amin(yVert))[0]
-            if len(indices) == 0:
-                yl = 0
-            else:
-                yl = indices[-1]
-
-            indices = numpy.nonzero(y > numpy.amax(yVert))[0]
-            if len(indices) == 0:
-                yu = outNy
-            else:
-                yu = indices[0]
-
-            for yIndex in range(yl, yu):
-                for xIndex in range(xl, xu):
-                    vertices = ((x[xIndex], y[yIndex]),
-                                (x[xIndex + 1], y[yIndex]),
-                                (x[xIndex + 1], y[yIndex + 1]),
-                                (x[xIndex], y[yIndex + 1]),
-                                (x[xIndex], y[yIndex]))
-                    outPoly = Polygon(vertices)
-                    if not mpasPolygon.intersects(outPoly):
-                        continue
-                    intersectionArea = mpasPolygon.intersection(outPoly).area
-                    if intersectionArea == 0.:
-                        continue
-
-                    cellIndices.append(iCell)
-                    xIndices.append(xIndex)
-                    yIndices.append(yIndex)
-
-                    weights.append(intersectionArea / outDx**2)
-
-                    sliceIndex = sliceCount[yIndex, xIndex]
-                    sliceCount[yIndex, xIndex] += 1
-                    sliceIndices.append(sliceIndex)
-            if show_progress:
-                pbar.update(iCell + 1)
+    for fileName in fileNames:
+        symlink(os.path.join(cacheDir, fileName), fileName)
 
-        if show_progress:
-            pbar.finish()
-
-        cellIndices = numpy.array(cellIndices)
-        xIndices = numpy.array(xIndices)
-        yIndices = numpy.array(yIndices)
-        sliceIndices = numpy.array(sliceIndices)
-        weights = numpy.array(weights)
-
-        # sort the intersections first by xIndex, then by yIndex, then by
-        # sliceIndex for efficiency
-        nSlices = numpy.amax(sliceCount)
-        sortedIndices = numpy.zeros(0, int)
-        xyIndices = xIndices + outNx * yIndices
-        for sliceIndex in range(nSlices):
-            intersectionsInSlice = numpy.nonzero(sliceIndices == sliceIndex)[0]
-            indices = numpy.argsort(xyIndices[intersectionsInSlice])
-            sortedIndices = numpy.append(
-                sortedIndices, intersectionsInSlice[indices])
-
-        outFile = Dataset(interpWeightsFileName, 'w', format='NETCDF4')
-        outFile.createDimension('nIntersections', len(cellIndices))
-        outFile.createVariable('cellIndices', 'i4', ('nIntersections',))
-        outFile.createVariable('xIndices', 'i4', ('nIntersections',))
-        outFile.createVariable('yIndices', 'i4', ('nIntersections',))
-        outFile.createVariable('sliceIndices', 'i4', ('nIntersections',))
-        outFile.createVariable(
-            'mpasToMisomipWeights', 'f8', ('nIntersections',))
-
-        outVars = outFile.variables
-        outVars['cellIndices'][:] = cellIndices[sortedIndices]
-        outVars['xIndices'][:] = xIndices[sortedIndices]
-        outVars['yIndices'][:] = yIndices[sortedIndices]
-        outVars['sliceIndices'][:] = sliceIndices[sortedIndices]
-        outVars['mpasToMisomipWeights'][:] = weights[sortedIndices]
-
-        outFile.close()
-
-    if not os.path.exists(xTransectFileName):
-        getTransectWeights(xTransectFileName, axis='x')
-
-    if not os.path.exists(yTransectFileName):
-        getTransectWeights(yTransectFileName, axis='y')
+
+def _get_cell_polygons(nEdgesOnCell, verticesOnCell, xVertex, yVertex):
+    """
+    Get shapely polygons for all MPAS cells and the bounds of each cell
+    """
+    nCells = len(nEdgesOnCell)
+    maxEdges = verticesOnCell.shape[1]
+
+    valid = numpy.arange(maxEdges) < nEdgesOnCell[:, numpy.newaxis]
+    verts = verticesOnCell[valid]
+    cellIndices = numpy.repeat(numpy.arange(nCells), nEdgesOnCell)
+
+    polygons = shapely.polygons(shapely.linearrings(
+        xVertex[verts], yVertex[verts], indices=cellIndices))
+
+    xVert = numpy.where(valid, xVertex[verticesOnCell], numpy.nan)
+    yVert = numpy.where(valid, yVertex[verticesOnCell], numpy.nan)
+
+    return polygons, numpy.nanmin(xVert, axis=1), \
+        numpy.nanmax(xVert, axis=1), numpy.nanmin(yVert, axis=1), \
+        numpy.nanmax(yVert, axis=1)
+
+
+def _get_index_bounds(outAxis, minPos, maxPos):
+    """
+    Find the range of MISOMIP grid cells along an axis (with corners
+    ``outAxis``) that may overlap each MPAS cell
+    """
+    outN = len(outAxis) - 1
+    # the last corner below the cell (or 0)
+    lower = numpy.maximum(
+        numpy.searchsorted(outAxis, minPos, side='left') - 1, 0)
+    # the first corner above the cell (or outN)
+    upper = numpy.minimum(
+        numpy.searchsorted(outAxis, maxPos, side='right'), outN)
+    return lower, numpy.maximum(upper, lower)
+
+
+def _get_horiz_weights(outFileName, polygons, xMin, xMax, yMin, yMax, x, y,
+                       outDx):
+    """
+    Compute the areas of intersection between MPAS cells and MISOMIP grid
+    cells
+    """
+    outNx = len(x) - 1
+
+    xl, xu = _get_index_bounds(x, xMin, xMax)
+    yl, yu = _get_index_bounds(y, yMin, yMax)
+
+    # all candidate pairs, ordered by cell, then y index, then x index
+    nx = xu - xl
+    counts = nx * (yu - yl)
+    cellIndices = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.arange(len(cellIndices)) - \
+        numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    xIndices = xl[cellIndices] + offsets % nx[cellIndices]
+    yIndices = yl[cellIndices] + offsets // nx[cellIndices]
+
+    x0 = x[xIndices]
+    x1 = x[xIndices + 1]
+    y0 = y[yIndices]
+    y1 = y[yIndices + 1]
+    boxes = shapely.polygons(numpy.stack(
+        (numpy.stack((x0, x1, x1, x0, x0), axis=-1),
+         numpy.stack((y0, y0, y1, y1, y0), axis=-1)), axis=-1))
+
+    areas = shapely.area(shapely.intersection(polygons[cellIndices], boxes))
+    mask = areas > 0.
+
+    _write_weights(outFileName, cellIndices[mask],
+                   dict(xIndices=xIndices[mask], yIndices=yIndices[mask]),
+                   xIndices[mask] + outNx * yIndices[mask],
+                   areas[mask] / outDx**2)
+
+
+def _get_transect_weights(outFileName, polygons, sliceMin, sliceMax,
+                          otherMin, otherMax, slicePos, outOtherAxis, outDx,
+                          axis):
+    """
+    Compute the lengths of intersection between MPAS cells and the segments
+    of a MISOMIP transect
+    """
+    cells = numpy.nonzero(numpy.logical_and(sliceMax >= slicePos,
+                                            sliceMin <= slicePos))[0]
+
+    lower, upper = _get_index_bounds(outOtherAxis, otherMin[cells],
+                                     otherMax[cells])
+
+    # all candidate pairs, ordered by cell, then other index
+    counts = upper - lower
+    cellIndices = numpy.repeat(cells, counts)
+    otherIndices = numpy.repeat(lower, counts) + \
+        numpy.arange(len(cellIndices)) - \
+        numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    other0 = outOtherAxis[otherIndices]
+    other1 = outOtherAxis[otherIndices + 1]
+    slicePos = numpy.full(len(cellIndices), slicePos)
+    if axis == 'x':
+        coords = ((slicePos, other0), (slicePos, other1))
+    else:
+        coords = ((other0, slicePos), (other1, slicePos))
+    lines = shapely.linestrings(numpy.stack(
+        [numpy.stack(coord, axis=-1) for coord in coords], axis=1))
+
+    lengths = shapely.length(
+        shapely.intersection(polygons[cellIndices], lines))
+    mask = lengths > 0.
+
+    if axis == 'x':
+        otherName = 'yIndices'
+    else:
+        otherName = 'xIndices'
+
+    _write_weights(outFileName, cellIndices[mask],
+                   {otherName: otherIndices[mask]}, otherIndices[mask],
+                   lengths[mask] / outDx)
+
+
+def _write_weights(outFileName, cellIndices, outIndices, keys, weights):
+    """
+    Write out interpolation weights, sorted first by slice index (the
+    number of earlier intersections with the same MISOMIP grid cell, given
+    by ``keys``), then by grid cell for efficiency
+    """
+    order = numpy.argsort(keys, kind='stable')
+    sortedKeys = keys[order]
+    starts = numpy.nonzero(numpy.diff(sortedKeys, prepend=-1))[0]
+    counts = numpy.diff(numpy.append(starts, len(keys)))
+    sliceIndices = numpy.zeros(len(keys), int)
+    sliceIndices[order] = numpy.arange(len(keys)) - \
+        numpy.repeat(starts, counts)
+
+    sortedIndices = numpy.lexsort((keys, sliceIndices))
+
+    outFile = Dataset(outFileName, 'w', format='NETCDF4')
+    outFile.createDimension('nIntersections', len(cellIndices))
+    outFile.createVariable('cellIndices', 'i4', ('nIntersections',))
+    for name in outIndices:
+        outFile.createVariable(name, 'i4', ('nIntersections',))
+    outFile.createVariable('sliceIndices', 'i4', ('nIntersections',))
+    outFile.createVariable(
+        'mpasToMisomipWeights', 'f8', ('nIntersections',))
+
+    outVars = outFile.variables
+    outVars['cellIndices'][:] = cellIndices[sortedIndices]
+    for name, indices in outIndices.items():
+        outVars[name][:] = indices[sortedIndices]
+    outVars['sliceIndices'][:] = sliceIndices[sortedIndices]
+    outVars['mpasToMisomipWeights'][:] = weights[sortedIndices]
+
+    outFile.close()
 
 
 def _interp_misomip(in_dir, sf_dir, out_file_name,  # noqa: C901
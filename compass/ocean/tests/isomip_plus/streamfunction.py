@@ -1,7 +1,7 @@
 import os
+import threading
 
 import numpy
-import progressbar
 import scipy.sparse
 import scipy.sparse.linalg
 import xarray
@@ -57,11 +57,10 @@ class Streamfunction(Step):
         in_dir = '../simulation'
         out_dir = '.'
 
-        # show progress only if we're not writing to a log file
-        show_progress = self.log_filename is None
-
-        dx = self.config.getfloat('isomip_plus_streamfunction', 'osf_dx')
-        dz = self.config.getfloat('isomip_plus_streamfunction', 'osf_dz')
+        config = self.config
+        dx = config.getfloat('isomip_plus_streamfunction', 'osf_dx')
+        dz = config.getfloat('isomip_plus_streamfunction', 'osf_dz')
+        time_chunk = config.getint('isomip_plus_streamfunction', 'time_chunk')
 
         dsMesh = xarray.open_dataset(os.path.join(in_dir, 'init.nc'))
 
@@ -70,16 +69,16 @@ class Streamfunction(Step):
             concat_dim='Time', combine='nested')
 
         _compute_barotropic_streamfunction(dsMesh, ds, out_dir,
-                                           show_progress=show_progress)
+                                           time_chunk=time_chunk)
 
         _compute_overturning_streamfunction(dsMesh, ds, out_dir, dx=dx, dz=dz,
-                                            show_progress=show_progress)
+                                            time_chunk=time_chunk)
 
 
-def _compute_barotropic_streamfunction(dsMesh, ds, out_dir, show_progress):
+def _compute_barotropic_streamfunction(dsMesh, ds, out_dir, time_chunk=12):
     """
     compute the barotropic streamfunction for the given mesh and monthly-mean
-    data set
+    data set, time_chunk time slices at a time
     """
 
     bsfFileName = '{}/barotropicStreamfunction.nc'.format(out_dir)
@@ -87,7 +86,7 @@ def _compute_barotropic_streamfunction(dsMesh, ds, out_dir, show_progress):
         return
 
     bsfVertex = _compute_barotropic_streamfunction_vertex(dsMesh, ds,
-                                                          show_progress)
+                                                          time_chunk)
     bsfCell = _compute_barotropic_streamfunction_cell(dsMesh, bsfVertex)
     dsBSF = xarray.Dataset()
     dsBSF['xtime_startMonthly'] = ds.xtime_startMonthly
@@ -105,12 +104,13 @@ def _compute_barotropic_streamfunction(dsMesh, ds, out_dir, show_progress):
 
 
 def _compute_overturning_streamfunction(dsMesh, ds, out_dir, dx=2e3, dz=5.,
-                                        show_progress=True):
+                                        time_chunk=12):
     """
     compute the overturning streamfunction for the given mesh and monthly-mean
     data set.
 
-    dx and dz are the resolutions of the OSF in meters
+    dx and dz are the resolutions of the OSF in meters, and time_chunk is the
+    number of time slices computed at a time
     """
 
     osfFileName = '{}/overturningStreamfunction.nc'.format(out_dir)
@@ -140,7 +140,7 @@ def _compute_overturning_streamfunction(dsMesh, ds, out_dir, dx=2e3, dz=5.,
     zlevelTransportFileName = '{}/cache/osf_zlevel_transport.nc'.format(
         out_dir)
     _interpolate_horizontal_transport_zlevel(ds, z, zlevelTransportFileName,
-                                             show_progress)
+                                             time_chunk)
     ds = xarray.open_dataset(zlevelTransportFileName)
 
     cumsumTransportFileName = '{}/cache/osf_cumsum_transport.nc'.format(
@@ -148,9 +148,8 @@ def _compute_overturning_streamfunction(dsMesh, ds, out_dir, dx=2e3, dz=5.,
     _vertical_cumsum_horizontal_transport(ds, cumsumTransportFileName)
     ds = xarray.open_dataset(cumsumTransportFileName)
 
-    cacheFileName = '{}/cache/osf_vert_slice.nc'.format(out_dir)
     _horizontally_bin_overturning_streamfunction(ds, dsMesh, x, osfFileName,
-                                                 cacheFileName, show_progress)
+                                                 time_chunk)
 
 
 def _compute_barotropic_transport(dsMesh, ds):
@@ -182,11 +181,15 @@ def _compute_barotropic_transport(dsMesh, ds):
     return innerEdges, transport
 
 
-def _compute_barotropic_streamfunction_vertex(dsMesh, ds, show_progress):
+def _compute_barotropic_streamfunction_vertex(dsMesh, ds, time_chunk):
+    """
+    Compute the barotropic streamfunction on vertices as the least-squares
+    solution for the transport through inner edges, with zero streamfunction
+    on the boundary
+    """
     innerEdges, transport = _compute_barotropic_transport(dsMesh, ds)
 
     nVertices = dsMesh.sizes['nVertices']
-    nTime = ds.sizes['Time']
 
     cellsOnVertex = dsMesh.cellsOnVertex - 1
     verticesOnEdge = dsMesh.verticesOnEdge - 1
@@ -224,40 +227,40 @@ def _compute_barotropic_streamfunction_vertex(dsMesh, ds, show_progress):
     indices[1, 2 * nInnerEdges + ind] = boundaryVertices
     data[2 * nInnerEdges + ind] = 1.
 
-    bsfVertex = xarray.DataArray(numpy.zeros((nTime, nVertices)),
-                                 dims=('Time', 'nVertices'))
-
-    if show_progress:
-        widgets = ['barotropic streamfunction: ', progressbar.Percentage(),
-                   ' ', progressbar.Bar(), ' ', progressbar.ETA()]
-        bar = progressbar.ProgressBar(widgets=widgets,
-                                      maxval=nTime).start()
-    else:
-        bar = None
-
-    for tIndex in range(nTime):
-        rhs = numpy.zeros(nInnerEdges + nBoundaryVertices, dtype=float)
-
+    M = scipy.sparse.csr_matrix((data, indices),
+                                shape=(nInnerEdges + nBoundaryVertices,
+                                       nVertices))
+
+    # The least-squares solution for all time slices comes from the normal
+    # equations, which are factored once.  Vertices without any constraints
+    # are zero, as in the minimum-norm solution.
+    active = numpy.asarray(abs(M).sum(axis=0)).ravel() > 0
+    MActive = M[:, active]
+    factor = scipy.sparse.linalg.splu((MActive.T @ MActive).tocsc())
+    # the right-hand side is zero at boundary vertices
+    MInnerT = MActive[0:nInnerEdges, :].T.tocsr()
+    lock = threading.Lock()
+
+    def solve(transport):
         # convert to Sv
-        ind = numpy.arange(nInnerEdges)
-        rhs[ind] = 1e-6 * transport.isel(Time=tIndex)
-
-        ind = numpy.arange(nBoundaryVertices)
-        rhs[nInnerEdges + ind] = 0.
-
-        M = scipy.sparse.csr_matrix((data, indices),
-                                    shape=(nInnerEdges + nBoundaryVertices,
-                                           nVertices))
+        rhs = MInnerT @ (1e-6 * transport.reshape((-1, nInnerEdges)).T)
+        # the factorization may not be thread safe
+        with lock:
+            solution = factor.solve(rhs)
+        bsf = numpy.zeros((nVertices, solution.shape[1]))
+        bsf[active, :] = -solution
+        return bsf.T.reshape(transport.shape[:-1] + (nVertices,))
 
-        solution = scipy.sparse.linalg.lsqr(M, rhs)
+    transport = transport.chunk({'Time': time_chunk, 'nEdges': -1})
 
-        bsfVertex[tIndex, :] = -solution[0]
-        if show_progress:
-            bar.update(tIndex + 1)
-    if show_progress:
-        bar.finish()
+    bsfVertex = xarray.apply_ufunc(
+        solve, transport, input_core_dims=[['nEdges']],
+        output_core_dims=[['nVertices']], dask='parallelized',
+        output_dtypes=[float],
+        dask_gufunc_kwargs={'output_sizes': {'nVertices': nVertices}})
 
-    return bsfVertex
+    print('compute barotropic streamfunction:')
+    return bsfVertex.compute()
 
 
 def _compute_barotropic_streamfunction_cell(dsMesh, bsfVertex):
@@ -377,7 +380,7 @@ def _compute_horizontal_transport_mpas(ds, dsMesh, outFileName):
 
 
 def _interpolate_horizontal_transport_zlevel(ds, z, outFileName,
-                                             show_progress):
+                                             time_chunk):
     """
     interpolate the horizontal transport through edges onto a z-level grid.
     """
@@ -385,8 +388,9 @@ def _interpolate_horizontal_transport_zlevel(ds, z, outFileName,
     if file_complete(ds, outFileName):
         return
 
-    ds = ds.chunk({'Time': 1, 'nInternalEdges': None, 'nVertLevels': 1,
-                   'nVertLevelsP1': 1})
+    chunks = {'Time': time_chunk, 'nInternalEdges': -1, 'nVertLevels': -1,
+              'nVertLevelsP1': -1}
+    ds = ds.chunk(chunks)
 
     nz = len(z)
     z = xarray.DataArray.from_dict({'dims': ('nz',), 'data': z})
@@ -395,87 +399,81 @@ def _interpolate_horizontal_transport_zlevel(ds, z, outFileName,
     z[0] = max(z[0].values, ds.zInterfaceEdge.max())
     z[-1] = min(z[-1].values, ds.zInterfaceEdge.min())
 
-    z0 = z[0:-1].rename({'nz': 'nzM1'})
-    z1 = z[1:].rename({'nz': 'nzM1'})
-
-    nTime = ds.sizes['Time']
-    nInternalEdges = ds.sizes['nInternalEdges']
-    nVertLevels = ds.sizes['nVertLevels']
-
-    if show_progress:
-        widgets = ['interpolating transport on z-level grid: ',
-                   progressbar.Percentage(), ' ', progressbar.Bar(), ' ',
-                   progressbar.ETA()]
-        bar = progressbar.ProgressBar(widgets=widgets, maxval=nTime).start()
-    else:
-        bar = None
-
-    fileNames = []
-
-    for tIndex in range(nTime):
-        fileName = outFileName.replace('.nc', '_{}.nc'.format(tIndex))
-        fileNames.append(fileName)
-        if os.path.exists(fileName):
-            continue
-
-        outTransport = xarray.DataArray(
-            numpy.zeros((nInternalEdges, nz - 1)),
-            dims=('nInternalEdges', 'nzM1'))
-
-        dzSum = xarray.DataArray(
-            numpy.zeros((nInternalEdges, nz - 1)),
-            dims=('nInternalEdges', 'nzM1'))
-
-        dsIn = ds.isel(Time=tIndex)
-        for inZIndex in range(nVertLevels):
-            zTop = dsIn.zInterfaceEdge.isel(nVertLevelsP1=inZIndex)
-            zBot = dsIn.zInterfaceEdge.isel(nVertLevelsP1=inZIndex + 1)
-            inTransportPerDepth = \
-                dsIn.transportPerDepth.isel(nVertLevels=inZIndex)
-            inTransportPerDepth = inTransportPerDepth.fillna(value=0.)
-
-            zt = numpy.minimum(zTop, z0)
-            zb = numpy.maximum(zBot, z1)
-            dz = numpy.maximum(zt - zb, 0.)
-
-            outTransport = outTransport + dz * inTransportPerDepth
-
-            dzSum = dzSum + dz
-
-        outTransport.compute()
-        dzSum.compute()
-
-        dsOut = xarray.Dataset()
-        dsOut['mask'] = dzSum > 0
-        dsOut['transport'] = outTransport
-        dsOut['transportVertSum'] = outTransport.sum('nzM1')
-        dsOut['transportVertSumCheck'] = \
-            dsIn.transportVertSum - dsOut.transportVertSum
-
-        dsOut = dsOut.transpose('nzM1', 'nInternalEdges')
-
-        write_netcdf(dsOut, fileName)
-
-        assert numpy.abs(dsOut.transportVertSumCheck).max().values < 1e-9
-
-        if show_progress:
-            bar.update(tIndex + 1)
-
-    if show_progress:
-        bar.finish()
-
-    dsOut = xarray.open_mfdataset(fileNames, concat_dim='Time',
-                                  combine='nested')
+    outTransport, dzSum = xarray.apply_ufunc(
+        _zlevel_transport, ds.zInterfaceEdge,
+        ds.transportPerDepth.fillna(value=0.),
+        kwargs={'z': z.values},
+        input_core_dims=[['nVertLevelsP1'], ['nVertLevels']],
+        output_core_dims=[['nzM1'], ['nzM1']], dask='parallelized',
+        output_dtypes=[float, float],
+        dask_gufunc_kwargs={'output_sizes': {'nzM1': nz - 1}})
 
+    dsOut = xarray.Dataset()
     dsOut['xtime_startMonthly'] = ds.xtime_startMonthly
     dsOut['xtime_endMonthly'] = ds.xtime_endMonthly
     dsOut['z'] = z
+    dsOut['mask'] = dzSum > 0
+    dsOut['transport'] = outTransport
+    dsOut['transportVertSum'] = outTransport.sum('nzM1')
+    dsOut['transportVertSumCheck'] = \
+        ds.transportVertSum - dsOut.transportVertSum
 
     dsOut = dsOut.transpose('Time', 'nzM1', 'nz', 'nInternalEdges')
 
-    print('caching transport on z-level grid:')
+    print('compute and caching transport on z-level grid:')
     write_netcdf(dsOut, outFileName)
 
+    with xarray.open_dataset(outFileName) as dsOut:
+        assert numpy.abs(dsOut.transportVertSumCheck).max().values < 1e-9
+
+
+def _zlevel_transport(zInterface, transportPerDepth, z):
+    """
+    Integrate the transport per depth in each column (the last dimension)
+    over the z-level layers between the (decreasing) z values.  The integral
+    of the transport from the top of each column is linear in depth within
+    each input layer, so it is interpolated to the z values and differenced.
+    """
+    shape = transportPerDepth.shape[:-1]
+    nVertLevels = transportPerDepth.shape[-1]
+    nzOut = len(z)
+
+    zInterface = zInterface.reshape((-1, nVertLevels + 1))
+    transportPerDepth = transportPerDepth.reshape((-1, nVertLevels))
+    nColumns = zInterface.shape[0]
+
+    thickness = zInterface[:, 0:-1] - zInterface[:, 1:]
+    transportSum = numpy.zeros((nColumns, nVertLevels + 1))
+    transportSum[:, 1:] = numpy.cumsum(transportPerDepth * thickness, axis=1)
+
+    # count the interfaces in each column above each z value by sorting them
+    # together (interfaces first for ties)
+    depths = numpy.concatenate(
+        (-zInterface, numpy.broadcast_to(-z, (nColumns, nzOut))), axis=1)
+    order = numpy.argsort(depths, axis=1, kind='stable')
+    ranks = numpy.empty_like(order)
+    numpy.put_along_axis(ranks, order,
+                         numpy.arange(depths.shape[1])[numpy.newaxis, :],
+                         axis=1)
+    count = ranks[:, nVertLevels + 1:] - numpy.arange(nzOut)
+
+    # the input layer containing each z value (or the top or bottom layer)
+    layer = numpy.clip(count - 1, 0, nVertLevels - 1)
+    depthInLayer = numpy.clip(
+        numpy.take_along_axis(zInterface, layer, axis=1) - z, 0.,
+        numpy.take_along_axis(thickness, layer, axis=1))
+    transportAbove = numpy.take_along_axis(transportSum, layer, axis=1) + \
+        numpy.take_along_axis(transportPerDepth, layer, axis=1) * depthInLayer
+
+    outTransport = transportAbove[:, 1:] - transportAbove[:, 0:-1]
+
+    zTop = numpy.minimum(zInterface[:, 0:1], z[0:-1])
+    zBot = numpy.maximum(zInterface[:, -1:], z[1:])
+    dzSum = numpy.maximum(zTop - zBot, 0.)
+
+    return outTransport.reshape(shape + (nzOut - 1,)), \
+        dzSum.reshape(shape + (nzOut - 1,))
+
 
 def _vertical_cumsum_horizontal_transport(ds, outFileName):
     """
@@ -526,110 +524,68 @@ def _vertical_cumsum_horizontal_transport(ds, outFileName):
     write_netcdf(dsOut, outFileName)
 
 
-def _compute_region_boundary_edges(dsMesh, cellMask):
-    """
-    Given a mask of cells in a region, find the indices and signs (indicating
-    fluxes into the masked region) of non-boundary edges
-    """
-
-    cellsOnEdge = dsMesh.cellsOnEdge.values - 1
-    cellsOnEdgeMask = cellMask.values[cellsOnEdge]
-
-    # first, we only want interior edges, not boundary edges
-    edgeMask = numpy.logical_and(cellsOnEdge[:, 0] >= 0,
-                                 cellsOnEdge[:, 1] >= 0)
-
-    cellMask0 = cellsOnEdgeMask[:, 0][edgeMask]
-    cellMask1 = cellsOnEdgeMask[:, 1][edgeMask]
-
-    # second, we only want edges where one side is in the region and the other
-    # is not
-    edgeMask = cellMask0 != cellMask1
-
-    # convert from boolean mask to indices
-    edgeIndices = numpy.nonzero(edgeMask)[0]
-
-    if len(edgeIndices) == 0:
-        return numpy.array([]), numpy.array([])
-    else:
-        # according to the mesh spec, normals point from cell 0 to cell 1 on a
-        # given edge:
-        # https://mpas-dev.github.io/files/documents/MPAS-MeshSpec.pdf
-        edgeSign = numpy.ones(len(edgeIndices), int)
-
-        # if the first cell on the edge is in the region, we need to reverse
-        # the edge direction to point into the region
-        mask = cellMask0[edgeIndices]
-        edgeSign[mask] = -1
-
-        return edgeIndices, edgeSign
-
-
 def _horizontally_bin_overturning_streamfunction(ds, dsMesh, x, osfFileName,
-                                                 cacheFileName, showProgress):
+                                                 time_chunk):
     """
     bin and sum the vertically cumsummed horizontal transport on the z-level
     grid to get the OSF.
     """
 
-    chunks = {'Time': 1}
-    ds = ds.chunk(chunks)
-
-    nTime = ds.sizes['Time']
-    nz = ds.sizes['nz']
     nx = len(x)
-    x = xarray.DataArray.from_dict({'dims': ('nx',), 'data': x})
-
-    if showProgress:
-        widgets = ['bin overturning streamfunction: ',
-                   progressbar.Percentage(), ' ', progressbar.Bar(), ' ',
-                   progressbar.ETA()]
-        bar = progressbar.ProgressBar(widgets=widgets, maxval=nx).start()
-    else:
-        bar = None
-
-    # sum up the transport into the region bounded by each x value
-    # on the output grid
-
-    fileNames = []
-
-    for xIndex in range(nx):
-        fileName = cacheFileName.replace('.nc', '_{}.nc'.format(xIndex))
-        fileNames.append(fileName)
-        if file_complete(ds, fileName):
-            continue
-
-        cellMask = dsMesh.xIsomipCell >= x[xIndex]
-        edgeIndices, edgeSigns = _compute_region_boundary_edges(dsMesh,
-                                                                cellMask)
-
-        if len(edgeIndices) == 0:
-
-            localOSF = numpy.nan * xarray.DataArray(numpy.ones((nTime, nz)),
-                                                    dims=('Time', 'nz'))
-        else:
-            # convert to Sv
-            transportSum = (
-                1e-6 * edgeSigns *
-                ds.transportSum.isel(nInternalEdges=edgeIndices))
+    nInternalEdges = ds.sizes['nInternalEdges']
 
-            localOSF = transportSum.sum(dim='nInternalEdges')
+    # The OSF at each x value on the output grid is the transport into the
+    # region x >= x[xIndex] through interior edges on its boundary.  An edge
+    # is on the boundary if one cell is in the region and the other is not.
+    # According to the mesh spec, normals point from cell 0 to cell 1 on a
+    # given edge:
+    # https://mpas-dev.github.io/files/documents/MPAS-MeshSpec.pdf
+    cellsOnEdge = dsMesh.cellsOnEdge.values - 1
+    edgeMask = numpy.logical_and(cellsOnEdge[:, 0] >= 0,
+                                 cellsOnEdge[:, 1] >= 0)
+    xCell = dsMesh.xIsomipCell.values
+    x0 = xCell[cellsOnEdge[edgeMask, 0]]
+    x1 = xCell[cellsOnEdge[edgeMask, 1]]
+
+    # the edge direction points into the region if cell 1 is in the region
+    edgeSigns = numpy.where(x0 > x1, -1., 1.)
+    lower = numpy.searchsorted(x, numpy.minimum(x0, x1), side='right')
+    upper = numpy.searchsorted(x, numpy.maximum(x0, x1), side='right')
+    counts = upper - lower
+
+    edgeIndices = numpy.repeat(numpy.arange(nInternalEdges), counts)
+    xIndices = numpy.repeat(lower, counts) + numpy.arange(len(edgeIndices)) - \
+        numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    # convert to Sv
+    binning = scipy.sparse.csr_matrix(
+        (1e-6 * edgeSigns[edgeIndices], (xIndices, edgeIndices)),
+        shape=(nx, nInternalEdges))
+    boundary = abs(binning).sign()
+
+    def bin_edges(field, operator):
+        values = field.reshape((-1, nInternalEdges)).T
+        return (operator @ values).T.reshape(field.shape[:-1] + (nx,))
+
+    chunks = {'Time': time_chunk, 'nz': -1, 'nInternalEdges': -1}
+    ds = ds.chunk(chunks)
 
-            localMask = ds.mask.isel(nInternalEdges=edgeIndices).sum(
-                dim='nInternalEdges') > 0
-            localOSF = localOSF.where(localMask)
+    kwargs = dict(input_core_dims=[['nInternalEdges']],
+                  output_core_dims=[['nx']], dask='parallelized',
+                  output_dtypes=[float],
+                  dask_gufunc_kwargs={'output_sizes': {'nx': nx}})
 
-        dsOSF = xarray.Dataset()
-        dsOSF['osf'] = localOSF
-        write_netcdf(dsOSF, fileName)
+    localOSF = xarray.apply_ufunc(bin_edges, ds.transportSum,
+                                  kwargs={'operator': binning}, **kwargs)
 
-        if showProgress:
-            bar.update(xIndex + 1)
+    localMask = xarray.apply_ufunc(bin_edges, ds.mask.astype(float),
+                                   kwargs={'operator': boundary},
+                                   **kwargs) > 0
 
-    if showProgress:
-        bar.finish()
+    x = xarray.DataArray.from_dict({'dims': ('nx',), 'data': x})
 
-    dsOSF = xarray.open_mfdataset(fileNames, concat_dim='nx', combine='nested')
+    dsOSF = xarray.Dataset()
+    dsOSF['osf'] = localOSF.where(localMask)
     dsOSF['xtime_startMonthly'] = ds.xtime_startMonthly
     dsOSF['xtime_endMonthly'] = ds.xtime_endMonthly
     dsOSF['x'] = x
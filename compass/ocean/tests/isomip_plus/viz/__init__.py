@@ -52,6 +52,7 @@ class Viz(Step):
         section = config['isomip_plus_viz']
         plot_streamfunctions = section.getboolean('plot_streamfunctions')
         plot_haney = section.getboolean('plot_haney')
+        haney_time_chunk = section.getint('haney_time_chunk')
         frames_per_second = section.getint('frames_per_second')
         movie_format = section.get('movie_format')
         section_y = section.getfloat('section_y')
@@ -110,7 +111,7 @@ class Viz(Step):
 
             if plot_haney:
                 _compute_and_write_haney_number(dsMesh, ds, out_dir,
-                                                showProgress=show_progress)
+                                                haney_time_chunk)
 
             tsPlotter = TimeSeriesPlotter(inFolder=sim_dir,
                                           outFolder='{}/plots'.format(out_dir),
@@ -163,9 +164,10 @@ def file_complete(ds, fileName):
     return complete
 
 
-def _compute_and_write_haney_number(dsMesh, ds, folder, showProgress=False):
+def _compute_and_write_haney_number(dsMesh, ds, folder, time_chunk):
     """
     compute the Haney number rx1 for each edge, and interpolate it to cells.
+    The time slices are computed and written time_chunk at a time.
     """
 
     haneyFileName = '{}/haney.nc'.format(folder)
@@ -174,7 +176,7 @@ def _compute_and_write_haney_number(dsMesh, ds, folder, showProgress=False):
 
     haneyEdge, haneyCell = compute_haney_number(
         dsMesh, ds.timeMonthly_avg_layerThickness, ds.timeMonthly_avg_ssh,
-        showProgress)
+        time_chunk=time_chunk)
     dsHaney = xarray.Dataset()
     dsHaney['xtime_startMonthly'] = ds.xtime_startMonthly
     dsHaney['xtime_endMonthly'] = ds.xtime_endMonthly
@@ -35,7 +35,8 @@ class Analysis(Step):
         nus : list of float
             A list of viscosities
         """
-        super().__init__(test_case=test_case, name='analysis')
+        super().__init__(test_case=test_case, name='analysis',
+                         cpus_per_task=len(nus), min_cpus_per_task=1)
         self.resolution = resolution
         self.nus = nus
 
@@ -56,7 +57,7 @@ class Analysis(Step):
         """
         Run this step of the test case
         """
-        rpe = compute_rpe()
+        rpe = compute_rpe(workers=self.cpus_per_task)
         _plot(self.outputs[0], self.nus, rpe)
 
 
@@ -142,7 +142,8 @@ class Forward(Step):
         Run this step of the test case
         """
         ntasks = self.ntasks
-        partition(ntasks, self.config, self.logger)
+        partition(ntasks, self.config, self.logger,
+                  base_work_dir=self.base_work_dir)
 
         if self.with_particles:
             section = self.config['soma']
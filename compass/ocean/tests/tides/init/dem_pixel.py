@@ -1,260 +1,169 @@
-
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import netCDF4 as nc
 import numpy as np
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import distance_transform_cdt, gaussian_filter
 
 # Authors: Darren Engwirda
 
+# no. of rows of output pixels processed at once
+BAND_ROWS = 600
 
-def blend_front(e1st, i1st, e2nd, halo, sdev):
-    """
-    Create a mask of linear weights to 'blend' two elev. fun
-    at the ice sheet/shelf front:
+RTOPO_REFS = "doi.pangaea.de/10.1594/PANGAEA.905295"
+SRTMP_REFS = "doi.org/10.1029/2019EA000658"
+GEBCO_REFS = "doi.org/10.5285/a29c5465-b138-234d-e053-6c86abc040b9"
 
-        ELEV = (1.-MASK) * E1ST + (0.+MASK) * E2ND
+RTOPO_FIELDS = ["bed_elevation", "ice_thickness", "ocn_thickness"]
 
-    Elev. data assoc. with the 1st data-set is preserved in
-    pixels where ice-thickness is non-zero. The two datasets
-    are blended over a distance of approx. HALO pixels. The
-    mask is additionally smoothed via a Gaussian filter with
-    standard-deviation sigma=SDEV.
 
+def front_distance(i1st, head, tail, halo):
     """
+    Distance (in pixels) to the ice sheet/shelf front for the
+    rows I1ST[HEAD:TAIL], capped at HALO+1 pixels. Distances
+    are 'taxicab' distances to pixels where ice-thickness is
+    non-zero, periodic in longitude, and are only computed
+    in the southern and northern quarters of the DEM.
 
-    mask = np.full(
-        e1st.shape, halo + 1, dtype=np.float32)
-
-    nidx = np.full(
-        e1st.shape[0], False, dtype=bool)
-    sidx = np.full(
-        e1st.shape[0], False, dtype=bool)
-
-    bnds = np.asarray(np.round(
-        np.linspace(0, e1st.shape[0], 5)), dtype=np.uint32)
+    I1ST may be an array or a netCDF variable, of which only
+    the rows within HALO+1 pixels of the band are read.
 
-    sidx[bnds[0]:bnds[1]:] = True
-    nidx[bnds[3]:bnds[4]:] = True
-
-    print("* blending SOUTH.")
-
-    part = mask[sidx, :]
+    """
 
-    npos = np.arange(+1, part.shape[0] + 1)
-    epos = np.arange(-1, part.shape[1] - 1)
-    spos = np.arange(-1, part.shape[0] - 1)
-    wpos = np.arange(+1, part.shape[1] + 1)
+    nrow, ncol = i1st.shape
 
-    Y = part.shape[0]
-    X = part.shape[1]
+    dist = np.full(
+        (tail - head, ncol), halo + 1, dtype=np.float32)
 
-    npos[npos >= +Y] = Y - 1
-    spos[spos <= -1] = 0
-    epos[epos <= -1] = X - 1
-    wpos[wpos >= +X] = 0
+    bnds = np.asarray(np.round(
+        np.linspace(0, nrow, 5)), dtype=np.uint32)
 
-    part[i1st[sidx, :] > 0] = 0.
+    for lpos, upos in [(bnds[0], bnds[1]), (bnds[3], bnds[4])]:
 
-    for inum in range(halo):
+        lrow = max(head, int(lpos))
+        urow = min(tail, int(upos))
+        if lrow >= urow:
+            continue
 
-        print("* blending sweep:", inum)
+        # ice within HALO+1 rows of the band, in this quarter
+        lice = max(int(lpos), lrow - halo - 1)
+        uice = min(int(upos), urow + halo + 1)
 
-        part = np.minimum(part, part[npos, :] + 1.)
-        part = np.minimum(part, part[spos, :] + 1.)
-        part = np.minimum(part, part[:, epos] + 1.)
-        part = np.minimum(part, part[:, wpos] + 1.)
+        ice = np.asarray(i1st[lice:uice, :]) > 0
 
-    mask[sidx, :] = part
+        # pad with periodic copies in longitude
+        ice = np.pad(
+            ice, ((0, 0), (halo + 1, halo + 1)), mode="wrap")
 
-    print("* blending NORTH.")
+        part = distance_transform_cdt(~ice, metric="taxicab")
+        part[part < 0] = halo + 1  # no ice at all
 
-    part = mask[nidx, :]
+        dist[lrow - head:urow - head, :] = np.minimum(
+            part[lrow - lice:urow - lice, halo + 1:-halo - 1],
+            halo + 1)
 
-    npos = np.arange(+1, part.shape[0] + 1)
-    epos = np.arange(-1, part.shape[1] - 1)
-    spos = np.arange(-1, part.shape[0] - 1)
-    wpos = np.arange(+1, part.shape[1] + 1)
+    return dist
 
-    Y = part.shape[0]
-    X = part.shape[1]
 
-    npos[npos >= +Y] = Y - 1
-    spos[spos <= -1] = 0
-    epos[epos <= -1] = X - 1
-    wpos[wpos >= +X] = 0
+def blend_mask(i1st, head, tail, halo, sdev):
+    """
+    Mask of linear weights for the rows I1ST[HEAD:TAIL] used
+    to 'blend' two elev. datasets at the ice sheet/shelf front
+    (see BLEND_FRONT). The distance to the front is evaluated
+    with enough halo rows for the Gaussian filter, wrapping
+    periodically at the poles.
 
-    part[i1st[nidx, :] > 0] = 0.
+    """
 
-    for inum in range(halo):
+    nrow = i1st.shape[0]
 
-        print("* blending sweep:", inum)
+    frad = int(4. * sdev + 0.5)  # radius of gaussian_filter
 
-        part = np.minimum(part, part[npos, :] + 1.)
-        part = np.minimum(part, part[spos, :] + 1.)
-        part = np.minimum(part, part[:, epos] + 1.)
-        part = np.minimum(part, part[:, wpos] + 1.)
+    rows = np.arange(head - frad, tail + frad) % nrow
 
-    mask[nidx, :] = part
+    # split the (wrapped) rows into contiguous runs
+    cuts = np.flatnonzero(np.diff(rows) != 1) + 1
 
-    print("* blending final.")
+    dist = np.concatenate([
+        front_distance(i1st, run[0], run[-1] + 1, halo)
+        for run in np.split(rows, cuts)])
 
-    mask /= float(halo + 1.00)
+    dist /= float(halo + 1.00)
 
-    mask = gaussian_filter(mask, sigma=sdev, mode="wrap")
+    mask = gaussian_filter(dist, sigma=sdev, mode="wrap")
+    mask = mask[frad:frad + tail - head, :]
     mask = mask ** 1.50
-    mask[i1st >= 1] = 0.
+    mask[np.asarray(i1st[head:tail, :]) >= 1] = 0.
 
     return mask
 
 
-def rtopo_60sec(elev_path, save_path):
-    """
-    Create a zipped and pixel centred version of RTopo 2.0.4
-    (60 arc-sec) to support remapping of elevation data.
-
+def blend_front(e1st, i1st, e2nd, halo, sdev):
     """
+    Create a mask of linear weights to 'blend' two elev. fun
+    at the ice sheet/shelf front:
 
-    print("Making RTopo-2.0.4 (60 arc-sec) pixel...")
-
-    data = nc.Dataset(os.path.join(
-        elev_path, "RTopo-2.0.4_1min_data.nc"), "r")
-
-    data.set_auto_maskandscale(False)  # quite valid_min/max
-
-    xpos = np.asarray(data["lon"][:], dtype=np.float64)
-    ypos = np.asarray(data["lat"][:], dtype=np.float64)
-
-    elev = np.asarray(
-        data["bedrock_topography"][:], dtype=np.float32)
-    surf = np.asarray(
-        data["surface_elevation"][:], dtype=np.float32)
-    base = np.asarray(
-        data["ice_base_topography"][:], dtype=np.float32)
-
-    elev = (elev[:-1:, :-1:] + elev[+1::, :-1:] +
-            elev[:-1:, +1::] + elev[+1::, +1::]) / 4.
-
-    surf = (surf[:-1:, :-1:] + surf[+1::, :-1:] +
-            surf[:-1:, +1::] + surf[+1::, +1::]) / 4.
-
-    base = (base[:-1:, :-1:] + base[+1::, :-1:] +
-            base[:-1:, +1::] + base[+1::, +1::]) / 4.
-
-    elev = np.asarray(np.round(elev), dtype=np.int16)
-    surf = np.asarray(np.round(surf), dtype=np.int16)
-    base = np.asarray(np.round(base), dtype=np.int16)
-
-    iceh = surf - base
-    iceh[base == 0] = 0
-
-    ocnh = np.maximum(0, base - elev)
+        ELEV = (1.-MASK) * E1ST + (0.+MASK) * E2ND
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "RTopo_2_0_4_60sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "A zipped RTopo-2.0.4 (60 arc-sec) " + \
-        "data-set, pixel centred and compressed to int16_t."
-    root.source = "RTopo-2.0.4_1min_data.nc"
-    root.references = "doi.pangaea.de/10.1594/PANGAEA.905295"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    Elev. data assoc. with the 1st data-set is preserved in
+    pixels where ice-thickness is non-zero. The two datasets
+    are blended over a distance of approx. HALO pixels. The
+    mask is additionally smoothed via a Gaussian filter with
+    standard-deviation sigma=SDEV.
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
+    """
 
-    root.close()
+    return blend_mask(i1st, 0, i1st.shape[0], halo, sdev)
 
 
-def rtopo_30sec(elev_path, save_path):
+def map_bands(func, args, nrow, workers):
     """
-    Create a zipped and pixel centred version of RTopo 2.0.4
-    (30 arc-sec) to support remapping of elevation data.
+    Eval. FUNC(*ARGS, HEAD, TAIL) for bands of BAND_ROWS rows
+    of output pixels, yielding (HEAD, TAIL, RESULT) in order.
+    Bands are processed by a pool of WORKERS processes, with
+    only a few bands in memory at once.
 
     """
 
-    print("Making RTopo-2.0.4 (30 arc-sec) pixel...")
-
-    data = nc.Dataset(os.path.join(
-        elev_path,
-        "RTopo-2.0.4_30sec_bedrock_topography.nc"), "r")
-
-    data.set_auto_maskandscale(False)  # quite valid_min/max
-
-    xpos = np.asarray(data["lon"][:], dtype=np.float64)
-    ypos = np.asarray(data["lat"][:], dtype=np.float64)
-
-    elev = np.asarray(
-        data["bedrock_topography"][:], dtype=np.float32)
-
-    data = nc.Dataset(os.path.join(
-        elev_path,
-        "RTopo-2.0.4_30sec_surface_elevation.nc"), "r")
+    bands = [(head, min(head + BAND_ROWS, nrow))
+             for head in range(0, nrow, BAND_ROWS)]
 
-    data.set_auto_maskandscale(False)  # quite valid_min/max
+    if workers <= 1:
+        for head, tail in bands:
+            yield head, tail, func(*args, head, tail)
+        return
 
-    surf = np.asarray(
-        data["surface_elevation"][:], dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for head, tail in bands:
+            futures.append((head, tail, executor.submit(
+                func, *args, head, tail)))
 
-    data = nc.Dataset(os.path.join(
-        elev_path,
-        "RTopo-2.0.4_30sec_ice_base_topography.nc"), "r")
+            if len(futures) > workers:
+                head, tail, future = futures.pop(0)
+                yield head, tail, future.result()
 
-    data.set_auto_maskandscale(False)  # quite valid_min/max
+        for head, tail, future in futures:
+            yield head, tail, future.result()
 
-    base = np.asarray(
-        data["ice_base_topography"][:], dtype=np.float32)
 
-    elev = (elev[:-1:, :-1:] + elev[+1::, :-1:] +
-            elev[:-1:, +1::] + elev[+1::, +1::]) / 4.
-
-    surf = (surf[:-1:, :-1:] + surf[+1::, :-1:] +
-            surf[:-1:, +1::] + surf[+1::, +1::]) / 4.
-
-    base = (base[:-1:, :-1:] + base[+1::, :-1:] +
-            base[:-1:, +1::] + base[+1::, +1::]) / 4.
-
-    elev = np.asarray(np.round(elev), dtype=np.int16)
-    surf = np.asarray(np.round(surf), dtype=np.int16)
-    base = np.asarray(np.round(base), dtype=np.int16)
-
-    iceh = surf - base
-    iceh[base == 0] = 0
+def save_pixel(filename, xpos, ypos, names, func, args, workers,
+               attrs=None):
+    """
+    Write a zipped and pixel centred DEM with int16 fields
+    NAMES to FILENAME, band-by-band. FUNC(*ARGS, HEAD, TAIL)
+    returns the fields for the rows HEAD:TAIL of pixels.
 
-    ocnh = np.maximum(0, base - elev)
+    """
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "RTopo_2_0_4_30sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "A zipped RTopo-2.0.4 (30 arc-sec) " + \
-        "data-set, pixel centred and compressed to int16_t."
-    root.source = "RTopo-2.0.4_30sec_data.nc"
-    root.references = "doi.pangaea.de/10.1594/PANGAEA.905295"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    root = nc.Dataset(filename, "w", format="NETCDF4")
+    if attrs is not None:
+        root.setncatts(attrs)
+    root.createDimension("num_lon", xpos.size)
+    root.createDimension("num_col", xpos.size - 1)
+    root.createDimension("num_lat", ypos.size)
+    root.createDimension("num_row", ypos.size - 1)
 
     data = root.createVariable("lon", "f8", ("num_lon"))
     data.units = "degrees_east"
@@ -262,158 +171,109 @@ def rtopo_30sec(elev_path, save_path):
     data = root.createVariable("lat", "f8", ("num_lat"))
     data.units = "degrees_north"
     data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
+
+    for name in names:
+        data = root.createVariable(
+            name, "i2", ("num_row", "num_col"), zlib=True)
+        data.units = "m"
+
+    for head, tail, vals in map_bands(
+            func, args, ypos.size - 1, workers):
+        print("* written rows:", tail, "of", ypos.size - 1)
+        for name, data in zip(names, vals):
+            root[name][head:tail, :] = data
 
     root.close()
 
 
-def srtmp_60sec(elev_path, save_path):
+def rtopo_band(elev_file, surf_file, base_file, head, tail):
     """
-    Create a zipped and pixel centred version of SRTM15+V2.1
-    (15 arc-sec) at 60 arc-sec.
+    Pixel centred RTopo fields for the rows HEAD:TAIL, as the
+    average of the 2 x 2 stencil of nodes about each pixel.
 
     """
 
-    print("Making SRTM15+V2.1 (60 arc-sec) pixel...")
+    vals = []
+    for name, path in [("bedrock_topography", elev_file),
+                       ("surface_elevation", surf_file),
+                       ("ice_base_topography", base_file)]:
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "SRTM15+V2.1.nc"), "r")
+        data = nc.Dataset(path, "r")
+        data.set_auto_maskandscale(False)  # quite valid_min/max
 
-    elev = np.asarray(data["z"][:], dtype=np.float32)
+        fval = np.asarray(
+            data[name][head:tail + 1, :], dtype=np.float32)
 
-    halo = 4
-    z_60 = np.zeros((10800, 21600), dtype=np.float32)
+        data.close()
 
-    for ipos in range(halo):
-        for jpos in range(halo):
-            iend = elev.shape[0] - halo + ipos + 1
-            jend = elev.shape[1] - halo + jpos + 1
-            z_60 += elev[ipos:iend:halo, jpos:jend:halo]
+        fval = (fval[:-1:, :-1:] + fval[+1::, :-1:] +
+                fval[:-1:, +1::] + fval[+1::, +1::]) / 4.
 
-    elev = np.asarray(
-        np.round(z_60 / float(halo ** 2)), dtype=np.int16)
+        vals.append(np.asarray(np.round(fval), dtype=np.int16))
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
+    elev, surf, base = vals
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "SRTM15+V2.1_60sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    iceh = surf - base
+    iceh[base == 0] = 0
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "top_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
+    ocnh = np.maximum(0, base - elev)
 
-    root.close()
+    return elev, iceh, ocnh
 
 
-def srtmp_30sec(elev_path, save_path):
+def coarsen_band(elev_file, name, halo, head, tail):
     """
-    Create a zipped and pixel centred version of SRTM15+V2.1
-    (15 arc-sec) at 30 arc-sec.
+    The field NAME averaged over blocks of HALO x HALO pixels
+    for the rows HEAD:TAIL of the coarsened DEM.
 
     """
 
-    print("Making SRTM15+V2.1 (30 arc-sec) pixel...")
-
-    data = nc.Dataset(os.path.join(
-        elev_path, "SRTM15+V2.1.nc"), "r")
+    data = nc.Dataset(elev_file, "r")
 
-    elev = np.asarray(data["z"][:], dtype=np.float32)
-
-    halo = 2
-    z_30 = np.zeros((21600, 43200), dtype=np.float32)
-
-    for ipos in range(halo):
-        for jpos in range(halo):
-            iend = elev.shape[0] - halo + ipos + 1
-            jend = elev.shape[1] - halo + jpos + 1
-            z_30 += elev[ipos:iend:halo, jpos:jend:halo]
+    ncol = data[name].shape[1] // halo
 
     elev = np.asarray(
-        np.round(z_30 / float(halo ** 2)), dtype=np.int16)
+        data[name][head * halo:tail * halo, :ncol * halo],
+        dtype=np.float32)
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
+    data.close()
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "SRTM15+V2.1_30sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    elev = np.reshape(elev, (tail - head, halo, ncol, halo))
+    elev = np.sum(elev, axis=(1, 3), dtype=np.float64)
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "top_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-
-    root.close()
+    return [np.asarray(
+        np.round(elev / float(halo ** 2)), dtype=np.int16)]
 
 
-def rtopo_srtmp_60sec(elev_path, save_path):
+def blend_band(rtopo_file, elev_file, halo, sdev, head, tail):
     """
-    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
-    and SRTM15+V2.1 at 60 arc-sec.
+    Blend pixel centred RTopo and 'top_elevation' fields for
+    the rows HEAD:TAIL, using RTopo data under ice sheets and
+    shelves.
 
     """
 
-    print("Making RTopo-SRTM+ (60 arc-sec) blend...")
-
-    data = nc.Dataset(os.path.join(
-        elev_path, "RTopo_2_0_4_60sec_pixel.nc"), "r")
+    data = nc.Dataset(rtopo_file, "r")
 
     e1st = np.asarray(
-        data["bed_elevation"][:], dtype=np.int16)
+        data["bed_elevation"][head:tail, :], dtype=np.int16)
 
     i1st = np.asarray(
-        data["ice_thickness"][:], dtype=np.int16)
+        data["ice_thickness"][head:tail, :], dtype=np.int16)
 
     o1st = np.asarray(
-        data["ocn_thickness"][:], dtype=np.int16)
+        data["ocn_thickness"][head:tail, :], dtype=np.int16)
+
+    mask = blend_mask(data["ice_thickness"], head, tail, halo, sdev)
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "SRTM15+V2.1_60sec_pixel.nc"), "r")
+    data.close()
+
+    data = nc.Dataset(elev_file, "r")
 
     e2nd = np.asarray(
-        data["top_elevation"][:], dtype=np.int16)
+        data["top_elevation"][head:tail, :], dtype=np.int16)
 
-    mask = blend_front(e1st, i1st, e2nd, halo=20, sdev=2.0)
+    data.close()
 
     elev = np.asarray(np.round(
         (1. - mask) * e1st + mask * e2nd), dtype=np.int16)
@@ -422,402 +282,266 @@ def rtopo_srtmp_60sec(elev_path, save_path):
     ocnh = o1st
     ocnh[i1st == 0] = np.maximum(0, -elev[i1st == 0])
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
-
-    root = nc.Dataset(
-        os.path.join(save_path,
-                     "RTopo_2_0_4_SRTM15+V2_1_60sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "Blend of RTopo-2.0.4 (60 arc-sec) " + \
-        "and SRTM15+V2.1 (60 arc-sec) - pixel centred and " + \
-        "compressed to int16_t. RTopo data used under ice " + \
-        "sheets/shelves."
-    root.source = \
-        "RTopo-2.0.4_1min_data.nc and SRTM15+V2.1.nc"
-    root.references = \
-        "doi.pangaea.de/10.1594/PANGAEA.905295 and " + \
-        "doi.org/10.1029/2019EA000658"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
-
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
-
-    root.close()
+    return elev, iceh, ocnh
 
 
-def rtopo_srtmp_30sec(elev_path, save_path):
+def rtopo_pixel(elev_path, save_path, files, save_file, attrs,
+                workers):
     """
-    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
-    and SRTM15+V2.1 at 30 arc-sec.
+    Create a zipped and pixel centred version of RTopo 2.0.4
+    from the bedrock, surface and ice-base FILES.
 
     """
 
-    print("Making RTopo-SRTM+ (30 arc-sec) blend...")
+    data = nc.Dataset(os.path.join(elev_path, files[0]), "r")
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "RTopo_2_0_4_30sec_pixel.nc"), "r")
+    xpos = np.asarray(data["lon"][:], dtype=np.float64)
+    ypos = np.asarray(data["lat"][:], dtype=np.float64)
 
-    e1st = np.asarray(
-        data["bed_elevation"][:], dtype=np.int16)
+    data.close()
 
-    i1st = np.asarray(
-        data["ice_thickness"][:], dtype=np.int16)
+    save_pixel(
+        os.path.join(save_path, save_file), xpos, ypos,
+        RTOPO_FIELDS, rtopo_band,
+        [os.path.join(elev_path, name) for name in files],
+        workers, attrs)
 
-    o1st = np.asarray(
-        data["ocn_thickness"][:], dtype=np.int16)
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "SRTM15+V2.1_30sec_pixel.nc"), "r")
+def coarsen_pixel(elev_path, save_path, elev_file, name, halo,
+                  save_file, workers):
+    """
+    Create a zipped and pixel centred version of the global
+    DEM ELEV_FILE, averaged over blocks of HALO x HALO pixels.
 
-    e2nd = np.asarray(
-        data["top_elevation"][:], dtype=np.int16)
+    """
 
-    mask = blend_front(e1st, i1st, e2nd, halo=40, sdev=4.0)
+    data = nc.Dataset(os.path.join(elev_path, elev_file), "r")
 
-    elev = np.asarray(np.round(
-        (1. - mask) * e1st + mask * e2nd), dtype=np.int16)
+    nrow = data[name].shape[0] // halo
+    ncol = data[name].shape[1] // halo
 
-    iceh = i1st
-    ocnh = o1st
-    ocnh[i1st == 0] = np.maximum(0, -elev[i1st == 0])
+    data.close()
 
     xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
+        -180., +180., ncol + 1, dtype=np.float64)
     ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
-
-    root = nc.Dataset(
-        os.path.join(save_path,
-                     "RTopo_2_0_4_SRTM15+V2_1_30sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "Blend of RTopo-2.0.4 (30 arc-sec) " + \
-        "and SRTM15+V2.1 (30 arc-sec) - pixel centred and " + \
-        "compressed to int16_t. RTopo data used under ice " + \
-        "sheets/shelves."
-    root.source = \
-        "RTopo-2.0.4_30sec_data.nc and SRTM15+V2.1.nc"
-    root.references = \
-        "doi.pangaea.de/10.1594/PANGAEA.905295 and " + \
-        "doi.org/10.1029/2019EA000658"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
-
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
+        -90.0, +90.0, nrow + 1, dtype=np.float64)
 
-    root.close()
+    save_pixel(
+        os.path.join(save_path, save_file), xpos, ypos,
+        ["top_elevation"], coarsen_band,
+        [os.path.join(elev_path, elev_file), name, halo],
+        workers)
 
 
-def gebco_60sec(elev_path, save_path):
+def blend_pixel(elev_path, save_path, rtopo_file, elev_file,
+                halo, sdev, save_file, attrs, workers):
     """
-    Create a zipped and pixel centred version of GEBCO[2020]
-    (15 arc-sec) at 60 arc-sec.
+    Create a zipped and pixel centred 'blend' of the pixel
+    centred RTopo data and another pixel centred DEM.
 
     """
 
-    print("Making GEBCO[2020] (60 arc-sec) pixel...")
+    data = nc.Dataset(os.path.join(elev_path, rtopo_file), "r")
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "GEBCO_2020.nc"), "r")
+    nrow, ncol = data["bed_elevation"].shape
 
-    elev = np.asarray(
-        data["elevation"][:], dtype=np.float32)
+    data.close()
 
-    halo = 4
-    z_60 = np.zeros((10800, 21600), dtype=np.float32)
+    xpos = np.linspace(
+        -180., +180., ncol + 1, dtype=np.float64)
+    ypos = np.linspace(
+        -90.0, +90.0, nrow + 1, dtype=np.float64)
 
-    for ipos in range(halo):
-        for jpos in range(halo):
-            iend = elev.shape[0] - halo + ipos + 1
-            jend = elev.shape[1] - halo + jpos + 1
-            z_60 += elev[ipos:iend:halo, jpos:jend:halo]
+    save_pixel(
+        os.path.join(save_path, save_file), xpos, ypos,
+        RTOPO_FIELDS, blend_band,
+        [os.path.join(elev_path, rtopo_file),
+         os.path.join(elev_path, elev_file), halo, sdev],
+        workers, attrs)
 
-    elev = np.asarray(
-        np.round(z_60 / float(halo ** 2)), dtype=np.int16)
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
+def rtopo_60sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred version of RTopo 2.0.4
+    (60 arc-sec) to support remapping of elevation data.
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "GEBCO_v2020_60sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    """
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "top_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
+    print("Making RTopo-2.0.4 (60 arc-sec) pixel...")
 
-    root.close()
+    rtopo_pixel(
+        elev_path, save_path, ["RTopo-2.0.4_1min_data.nc"] * 3,
+        "RTopo_2_0_4_60sec_pixel.nc",
+        {"description": "A zipped RTopo-2.0.4 (60 arc-sec) "
+                        "data-set, pixel centred and compressed "
+                        "to int16_t.",
+         "source": "RTopo-2.0.4_1min_data.nc",
+         "references": RTOPO_REFS}, workers)
 
 
-def gebco_30sec(elev_path, save_path):
+def rtopo_30sec(elev_path, save_path, workers=1):
     """
-    Create a zipped and pixel centred version of GEBCO[2020]
-    (15 arc-sec) at 30 arc-sec.
+    Create a zipped and pixel centred version of RTopo 2.0.4
+    (30 arc-sec) to support remapping of elevation data.
 
     """
 
-    print("Making GEBCO[2020] (30 arc-sec) pixel...")
+    print("Making RTopo-2.0.4 (30 arc-sec) pixel...")
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "GEBCO_2020.nc"), "r")
+    rtopo_pixel(
+        elev_path, save_path,
+        ["RTopo-2.0.4_30sec_bedrock_topography.nc",
+         "RTopo-2.0.4_30sec_surface_elevation.nc",
+         "RTopo-2.0.4_30sec_ice_base_topography.nc"],
+        "RTopo_2_0_4_30sec_pixel.nc",
+        {"description": "A zipped RTopo-2.0.4 (30 arc-sec) "
+                        "data-set, pixel centred and compressed "
+                        "to int16_t.",
+         "source": "RTopo-2.0.4_30sec_data.nc",
+         "references": RTOPO_REFS}, workers)
 
-    elev = np.asarray(
-        data["elevation"][:], dtype=np.float32)
 
-    halo = 2
-    z_30 = np.zeros((21600, 43200), dtype=np.float32)
+def srtmp_60sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred version of SRTM15+V2.1
+    (15 arc-sec) at 60 arc-sec.
 
-    for ipos in range(halo):
-        for jpos in range(halo):
-            iend = elev.shape[0] - halo + ipos + 1
-            jend = elev.shape[1] - halo + jpos + 1
-            z_30 += elev[ipos:iend:halo, jpos:jend:halo]
+    """
 
-    elev = np.asarray(
-        np.round(z_30 / float(halo ** 2)), dtype=np.int16)
+    print("Making SRTM15+V2.1 (60 arc-sec) pixel...")
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
+    coarsen_pixel(
+        elev_path, save_path, "SRTM15+V2.1.nc", "z", 4,
+        "SRTM15+V2.1_60sec_pixel.nc", workers)
 
-    root = nc.Dataset(
-        os.path.join(
-            save_path, "GEBCO_v2020_30sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "top_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
+def srtmp_30sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred version of SRTM15+V2.1
+    (15 arc-sec) at 30 arc-sec.
 
-    root.close()
+    """
+
+    print("Making SRTM15+V2.1 (30 arc-sec) pixel...")
 
+    coarsen_pixel(
+        elev_path, save_path, "SRTM15+V2.1.nc", "z", 2,
+        "SRTM15+V2.1_30sec_pixel.nc", workers)
 
-def rtopo_gebco_60sec(elev_path, save_path):
+
+def rtopo_srtmp_60sec(elev_path, save_path, workers=1):
     """
     Create a zipped and pixel centred 'blend' of RTopo 2.0.4
-    and GEBCO[2020] at 60 arc-sec.
+    and SRTM15+V2.1 at 60 arc-sec.
 
     """
 
-    print("Making RTopo-GEBCO (60 arc-sec) blend...")
+    print("Making RTopo-SRTM+ (60 arc-sec) blend...")
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "RTopo_2_0_4_60sec_pixel.nc"), "r")
+    blend_pixel(
+        elev_path, save_path, "RTopo_2_0_4_60sec_pixel.nc",
+        "SRTM15+V2.1_60sec_pixel.nc", 20, 2.0,
+        "RTopo_2_0_4_SRTM15+V2_1_60sec_pixel.nc",
+        {"description": "Blend of RTopo-2.0.4 (60 arc-sec) "
+                        "and SRTM15+V2.1 (60 arc-sec) - pixel "
+                        "centred and compressed to int16_t. RTopo "
+                        "data used under ice sheets/shelves.",
+         "source": "RTopo-2.0.4_1min_data.nc and SRTM15+V2.1.nc",
+         "references": f"{RTOPO_REFS} and {SRTMP_REFS}"}, workers)
 
-    e1st = np.asarray(
-        data["bed_elevation"][:], dtype=np.int16)
 
-    i1st = np.asarray(
-        data["ice_thickness"][:], dtype=np.int16)
-
-    o1st = np.asarray(
-        data["ocn_thickness"][:], dtype=np.int16)
+def rtopo_srtmp_30sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
+    and SRTM15+V2.1 at 30 arc-sec.
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "GEBCO_v2020_60sec_pixel.nc"), "r")
+    """
 
-    e2nd = np.asarray(
-        data["top_elevation"][:], dtype=np.int16)
+    print("Making RTopo-SRTM+ (30 arc-sec) blend...")
 
-    mask = blend_front(e1st, i1st, e2nd, halo=20, sdev=2.0)
+    blend_pixel(
+        elev_path, save_path, "RTopo_2_0_4_30sec_pixel.nc",
+        "SRTM15+V2.1_30sec_pixel.nc", 40, 4.0,
+        "RTopo_2_0_4_SRTM15+V2_1_30sec_pixel.nc",
+        {"description": "Blend of RTopo-2.0.4 (30 arc-sec) "
+                        "and SRTM15+V2.1 (30 arc-sec) - pixel "
+                        "centred and compressed to int16_t. RTopo "
+                        "data used under ice sheets/shelves.",
+         "source": "RTopo-2.0.4_30sec_data.nc and SRTM15+V2.1.nc",
+         "references": f"{RTOPO_REFS} and {SRTMP_REFS}"}, workers)
 
-    elev = np.asarray(np.round(
-        (1. - mask) * e1st + mask * e2nd), dtype=np.int16)
 
-    iceh = i1st
-    ocnh = o1st
-    ocnh[i1st == 0] = np.maximum(0, -elev[i1st == 0])
+def gebco_60sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred version of GEBCO[2020]
+    (15 arc-sec) at 60 arc-sec.
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
-
-    root = nc.Dataset(
-        os.path.join(save_path,
-                     "RTopo_2_0_4_GEBCO_v2020_60sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "Blend of RTopo-2.0.4 (60 arc-sec) " + \
-        "and GEBCO[2020] (15 arc-sec) - pixel centred and " + \
-        "compressed to int16_t. RTopo data used under ice " + \
-        "sheets/shelves. Remapped to 60 arc-sec."
-    root.source = \
-        "RTopo-2.0.4_1min_data.nc and GEBCO_2020.nc"
-    root.references = \
-        "doi.pangaea.de/10.1594/PANGAEA.905295 and " + \
-        "doi.org/10.5285/a29c5465-b138-234d-e053-6c86abc040b9"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    """
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
+    print("Making GEBCO[2020] (60 arc-sec) pixel...")
 
-    root.close()
+    coarsen_pixel(
+        elev_path, save_path, "GEBCO_2020.nc", "elevation", 4,
+        "GEBCO_v2020_60sec_pixel.nc", workers)
 
 
-def rtopo_gebco_30sec(elev_path, save_path):
+def gebco_30sec(elev_path, save_path, workers=1):
     """
-    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
-    and GEBCO[2020] at 30 arc-sec.
+    Create a zipped and pixel centred version of GEBCO[2020]
+    (15 arc-sec) at 30 arc-sec.
 
     """
 
-    print("Making RTopo-GEBCO (30 arc-sec) blend...")
+    print("Making GEBCO[2020] (30 arc-sec) pixel...")
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "RTopo_2_0_4_30sec_pixel.nc"), "r")
+    coarsen_pixel(
+        elev_path, save_path, "GEBCO_2020.nc", "elevation", 2,
+        "GEBCO_v2020_30sec_pixel.nc", workers)
 
-    e1st = np.asarray(
-        data["bed_elevation"][:], dtype=np.int16)
-
-    i1st = np.asarray(
-        data["ice_thickness"][:], dtype=np.int16)
 
-    o1st = np.asarray(
-        data["ocn_thickness"][:], dtype=np.int16)
+def rtopo_gebco_60sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
+    and GEBCO[2020] at 60 arc-sec.
 
-    data = nc.Dataset(os.path.join(
-        elev_path, "GEBCO_v2020_30sec_pixel.nc"), "r")
+    """
 
-    e2nd = np.asarray(
-        data["top_elevation"][:], dtype=np.int16)
+    print("Making RTopo-GEBCO (60 arc-sec) blend...")
 
-    mask = blend_front(e1st, i1st, e2nd, halo=40, sdev=4.0)
+    blend_pixel(
+        elev_path, save_path, "RTopo_2_0_4_60sec_pixel.nc",
+        "GEBCO_v2020_60sec_pixel.nc", 20, 2.0,
+        "RTopo_2_0_4_GEBCO_v2020_60sec_pixel.nc",
+        {"description": "Blend of RTopo-2.0.4 (60 arc-sec) "
+                        "and GEBCO[2020] (15 arc-sec) - pixel "
+                        "centred and compressed to int16_t. RTopo "
+                        "data used under ice sheets/shelves. "
+                        "Remapped to 60 arc-sec.",
+         "source": "RTopo-2.0.4_1min_data.nc and GEBCO_2020.nc",
+         "references": f"{RTOPO_REFS} and {GEBCO_REFS}"}, workers)
 
-    elev = np.asarray(np.round(
-        (1. - mask) * e1st + mask * e2nd), dtype=np.int16)
 
-    iceh = i1st
-    ocnh = o1st
-    ocnh[i1st == 0] = np.maximum(0, -elev[i1st == 0])
+def rtopo_gebco_30sec(elev_path, save_path, workers=1):
+    """
+    Create a zipped and pixel centred 'blend' of RTopo 2.0.4
+    and GEBCO[2020] at 30 arc-sec.
 
-    xpos = np.linspace(
-        -180., +180., elev.shape[1] + 1, dtype=np.float64)
-    ypos = np.linspace(
-        -90.0, +90.0, elev.shape[0] + 1, dtype=np.float64)
-
-    root = nc.Dataset(
-        os.path.join(save_path,
-                     "RTopo_2_0_4_GEBCO_v2020_30sec_pixel.nc"),
-        "w", format="NETCDF4")
-    root.description = "Blend of RTopo-2.0.4 (30 arc-sec) " + \
-        "and GEBCO[2020] (15 arc-sec) - pixel centred and " + \
-        "compressed to int16_t. RTopo data used under ice " + \
-        "sheets/shelves. Remapped to 30 arc-sec."
-    root.source = \
-        "RTopo-2.0.4_30sec_data.nc and GEBCO_2020.nc"
-    root.references = \
-        "doi.pangaea.de/10.1594/PANGAEA.905295 and " + \
-        "doi.org/10.5285/a29c5465-b138-234d-e053-6c86abc040b9"
-    root.createDimension("num_lon", elev.shape[1] + 1)
-    root.createDimension("num_col", elev.shape[1])
-    root.createDimension("num_lat", elev.shape[0] + 1)
-    root.createDimension("num_row", elev.shape[0])
+    """
 
-    data = root.createVariable("lon", "f8", ("num_lon"))
-    data.units = "degrees_east"
-    data[:] = xpos
-    data = root.createVariable("lat", "f8", ("num_lat"))
-    data.units = "degrees_north"
-    data[:] = ypos
-    data = root.createVariable(
-        "bed_elevation", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = elev
-    data = root.createVariable(
-        "ice_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = iceh
-    data = root.createVariable(
-        "ocn_thickness", "i2", ("num_row", "num_col"))
-    data.units = "m"
-    data[:, :] = ocnh
+    print("Making RTopo-GEBCO (30 arc-sec) blend...")
 
-    root.close()
+    blend_pixel(
+        elev_path, save_path, "RTopo_2_0_4_30sec_pixel.nc",
+        "GEBCO_v2020_30sec_pixel.nc", 40, 4.0,
+        "RTopo_2_0_4_GEBCO_v2020_30sec_pixel.nc",
+        {"description": "Blend of RTopo-2.0.4 (30 arc-sec) "
+                        "and GEBCO[2020] (15 arc-sec) - pixel "
+                        "centred and compressed to int16_t. RTopo "
+                        "data used under ice sheets/shelves. "
+                        "Remapped to 30 arc-sec.",
+         "source": "RTopo-2.0.4_30sec_data.nc and GEBCO_2020.nc",
+         "references": f"{RTOPO_REFS} and {GEBCO_REFS}"}, workers)
 
 
 if (__name__ == "__main__"):
@@ -835,26 +559,32 @@ if (__name__ == "__main__"):
         required=False,
         default="", help="Path to store output data.")
 
-    parser.parse_args()
-    elev_path = parser.elev_path
-    save_path = parser.save_path
+    parser.add_argument(
+        "--workers", dest="workers", type=int,
+        required=False,
+        default=1, help="No. of processes to use.")
+
+    args = parser.parse_args()
+    elev_path = args.elev_path
+    save_path = args.save_path
+    workers = args.workers
 
-    rtopo_60sec(elev_path, save_path)
-    rtopo_30sec(elev_path, save_path)
+    rtopo_60sec(elev_path, save_path, workers)
+    rtopo_30sec(elev_path, save_path, workers)
 
     """
     SRTM15+V2.1 data seems to include high-freq 'noise'
     near coastlines, so don't use for now...
 
-    srtmp_60sec(elev_path, save_path)
-    srtmp_30sec(elev_path, save_path)
+    srtmp_60sec(elev_path, save_path, workers)
+    srtmp_30sec(elev_path, save_path, workers)
 
-    rtopo_srtmp_60sec(elev_path, save_path)
-    rtopo_srtmp_30sec(elev_path, save_path)
+    rtopo_srtmp_60sec(elev_path, save_path, workers)
+    rtopo_srtmp_30sec(elev_path, save_path, workers)
     """
 
-    gebco_60sec(elev_path, save_path)
-    gebco_30sec(elev_path, save_path)
+    gebco_60sec(elev_path, save_path, workers)
+    gebco_30sec(elev_path, save_path, workers)
 
-    rtopo_gebco_60sec(elev_path, save_path)
-    rtopo_gebco_30sec(elev_path, save_path)
+    rtopo_gebco_60sec(elev_path, save_path, workers)
+    rtopo_gebco_30sec(elev_path, save_path, workers)
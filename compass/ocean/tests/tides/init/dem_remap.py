@@ -1,13 +1,24 @@
 
+import hashlib
+import os
+import shutil
+import tempfile
 import time
+import threading
 import numpy as np
 import netCDF4 as nc
+from concurrent.futures import ThreadPoolExecutor
 from scipy import spatial
-from scipy.sparse import csr_matrix
 import argparse
 
 # Authors: Darren Engwirda
 
+# the fields remapped from the DEM to the mesh
+FIELDS = ["bed_elevation", "ocn_thickness", "ice_thickness"]
+
+# approx. bytes of memory needed per DEM pixel in a tile
+BYTES_PER_PIXEL = 128
+
 
 def map_to_r3(mesh, xlon, ylat, head, tail):
     """
@@ -16,6 +27,16 @@ def map_to_r3(mesh, xlon, ylat, head, tail):
 
     """
 
+    return sphere_to_r3(mesh.sphere_radius, xlon, ylat, head, tail)
+
+
+def sphere_to_r3(rsph, xlon, ylat, head, tail):
+    """
+    Map lon-lat coordinates to XYZ points on a sphere of
+    radius RSPH. Restricted to the panel LAT[HEAD:TAIL].
+
+    """
+
     sinx = np.sin(xlon * np.pi / 180.)
     cosx = np.cos(xlon * np.pi / 180.)
     siny = np.sin(ylat * np.pi / 180.)
@@ -24,8 +45,6 @@ def map_to_r3(mesh, xlon, ylat, head, tail):
     sinu, sinv = np.meshgrid(sinx, siny[head:tail])
     cosu, cosv = np.meshgrid(cosx, cosy[head:tail])
 
-    rsph = mesh.sphere_radius
-
     xpos = rsph * cosu * cosv
     ypos = rsph * sinu * cosv
     zpos = rsph * sinv
@@ -77,6 +96,18 @@ def circ_dist(rs, pa, pb):
 
 def find_vals(xlon, ylat, vals, xpos, ypos):
 
+    irow, icol = find_pixels(xlon, ylat, xpos, ypos)
+
+    return vals[irow, icol]
+
+
+def find_pixels(xlon, ylat, xpos, ypos):
+    """
+    Find the (row, col) indices of the DEM pixels containing
+    the lon-lat points [XPOS, YPOS].
+
+    """
+
     cols = xlon.size - 1
     rows = ylat.size - 1
 
@@ -89,7 +120,7 @@ def find_vals(xlon, ylat, vals, xpos, ypos):
     icol = np.asarray(icol, dtype=np.uint32)
     irow = np.asarray(irow, dtype=np.uint32)
 
-    return vals[irow, icol]
+    return irow, icol
 
 
 def cell_quad(mesh, xlon, ylat, vals):
@@ -100,13 +131,20 @@ def cell_quad(mesh, xlon, ylat, vals):
 
     """
 
-    class base:
-        pass
+    pcel, pvrt = cell_and_vert_lonlat(mesh)
+
+    fcel = find_vals(xlon, ylat, vals, pcel[:, 0], pcel[:, 1])
+    fvrt = find_vals(xlon, ylat, vals, pvrt[:, 0], pvrt[:, 1])
+
+    return cell_quad_vals(mesh, [fcel], [fvrt])[0]
 
-    abar = np.zeros(
-        (mesh.dimensions["nCells"].size, 1), dtype=np.float32)
-    fbar = np.zeros(
-        (mesh.dimensions["nCells"].size, 1), dtype=np.float32)
+
+def cell_and_vert_lonlat(mesh):
+    """
+    Lon-lat coordinates (in degrees, with lon in [-180, 180])
+    of mesh cells and vertices.
+
+    """
 
     pcel = np.zeros(
         (mesh.dimensions["nCells"].size, 2), dtype=np.float64)
@@ -116,10 +154,6 @@ def cell_quad(mesh, xlon, ylat, vals):
     pcel = pcel * 180. / np.pi
     pcel[pcel[:, 0] > 180., 0] -= 360.
 
-    fcel = find_vals(xlon, ylat, vals, pcel[:, 0], pcel[:, 1])
-
-    pcel = pcel * np.pi / 180.
-
     pvrt = np.zeros(
         (mesh.dimensions["nVertices"].size, 2),
         dtype=np.float64)
@@ -129,8 +163,24 @@ def cell_quad(mesh, xlon, ylat, vals):
     pvrt = pvrt * 180. / np.pi
     pvrt[pvrt[:, 0] > 180., 0] -= 360.
 
-    fvrt = find_vals(xlon, ylat, vals, pvrt[:, 0], pvrt[:, 1])
+    return pcel, pvrt
+
+
+def cell_quad_geom(mesh):
+    """
+    Split mesh cells into triangles [CELL, VERT, VERT] for the
+    quadrature rule in CELL_QUAD_VALS. Returns a list with the
+    (cell, vert, vert) indices and areas of the triangles for
+    each edge position in the cells.
+
+    """
 
+    class base:
+        pass
+
+    pcel, pvrt = cell_and_vert_lonlat(mesh)
+
+    pcel = pcel * np.pi / 180.
     pvrt = pvrt * np.pi / 180.
 
     cell = base()
@@ -143,6 +193,9 @@ def cell_quad(mesh, xlon, ylat, vals):
     edge.vert = np.asarray(
         mesh.variables["verticesOnEdge"][:], dtype=np.int32)
 
+    rsph = mesh.sphere_radius
+
+    geom = []
     for epos in range(np.max(cell.topo)):
 
         mask = cell.topo > epos
@@ -154,24 +207,175 @@ def cell_quad(mesh, xlon, ylat, vals):
         ivrt = edge.vert[ifac, 0] - 1
         jvrt = edge.vert[ifac, 1] - 1
 
-        rsph = mesh.sphere_radius
-
         atri = tria_area(
             rsph, pcel[icel], pvrt[ivrt], pvrt[jvrt])
 
-        atri = np.reshape(atri, (atri.size, 1))
+        geom.append((icel, ivrt, jvrt, atri))
+
+    return geom
 
-        ftri = (fcel[icel] + fvrt[ivrt] + fvrt[jvrt])
 
-        ftri = np.reshape(ftri, (ftri.size, 1))
+def cell_quad_vals(mesh, fcel_list, fvrt_list, geom=None):
+    """
+    Eval. finite-volume integrals for mesh cells, given the
+    values of several fields at cells and vertices. Triangle
+    areas are computed once (or taken from GEOM, as returned
+    by CELL_QUAD_GEOM) and reused for all fields.
+
+    """
+
+    ncel = mesh.dimensions["nCells"].size
+
+    abar = np.zeros((ncel, 1), dtype=np.float32)
+    fbar_list = [np.zeros((ncel, 1), dtype=np.float32)
+                 for fcel in fcel_list]
+
+    if geom is None:
+        geom = cell_quad_geom(mesh)
+
+    for icel, ivrt, jvrt, atri in geom:
+
+        atri = np.reshape(atri, (atri.size, 1))
 
         abar[icel] += atri
-        fbar[icel] += atri * ftri / 3.
 
-    return fbar / abar
+        for fcel, fvrt, fbar in zip(fcel_list, fvrt_list, fbar_list):
+
+            ftri = (fcel[icel] + fvrt[ivrt] + fvrt[jvrt])
+
+            ftri = np.reshape(ftri, (ftri.size, 1))
+
+            fbar[icel] += atri * ftri / 3.
+
+    return [fbar / abar for fbar in fbar_list]
+
+
+def remap_weights_key(mesh, xlon, ylat):
+    """
+    A key identifying the remap weights between an MPAS mesh
+    and a DEM grid: a hash of the mesh coordinates and
+    connectivity and of the DEM pixel edges.
+
+    """
+
+    sha = hashlib.sha256()
+    sha.update(str(float(mesh.sphere_radius)).encode())
+    for name in ["xCell", "yCell", "zCell", "lonCell", "latCell",
+                 "lonVertex", "latVertex", "nEdgesOnCell",
+                 "edgesOnCell", "verticesOnEdge"]:
+        sha.update(np.ascontiguousarray(mesh[name][:]).tobytes())
+
+    sha.update(np.asarray(xlon, dtype=np.float64).tobytes())
+    sha.update(np.asarray(ylat, dtype=np.float64).tobytes())
+
+    return sha.hexdigest()[:32]
+
+
+def load_weights(path):
+    """
+    Load cached remap weights from the directory PATH: the
+    nearest cell for each DEM pixel (memory-mapped, so that
+    tiles are read as needed) and the quadrature geometry.
+
+    """
+
+    near = np.load(os.path.join(path, "near.npy"), mmap_mode="r")
+
+    geom = []
+    with np.load(os.path.join(path, "geom.npz")) as data:
+        for epos in range(int(data["nedge"])):
+            geom.append(tuple(
+                data[f"{name}{epos}"]
+                for name in ["icel", "ivrt", "jvrt", "atri"]))
+
+    return near, geom
 
 
-def dem_remap(elev_file, mpas_file):
+def save_geom(path, geom):
+    """
+    Save the quadrature geometry to the directory PATH.
+
+    """
+
+    data = {"nedge": len(geom)}
+    for epos, arrays in enumerate(geom):
+        for name, array in zip(["icel", "ivrt", "jvrt", "atri"], arrays):
+            data[f"{name}{epos}"] = array
+
+    np.savez(os.path.join(path, "geom.npz"), **data)
+
+
+def remap_tile(elev, lock, tree, near_map, rsph, xmid, ymid, head,
+               tail, ncel, icel, jcel, workers):
+    """
+    Remap the DEM pixels in the panel LAT[HEAD:TAIL]: find
+    the cell containing each pixel, accumulate the number
+    of pixels and the sum of each field per cell, and sample
+    the fields at the points ICEL (e.g. cells and vertices)
+    whose pixel row JCEL is within the panel.
+
+    If TREE is None, the cell containing each pixel is read
+    from the cached NEAR_MAP. Otherwise, it is found with a
+    nearest-neighbour query and saved to NEAR_MAP (if any).
+
+    """
+
+    nrow = min(tail, ymid.size) - head
+
+    if tree is None:
+        near = np.asarray(near_map[head:head + nrow, :]).ravel()
+
+    else:
+        qpos = sphere_to_r3(rsph, xmid, ymid, head, tail)
+
+        __, near = tree.query(qpos, workers=workers)
+
+        del qpos
+
+        if near_map is not None:
+            near_map[head:head + nrow, :] = \
+                np.reshape(near, (nrow, xmid.size))
+
+    with lock:
+        # netCDF4 is not thread-safe
+        vals = [np.asarray(elev[name][head:tail, :], dtype=np.float32)
+                for name in FIELDS]
+
+    nmap = np.bincount(near, minlength=ncel)
+    imap = np.flatnonzero(nmap)
+    nmap = nmap[imap]
+
+    smap = [np.bincount(near, weights=val.ravel(), minlength=ncel)[imap]
+            for val in vals]
+
+    del near
+
+    mask = np.logical_and(jcel >= head, jcel < tail)
+    ipnt = np.flatnonzero(mask)
+
+    fpnt = [val[jcel[ipnt] - head, icel[ipnt]] for val in vals]
+
+    return imap, nmap, smap, ipnt, fpnt
+
+
+def accumulate_tile(result, nmap, smap, fpnt):
+    """
+    Accumulate the pixel counts, field sums and point samples
+    from a tile remapped with REMAP_TILE.
+
+    """
+
+    imap, ntil, stil, ipnt, ftil = result
+
+    nmap[imap] += ntil
+    for sval, sloc in zip(smap, stil):
+        sval[imap] += sloc
+    for fval, floc in zip(fpnt, ftil):
+        fval[ipnt] = floc
+
+
+def dem_remap(elev_file, mpas_file, max_memory=None, workers=1,
+              weights_dir=None):
     """
     Map elevation and ice+ocn-thickness data from a "zipped"
     RTopo data-set onto the cells in an MPAS mesh.
@@ -179,6 +383,33 @@ def dem_remap(elev_file, mpas_file):
     Cell values are a blending of an approx. integral remap
     and a local quadrature rule.
 
+    The DEM is streamed in latitude panels ("tiles"), with
+    all fields accumulated in one pass per tile, so that only
+    a few tiles need to be in memory at once.
+
+    Parameters
+    ----------
+    elev_file : str
+        The DEM pixel file
+
+    mpas_file : str
+        The MPAS mesh file, to which the remapped fields are added
+
+    max_memory : float, optional
+        The approx. maximum memory (in MB) to use for each tile. By
+        default, the DEM is split into 8 tiles.
+
+    workers : int, optional
+        The number of cores to use. Tiles are processed on up to
+        this many threads at once.
+
+    weights_dir : str, optional
+        A directory in which to cache the remap weights (the cell
+        containing each DEM pixel and the quadrature geometry),
+        keyed by a hash of the mesh and DEM grid. Later remaps of
+        any DEM on the same grid onto the same mesh then skip the
+        nearest-neighbour search and the triangle areas.
+
     """
 
     print("Loading assests...")
@@ -186,90 +417,139 @@ def dem_remap(elev_file, mpas_file):
     elev = nc.Dataset(elev_file, "r")
     mesh = nc.Dataset(mpas_file, "r+")
 
+    ncel = mesh.dimensions["nCells"].size
+
+    xlon = np.asarray(elev["lon"][:], dtype=np.float64)
+    ylat = np.asarray(elev["lat"][:], dtype=np.float64)
+
+    xmid = .5 * (xlon[:-1:] + xlon[1::])
+    ymid = .5 * (ylat[:-1:] + ylat[1::])
+
 # -- Compute an approximate remapping, associating pixels in
 # -- the DEM with cells in the MPAS mesh. Since polygons are
 # -- Voronoi, the point-in-cell query can be computed by
 # -- finding nearest neighbours. This remapping is an approx.
 # -- as no partial pixel-cell intersection is computed.
 
-    print("Building KDtree...")
-
-    ppos = np.zeros(
-        (mesh.dimensions["nCells"].size, 3), dtype=np.float64)
-    ppos[:, 0] = mesh["xCell"][:]
-    ppos[:, 1] = mesh["yCell"][:]
-    ppos[:, 2] = mesh["zCell"][:]
-
-    tree = spatial.cKDTree(ppos, leafsize=8)
+    tree = None
+    near_map = None
+    geom = None
+    wdir = None
+    if weights_dir is not None:
+        key = remap_weights_key(mesh, xlon, ylat)
+        wdir = os.path.join(weights_dir, f"dem_remap_{key}")
+        if os.path.isdir(wdir):
+            print("Loading cached weights:", wdir)
+            near_map, geom = load_weights(wdir)
+
+    if geom is None:
+        print("Building KDtree...")
+
+        ppos = np.zeros((ncel, 3), dtype=np.float64)
+        ppos[:, 0] = mesh["xCell"][:]
+        ppos[:, 1] = mesh["yCell"][:]
+        ppos[:, 2] = mesh["zCell"][:]
+
+        tree = spatial.cKDTree(ppos, leafsize=8)
+
+        del ppos
+
+        if wdir is not None:
+            # write to a temp. dir., renamed once complete
+            os.makedirs(weights_dir, exist_ok=True)
+            temp_dir = tempfile.mkdtemp(dir=weights_dir)
+            near_map = np.lib.format.open_memmap(
+                os.path.join(temp_dir, "near.npy"), mode="w+",
+                dtype=np.int32, shape=(ymid.size, xmid.size))
 
     print("Remap elevation...")
 
-    xlon = np.asarray(elev["lon"][:], dtype=np.float64)
-    ylat = np.asarray(elev["lat"][:], dtype=np.float64)
-
-    xmid = .5 * (xlon[:-1:] + xlon[1::])
-    ymid = .5 * (ylat[:-1:] + ylat[1::])
+    if max_memory is None:
+        ntile = 8
+    else:
+        rows = max(1, int(
+            max_memory * 1.e+6 / (BYTES_PER_PIXEL * xmid.size)))
+        ntile = int(np.ceil(ymid.size / rows))
 
     indx = np.asarray(np.round(
-        np.linspace(-1, ymid.size, 9)), dtype=np.int32)
+        np.linspace(-1, ymid.size, ntile + 1)), dtype=np.int32)
 
-    print("* process tiles:")
+# -- Pixels containing cell centres and vertices, for the
+# -- quadrature rule below.
 
-    nset = []
-    for tile in range(indx.size - 1):
+    pcel, pvrt = cell_and_vert_lonlat(mesh)
 
-        head = indx[tile + 0] + 1
-        tail = indx[tile + 1] + 1
+    jcel, icel = find_pixels(
+        xlon, ylat,
+        np.concatenate((pcel[:, 0], pvrt[:, 0])),
+        np.concatenate((pcel[:, 1], pvrt[:, 1])))
 
-        qpos = map_to_r3(mesh, xmid, ymid, head, tail)
+    jcel = np.minimum(jcel, ymid.size - 1)
+    icel = np.minimum(icel, xmid.size - 1)
 
-        ttic = time.time()
-        __, nloc = tree.query(qpos, workers=-1)
-        ttoc = time.time()
-        print("* built node-to-cell map:", ttoc - ttic)
+    del pcel
+    del pvrt
 
-        nset.append(nloc)
+# -- Stream tiles of the DEM, accumulating the no. of pixels
+# -- in each cell and the sum of each field over them. Tiles
+# -- are processed concurrently but accumulated in order, so
+# -- results do not depend on the no. of workers.
 
-    near = np.concatenate(nset)
+    nmap = np.zeros(ncel, dtype=np.float64)
+    smap = [np.zeros(ncel, dtype=np.float64) for name in FIELDS]
+    fpnt = [np.zeros(jcel.size, dtype=np.float32) for name in FIELDS]
 
-    del tree
-    del qpos
-    del nset
-    del nloc
+    rsph = mesh.sphere_radius
+    lock = threading.Lock()
 
-# -- Build cell-to-pixel map as a sparse matrix, and average
-# -- RTopo pixel values within each cell.
+    nthread = max(1, min(workers, ntile))
+    nquery = max(1, workers // nthread)
 
-    cols = np.arange(0, near.size)
-    vals = np.ones(near.size, dtype=np.int8)
+    print("* process tiles:", ntile)
 
-    smat = csr_matrix((vals, (near, cols)))
+    ttic = time.time()
+    with ThreadPoolExecutor(max_workers=nthread) as executor:
+        futures = []
+        for tile in range(ntile):
 
-    nmap = np.asarray(
-        np.sum(smat, axis=1), dtype=np.float32)
+            head = indx[tile + 0] + 1
+            tail = indx[tile + 1] + 1
 
-    vals = np.asarray(
-        elev["bed_elevation"][:], dtype=np.float32)
-    vals = np.reshape(vals, (vals.size, 1))
+            futures.append(executor.submit(
+                remap_tile, elev, lock, tree, near_map, rsph, xmid,
+                ymid, head, tail, ncel, icel, jcel, nquery))
 
-    emap = (smat * vals) / np.maximum(1., nmap)
+            # accumulate finished tiles in order, so that only
+            # a few tiles are in memory at once
+            if len(futures) >= nthread:
+                accumulate_tile(
+                    futures.pop(0).result(), nmap, smap, fpnt)
 
-    vals = np.asarray(
-        elev["ocn_thickness"][:], dtype=np.float32)
-    vals = np.reshape(vals, (vals.size, 1))
+        for future in futures:
+            accumulate_tile(future.result(), nmap, smap, fpnt)
+    ttoc = time.time()
+    print("* built node-to-cell map:", ttoc - ttic)
 
-    omap = (smat * vals) / np.maximum(1., nmap)
+    del tree
 
-    vals = np.asarray(
-        elev["ice_thickness"][:], dtype=np.float32)
-    vals = np.reshape(vals, (vals.size, 1))
+    if geom is None:
+        geom = cell_quad_geom(mesh)
 
-    imap = (smat * vals) / np.maximum(1., nmap)
+        if wdir is not None:
+            save_geom(temp_dir, geom)
+            near_map.flush()
+            try:
+                os.rename(temp_dir, wdir)
+            except OSError:
+                # another remap has cached the same weights
+                shutil.rmtree(temp_dir)
 
-    del smat
-    del cols
-    del vals
-    del near
+    del near_map
+
+    nmap = np.reshape(nmap, (ncel, 1))
+    emap, omap, imap = [
+        np.reshape(sval, (ncel, 1)) / np.maximum(1., nmap)
+        for sval in smap]
 
 # -- If the resolution of the mesh is greater, or comparable
 # -- to that of the DEM, the approx. remapping (above) will
@@ -278,27 +558,11 @@ def dem_remap(elev_file, mpas_file):
 
     print("Eval. elevation...")
 
-    vals = np.asarray(
-        elev["bed_elevation"][:], dtype=np.float32)
-
-    ttic = time.time()
-    eint = cell_quad(mesh, xlon, ylat, vals)
-    ttoc = time.time()
-    print("* compute cell integrals:", ttoc - ttic)
-
-    vals = np.asarray(
-        elev["ocn_thickness"][:], dtype=np.float32)
-
     ttic = time.time()
-    oint = cell_quad(mesh, xlon, ylat, vals)
-    ttoc = time.time()
-    print("* compute cell integrals:", ttoc - ttic)
-
-    vals = np.asarray(
-        elev["ice_thickness"][:], dtype=np.float32)
-
-    ttic = time.time()
-    iint = cell_quad(mesh, xlon, ylat, vals)
+    eint, oint, iint = cell_quad_vals(
+        mesh,
+        [fval[:ncel] for fval in fpnt],
+        [fval[ncel:] for fval in fpnt], geom=geom)
     ttoc = time.time()
     print("* compute cell integrals:", ttoc - ttic)
 
@@ -338,7 +602,20 @@ if (__name__ == "__main__"):
         "--elev-file", dest="elev_file", type=str,
         required=True, help="Name of DEM pixel file.")
 
+    parser.add_argument(
+        "--max-memory", dest="max_memory", type=float,
+        required=False, help="Approx. max. memory per tile (MB).")
+
+    parser.add_argument(
+        "--workers", dest="workers", type=int, default=1,
+        required=False, help="Number of cores to use.")
+
+    parser.add_argument(
+        "--weights-dir", dest="weights_dir", type=str,
+        required=False, help="Directory to cache remap weights.")
+
     args = parser.parse_args()
     elev_file = args.elev_file
     mpas_file = args.mpas_file
-    dem_remap(elev_file, mpas_file)
+    dem_remap(elev_file, mpas_file, max_memory=args.max_memory,
+              workers=args.workers, weights_dir=args.weights_dir)
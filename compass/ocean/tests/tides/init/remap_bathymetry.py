@@ -63,6 +63,19 @@ class RemapBathymetry(Step):
             filename='base_mesh.nc',
             work_dir_target=f'{base_mesh_path}/base_mesh.nc')
 
+    def setup(self):
+        """
+        Get resources at setup from config options
+        """
+        self._get_resources()
+
+    def constrain_resources(self, available_resources):
+        """
+        Update resources at runtime from config options
+        """
+        self._get_resources()
+        super().constrain_resources(available_resources)
+
     def run(self):
         """
         Run this step of the test case
@@ -70,13 +83,30 @@ class RemapBathymetry(Step):
 
         self.init_path = './'
 
+        workers = self.cpus_per_task
+
         if not os.path.exists('RTopo_2_0_4_30sec_pixel.nc'):
-            dem_pixel.rtopo_30sec(self.init_path, self.init_path)
+            dem_pixel.rtopo_30sec(self.init_path, self.init_path, workers)
         if not os.path.exists('GEBCO_v2020_30sec_pixel.nc'):
-            dem_pixel.gebco_30sec(self.init_path, self.init_path)
+            dem_pixel.gebco_30sec(self.init_path, self.init_path, workers)
         if not os.path.exists('RTopo_2_0_4_GEBCO_v2020_30sec_pixel.nc'):
-            dem_pixel.rtopo_gebco_30sec(self.init_path, self.init_path)
-
+            dem_pixel.rtopo_gebco_30sec(self.init_path, self.init_path,
+                                        workers)
+
+        config = self.config
+        max_memory = config.getfloat('tides', 'remap_max_tile_memory')
+        # the weights are shared between steps with the same mesh
+        weights_dir = os.path.join(self.base_work_dir,
+                                   config.get('tides', 'remap_weights_dir'))
         dem_remap.dem_remap('RTopo_2_0_4_GEBCO_v2020_30sec_pixel.nc',
-                            'base_mesh.nc')
+                            'base_mesh.nc', max_memory=max_memory,
+                            workers=workers,
+                            weights_dir=weights_dir)
         dem_trnsf.dem_trnsf('base_mesh.nc', 'mesh.nc')
+
+    def _get_resources(self):
+        # get the these properties from the config options
+        config = self.config
+        self.cpus_per_task = config.getint('tides', 'remap_cpus_per_task')
+        self.min_cpus_per_task = config.getint('tides',
+                                               'remap_min_cpus_per_task')
@@ -170,7 +170,8 @@ class Forward(Step):
         """
         if self.with_particles:
             ntasks = self.ntasks
-            partition(ntasks, self.config, self.logger)
+            partition(ntasks, self.config, self.logger,
+                      base_work_dir=self.base_work_dir)
             particles.write(init_filename='init.nc',
                             particle_filename='particles.nc',
                             graph_filename=f'graph.info.part.{ntasks}',
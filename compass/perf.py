@@ -0,0 +1,312 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy
+
+from compass.validate import read_timer_table
+from compass.version import __version__
+
+
+def record_step(step, start_time, wall_time, success):
+    """
+    Append the performance of a step that has just been run to the
+    performance history database given by the ``history_file`` option in the
+    ``[performance]`` config section
+
+    Parameters
+    ----------
+    step : compass.Step
+        The step that was run
+
+    start_time : float
+        The time (in seconds since the epoch) when the step started running
+
+    wall_time : float
+        The wall-clock time (in seconds) it took to run the step
+
+    success : bool
+        Whether the step ran successfully
+    """
+    config = step.config
+    if config.has_option('performance', 'record') and \
+            not config.getboolean('performance', 'record'):
+        return
+
+    filename = get_history_filename(config, step.base_work_dir)
+
+    if config.has_option('deploy', 'machine'):
+        machine = config.get('deploy', 'machine')
+    else:
+        machine = None
+
+    model = None
+    model_mtime = None
+    if config.has_option('executables', 'model'):
+        model = config.get('executables', 'model')
+        if os.path.exists(model):
+            model_mtime = os.path.getmtime(model)
+
+    timers = _get_new_timers(step.work_dir, start_time)
+
+    with _connect(filename) as connection:
+        cursor = connection.execute(
+            'INSERT INTO step_runs (start_time, step, machine, model, '
+            'model_mtime, compass_version, ntasks, cpus_per_task, '
+            'openmp_threads, wall_time, success) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (start_time, step.path, machine, model, model_mtime, __version__,
+             step.ntasks, step.cpus_per_task, step.openmp_threads, wall_time,
+             int(success)))
+        run_id = cursor.lastrowid
+        connection.executemany(
+            'INSERT INTO timers (run_id, filename, name, count, min, max, '
+            'total) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, timer_filename, name, stats['count'], stats['min'],
+              stats['max'], stats['total'])
+             for timer_filename, name, stats in timers])
+    connection.close()
+
+
+def get_history_filename(config, base_work_dir):
+    """
+    Get the absolute path to the performance history database
+
+    Parameters
+    ----------
+    config : compass.config.CompassConfigParser
+        Configuration options for a test case
+
+    base_work_dir : str
+        The base work directory, used for relative paths
+
+    Returns
+    -------
+    filename : str
+        The absolute path to the performance history database
+    """
+    if config.has_option('performance', 'history_file'):
+        filename = config.get('performance', 'history_file')
+    else:
+        filename = 'performance_history.db'
+    return os.path.abspath(os.path.join(base_work_dir, filename))
+
+
+def read_history(filename, step_expr=None, timer=None):
+    """
+    Read the performance history of steps (or a timer within steps)
+
+    Parameters
+    ----------
+    filename : str
+        The performance history database
+
+    step_expr : str, optional
+        A regular expression for the paths of steps to read
+
+    timer : str, optional
+        The name of an MPAS or GPTL timer to read instead of the wall-clock
+        time of each step.  If the timer was recorded in several files (e.g.
+        GPTL files for each process), the largest total is used.
+
+    Returns
+    -------
+    history : dict
+        A dictionary with a list of runs for each step on a given machine
+        with given resources.  The keys are tuples of the step path, machine,
+        ``ntasks``, ``cpus_per_task`` and ``openmp_threads``.  Each run is a
+        dictionary with the ``start_time``, ``value`` (the wall-clock time or
+        timer total), ``model`` and ``compass_version``, in the order the runs
+        started.  Failed runs and runs without the timer are skipped.
+    """
+    if not os.path.exists(filename):
+        raise OSError(f'Performance history {filename} does not exist.')
+
+    with _connect(filename) as connection:
+        if timer is None:
+            rows = connection.execute(
+                'SELECT step, machine, ntasks, cpus_per_task, '
+                'openmp_threads, start_time, wall_time, model, '
+                'compass_version FROM step_runs WHERE success = 1 '
+                'ORDER BY start_time').fetchall()
+        else:
+            rows = connection.execute(
+                'SELECT step, machine, ntasks, cpus_per_task, '
+                'openmp_threads, start_time, MAX(timers.total), model, '
+                'compass_version FROM step_runs '
+                'JOIN timers ON timers.run_id = step_runs.id '
+                'WHERE success = 1 AND timers.name = ? '
+                'GROUP BY step_runs.id ORDER BY start_time',
+                (timer.replace(' ', '_'),)).fetchall()
+    connection.close()
+
+    history = dict()
+    for step, machine, ntasks, cpus_per_task, openmp_threads, start_time, \
+            value, model, compass_version in rows:
+        if step_expr is not None and not re.search(step_expr, step):
+            continue
+        key = (step, machine, ntasks, cpus_per_task, openmp_threads)
+        if key not in history:
+            history[key] = list()
+        history[key].append(dict(start_time=start_time, value=value,
+                                 model=model,
+                                 compass_version=compass_version))
+    return history
+
+
+def show_history(filename, step_expr=None, timer=None, window=5,
+                 threshold=0.1, count=10):
+    """
+    Show trends in the performance history of steps (or a timer within
+    steps) and flag regressions against a rolling baseline.  The baseline
+    for each run is the median of the previous ``window`` runs of the same
+    step on the same machine with the same resources.
+
+    Parameters
+    ----------
+    filename : str
+        The performance history database
+
+    step_expr : str, optional
+        A regular expression for the paths of steps to show
+
+    timer : str, optional
+        The name of an MPAS or GPTL timer to show instead of the wall-clock
+        time of each step
+
+    window : int, optional
+        The number of previous runs in the rolling baseline
+
+    threshold : float, optional
+        The fraction by which a run must be slower than the baseline to be
+        flagged as a regression
+
+    count : int, optional
+        The number of most recent runs of each step to show
+
+    Returns
+    -------
+    regressions : list of str
+        The paths of steps where the most recent run is a regression
+    """
+    history = read_history(filename, step_expr=step_expr, timer=timer)
+
+    if timer is None:
+        label = 'wall time'
+    else:
+        label = timer
+
+    regressions = list()
+    for key, runs in history.items():
+        step, machine, ntasks, cpus_per_task, openmp_threads = key
+        print(f'{step} ({machine}, {ntasks} tasks, {cpus_per_task} cpus per '
+              f'task, {openmp_threads} threads)')
+        values = numpy.array([run['value'] for run in runs])
+        first = max(0, len(runs) - count)
+        for index in range(first, len(runs)):
+            run = runs[index]
+            date = time.strftime('%Y-%m-%d %H:%M:%S',
+                                 time.localtime(run['start_time']))
+            line = f'  {date}  {label}: {run["value"]:10.3f} s'
+            if index > 0:
+                baseline = numpy.median(values[max(0, index - window):index])
+                line = f'{line}  baseline: {baseline:10.3f} s'
+                # there is no relative change from a baseline of zero, e.g.
+                # for timers that round to zero
+                if baseline > 0.:
+                    change = (run['value'] - baseline) / baseline
+                    line = f'{line}  {100. * change:+7.1f}%'
+                    if change > threshold:
+                        line = f'{line}  REGRESSION'
+                        if index == len(runs) - 1:
+                            regressions.append(step)
+            print(line)
+        print('')
+
+    if len(regressions) > 0:
+        print(f'Regressions in the most recent run of {len(regressions)} '
+              f'step(s):')
+        for step in regressions:
+            print(f'  {step}')
+    else:
+        print('No regressions in the most recent runs.')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Show the performance history of steps and flag '
+                    'regressions',
+        prog='compass perf')
+    parser.add_argument("-f", "--history_file", dest="history_file",
+                        default='performance_history.db',
+                        help="The performance history database",
+                        metavar="FILE")
+    parser.add_argument("-s", "--step_expr", dest="step_expr",
+                        help="A regular expression for the paths of steps to "
+                             "show",
+                        metavar="STEP")
+    parser.add_argument("-t", "--timer", dest="timer",
+                        help="An MPAS or GPTL timer to show instead of the "
+                             "wall-clock time of each step")
+    parser.add_argument("-w", "--window", dest="window", type=int, default=5,
+                        help="The number of previous runs in the rolling "
+                             "baseline")
+    parser.add_argument("--threshold", dest="threshold", type=float,
+                        default=0.1,
+                        help="The fraction by which a run must be slower "
+                             "than the baseline to be flagged as a "
+                             "regression")
+    parser.add_argument("-n", "--count", dest="count", type=int, default=10,
+                        help="The number of most recent runs of each step to "
+                             "show")
+    args = parser.parse_args(sys.argv[2:])
+    show_history(args.history_file, step_expr=args.step_expr,
+                 timer=args.timer, window=args.window,
+                 threshold=args.threshold, count=args.count)
+
+
+def _connect(filename):
+    """
+    Connect to the performance history database, creating its tables if
+    they don't already exist
+    """
+    # steps running in parallel may write to the database at the same time
+    connection = sqlite3.connect(filename, timeout=60.)
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS step_runs ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, start_time REAL, '
+            'step TEXT, machine TEXT, model TEXT, model_mtime REAL, '
+            'compass_version TEXT, ntasks INTEGER, cpus_per_task INTEGER, '
+            'openmp_threads INTEGER, wall_time REAL, success INTEGER)')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS timers (run_id INTEGER, '
+            'filename TEXT, name TEXT, count REAL, min REAL, max REAL, '
+            'total REAL)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS step_runs_step ON step_runs (step)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS timers_run_id ON timers (run_id)')
+    return connection
+
+
+def _get_new_timers(directory, start_time):
+    """
+    Get the timers from files in a directory that were written since the
+    step started
+    """
+    if directory is None or not os.path.isdir(directory):
+        return list()
+    timers = list()
+    table = read_timer_table(directory)
+    for filename, file_table in table.items():
+        if os.path.getmtime(os.path.join(directory, filename)) < start_time:
+            continue
+        for name, stats in file_table.items():
+            timers.append((filename, name, stats))
+    return timers
@@ -0,0 +1,462 @@
+import os
+import subprocess
+import time
+
+import mpas_tools.io
+from mpas_tools.logging import LoggingContext
+
+from compass.config import CompassConfigParser
+from compass.logging import log_method_call
+from compass.parallel import set_cores_per_node
+from compass.run.serial import (
+    _load_suite,
+    _log_suite_summary,
+    _log_test_result,
+    _test_case_run_deprecated,
+    _update_steps_to_run,
+)
+
+
+def run_tests(suite_name, quiet=False, is_test_case=False, steps_to_run=None,
+              steps_not_to_run=None):
+    """
+    Run the given test suite or test case, running steps in task parallel
+
+    A dependency graph is constructed from the ``inputs`` and ``outputs`` of
+    the steps to run: a step depends on any other step (in the same or another
+    test case) that produces one of its inputs.  Each step is run as a
+    subprocess as soon as all of its dependencies have completed successfully
+    and enough cores are free, giving priority to steps at the start of the
+    longest chains of dependent steps.  If there are not enough free cores to
+    run a step with ``ntasks`` tasks, it is run with fewer tasks as long as
+    this is not below ``min_tasks``.  A step with a single task is run with
+    fewer CPUs as long as this is not below ``min_cpus_per_task``.  Each test
+    case is validated as soon as
+    all of its steps have completed.
+
+    Parameters
+    ----------
+    suite_name : str
+        The name of the test suite
+
+    quiet : bool, optional
+        Whether step names are not included in the output as the test suite
+        progresses
+
+    is_test_case : bool
+        Whether this is a test case instead of a full test suite
+
+    steps_to_run : list of str, optional
+        A list of the steps to run if this is a test case, not a full suite.
+        The default behavior is to run the default steps unless they are in
+        ``steps_not_to_run``
+
+    steps_not_to_run : list of str, optional
+        A list of steps not to run if this is a test case, not a full suite.
+        Typically, these are steps to remove from the defaults
+    """
+
+    suite_name, test_suite, available_resources = _load_suite(suite_name)
+
+    # start logging to stdout/stderr
+    with LoggingContext(suite_name) as logger:
+
+        os.environ['PYTHONUNBUFFERED'] = '1'
+
+        if not is_test_case:
+            try:
+                os.makedirs('case_outputs')
+            except OSError:
+                pass
+
+        cwd = os.getcwd()
+        suite_start = time.time()
+
+        test_runs = list()
+        jobs = list()
+        for test_case in test_suite['test_cases'].values():
+            test_run = _TestCaseRun(test_case, logger, quiet, is_test_case,
+                                    cwd)
+            test_run.prepare(steps_to_run, steps_not_to_run,
+                             available_resources)
+            test_runs.append(test_run)
+            jobs.extend(test_run.jobs)
+
+        _add_dependencies(jobs)
+
+        # test cases with no steps to run can be validated right away
+        for test_run in test_runs:
+            test_run.finalize_if_done()
+
+        _run_jobs(jobs, available_resources)
+
+        suite_time = time.time() - suite_start
+
+        failures = 0
+        test_times = dict()
+        success_strs = dict()
+        for test_run in test_runs:
+            test_name = test_run.test_name
+            success_strs[test_name] = test_run.success_str
+            test_times[test_name] = test_run.test_time
+            if not test_run.success:
+                failures += 1
+
+        _log_suite_summary(logger, test_times, success_strs, suite_time,
+                           failures)
+
+
+class _StepJob:
+    """
+    A step to run as a subprocess, along with the steps it depends on and
+    those that depend on it
+    """
+
+    def __init__(self, test_run, step):
+        self.test_run = test_run
+        self.step = step
+        self.dependencies = set()
+        self.dependents = set()
+        self.priority = None
+        # one of 'pending', 'running', 'success' or 'failed'
+        self.status = 'pending'
+        self.cores = None
+        self.process = None
+        self.log_file = None
+        self.log_filename = os.path.join(test_run.test_case.work_dir,
+                                         f'{step.name}.log')
+
+
+class _TestCaseRun:
+    """
+    The run-time state of a test case whose steps are run in task parallel
+    """
+
+    def __init__(self, test_case, logger, quiet, is_test_case, cwd):
+        self.test_case = test_case
+        self.logger = logger
+        self.quiet = quiet
+        self.is_test_case = is_test_case
+        self.cwd = cwd
+        self.test_name = test_case.path.replace('/', '_')
+        if is_test_case:
+            self.log_filename = None
+        else:
+            self.log_filename = f'{cwd}/case_outputs/{self.test_name}.log'
+        self.jobs = list()
+        self.test_pass = True
+        self.test_start = time.time()
+        self.done = False
+        self.success_str = None
+        self.success = None
+        self.test_time = None
+
+    def logging_context(self):
+        """
+        A logging context for the test case, appending to its log file if
+        running a suite
+        """
+        if self.is_test_case:
+            test_logger = self.logger
+        else:
+            test_logger = None
+        return LoggingContext(self.test_name, logger=test_logger,
+                              log_filename=self.log_filename)
+
+    def prepare(self, steps_to_run, steps_not_to_run, available_resources):
+        """
+        Read the config file, determine the steps to run and create a job for
+        each step
+        """
+        test_case = self.test_case
+        with self.logging_context() as test_logger:
+            test_case.stdout_logger = test_logger
+            test_case.logger = test_logger
+            test_case.log_filename = self.log_filename
+            test_case.new_step_log_file = True
+
+            os.chdir(test_case.work_dir)
+
+            config = CompassConfigParser()
+            config.add_from_file(test_case.config_filename)
+            test_case.config = config
+            set_cores_per_node(test_case.config,
+                               available_resources['cores_per_node'])
+
+            test_case.steps_to_run = _update_steps_to_run(
+                steps_to_run, steps_not_to_run, config, test_case.steps)
+
+            log_method_call(method=test_case.run, logger=test_logger)
+            test_logger.info('')
+            try:
+                _test_case_run_deprecated(test_case)
+            except BaseException:
+                self.test_pass = False
+                test_logger.exception('Exception raised in the test '
+                                      'case\'s run() method')
+
+            test_list = ', '.join(test_case.steps_to_run)
+            test_logger.info(f'Running steps in parallel: {test_list}')
+
+        os.chdir(self.cwd)
+
+        for step_name in test_case.steps_to_run:
+            step = test_case.steps[step_name]
+            if step.cached:
+                self.log_info(f'  * Cached step: {step_name}')
+                continue
+            step.config = test_case.config
+            job = _StepJob(self, step)
+            if not self.test_pass:
+                job.status = 'failed'
+            self.jobs.append(job)
+
+    def log_info(self, message, to_stdout=False):
+        """
+        Log a message to the test case's log and, optionally, to stdout
+        """
+        with self.logging_context() as test_logger:
+            test_logger.info(message)
+        if to_stdout and not self.quiet and not self.is_test_case:
+            self.logger.info(message)
+
+    def log_error(self, message):
+        """
+        Log an error message to the test case's log and to stdout
+        """
+        with self.logging_context() as test_logger:
+            test_logger.error(message)
+        if not self.is_test_case:
+            self.logger.error(message)
+
+    def finalize_if_done(self):
+        """
+        If all the steps of the test case have completed, validate the test
+        case and log its status
+        """
+        if self.done:
+            return
+        for job in self.jobs:
+            if job.status in ['pending', 'running']:
+                return
+        self.done = True
+
+        test_case = self.test_case
+        for job in self.jobs:
+            if job.status != 'success':
+                self.test_pass = False
+
+        logger = self.logger
+        with self.logging_context() as test_logger:
+            test_case.logger = test_logger
+            test_case.stdout_logger = test_logger
+            if self.test_pass:
+                os.chdir(test_case.work_dir)
+                config = test_case.config
+                mpas_tools.io.default_format = config.get('io', 'format')
+                mpas_tools.io.default_engine = config.get('io', 'engine')
+                test_logger.info('')
+                log_method_call(method=test_case.validate,
+                                logger=test_logger)
+                test_logger.info('')
+                try:
+                    test_case.validate()
+                except BaseException:
+                    self.test_pass = False
+                    test_logger.exception('Exception raised in the test '
+                                          'case\'s validate() method')
+
+            logger.info(test_case.path)
+            self.success_str, self.success, self.test_time = \
+                _log_test_result(test_case, logger, test_logger,
+                                 self.test_pass, self.test_start,
+                                 self.is_test_case)
+        os.chdir(self.cwd)
+
+
+def _add_dependencies(jobs):
+    """
+    Find the dependencies between jobs based on the inputs and outputs of
+    their steps, then prioritize each job by the longest chain of jobs that
+    depends on it
+    """
+    producers = dict()
+    for job in jobs:
+        for output in job.step.outputs:
+            producers[output] = job
+
+    for job in jobs:
+        for input_file in job.step.inputs:
+            if input_file not in producers:
+                continue
+            producer = producers[input_file]
+            if producer is job:
+                continue
+            job.dependencies.add(producer)
+            producer.dependents.add(job)
+
+    for job in jobs:
+        _get_priority(job, visiting=set())
+
+
+def _get_priority(job, visiting):
+    """
+    The length of the longest chain of jobs starting with this one
+    """
+    if job.priority is not None:
+        return job.priority
+    if job in visiting:
+        # a circular dependency, which will be reported when no jobs can run
+        return 0
+    visiting.add(job)
+    priority = 1
+    for dependent in job.dependents:
+        priority = max(priority, 1 + _get_priority(dependent, visiting))
+    visiting.remove(job)
+    job.priority = priority
+    return priority
+
+
+def _run_jobs(jobs, available_resources):  # noqa: C901
+    """
+    Run jobs as subprocesses as their dependencies complete and cores become
+    available
+    """
+    free_cores = available_resources['cores']
+    running = list()
+    pending = [job for job in jobs if job.status == 'pending']
+    # launch the jobs at the start of the longest chains first
+    pending.sort(key=lambda job: job.priority, reverse=True)
+
+    while len(pending) > 0 or len(running) > 0:
+        launched = False
+        for job in list(pending):
+            dependency_status = [dep.status for dep in job.dependencies]
+            if 'failed' in dependency_status:
+                pending.remove(job)
+                _finish_job(job, success=False,
+                            message=f'  * skipped because a dependency '
+                                    f'failed: {job.step.path}')
+                launched = True
+                continue
+            if any(status != 'success' for status in dependency_status):
+                continue
+
+            if job.cores is None:
+                if not _constrain_resources(job, available_resources):
+                    pending.remove(job)
+                    launched = True
+                    continue
+
+            step = job.step
+            if step.ntasks == 1:
+                # a single task can run with fewer cpus per task
+                min_cores = step.min_cpus_per_task
+            else:
+                min_cores = step.min_tasks * step.cpus_per_task
+            if min_cores > free_cores:
+                continue
+
+            cores = min(job.cores, free_cores)
+            if step.ntasks > 1:
+                # run on a whole number of tasks
+                cores = step.cpus_per_task * (cores // step.cpus_per_task)
+            pending.remove(job)
+            _launch_job(job, cores)
+            free_cores -= cores
+            running.append(job)
+            launched = True
+
+        if len(running) == 0 and not launched and len(pending) > 0:
+            # nothing is running and nothing can be launched
+            for job in pending:
+                _finish_job(job, success=False,
+                            message=f'  * could not run because of a '
+                                    f'circular dependency: '
+                                    f'{job.step.path}')
+            pending = list()
+            continue
+
+        finished = False
+        for job in list(running):
+            returncode = job.process.poll()
+            if returncode is None:
+                continue
+            job.log_file.close()
+            running.remove(job)
+            free_cores += job.cores
+            if returncode == 0:
+                _finish_job(job, success=True,
+                            message=f'  * finished: {job.step.path}')
+            else:
+                _finish_job(job, success=False,
+                            message=f'  * failed: {job.step.path}\n'
+                                    f'    see: {job.log_filename}')
+            finished = True
+
+        if not launched and not finished:
+            time.sleep(0.1)
+
+
+def _constrain_resources(job, available_resources):
+    """
+    Determine the cores a job would ideally use, returning ``False`` if the
+    step's resources can't be constrained to those available
+    """
+    step = job.step
+    cwd = os.getcwd()
+    os.chdir(step.work_dir)
+    try:
+        step.constrain_resources(dict(available_resources))
+    except BaseException:
+        with job.test_run.logging_context() as test_logger:
+            test_logger.exception(f'Exception raised while constraining '
+                                  f'the resources of step {step.name}')
+        _finish_job(job, success=False,
+                    message=f'  * failed: {step.path}')
+        return False
+    finally:
+        os.chdir(cwd)
+    job.cores = step.ntasks * step.cpus_per_task
+    return True
+
+
+def _launch_job(job, cores):
+    """
+    Launch a job as a subprocess on the given number of cores
+    """
+    step = job.step
+    job.cores = cores
+    job.status = 'running'
+    if step.ntasks == 1:
+        # the step constrains its cpus per task to the cores it is given
+        ntasks = 1
+        cpus_per_task = cores
+    else:
+        ntasks = cores // step.cpus_per_task
+        cpus_per_task = step.cpus_per_task
+    job.test_run.log_info(
+        f'  * started: {step.path} ({ntasks} tasks, {cpus_per_task} '
+        f'cpus per task)\n'
+        f'    log: {job.log_filename}', to_stdout=True)
+    args = ['compass', 'run', '--step_is_subprocess',
+            '--available_cores', f'{cores}']
+    job.log_file = open(job.log_filename, 'w')
+    job.process = subprocess.Popen(args, cwd=step.work_dir,
+                                   stdout=job.log_file,
+                                   stderr=subprocess.STDOUT)
+
+
+def _finish_job(job, success, message):
+    """
+    Record that a job has finished (or won't be run) and finalize its test
+    case if all of its jobs are done
+    """
+    test_run = job.test_run
+    if success:
+        job.status = 'success'
+        test_run.log_info(message, to_stdout=True)
+    else:
+        job.status = 'failed'
+        test_run.log_error(message)
+    test_run.finalize_if_done()
@@ -15,6 +15,7 @@ from compass.parallel import (
     get_available_parallel_resources,
     set_cores_per_node,
 )
+from compass.perf import record_step
 
 
 def run_tests(suite_name, quiet=False, is_test_case=False, steps_to_run=None,
@@ -44,24 +45,7 @@ def run_tests(suite_name, quiet=False, is_test_case=False, steps_to_run=None,
         Typically, these are steps to remove from the defaults
     """
 
-    # Allow a suite name to either include or not the .pickle suffix
-    if suite_name.endswith('.pickle'):
-        # code below assumes no suffix, so remove it
-        suite_name = suite_name[:-len('.pickle')]
-    # Now open the the suite's pickle file
-    if not os.path.exists(f'{suite_name}.pickle'):
-        raise ValueError(f'The suite "{suite_name}" does not appear to have '
-                         f'been set up here.')
-    with open(f'{suite_name}.pickle', 'rb') as handle:
-        test_suite = pickle.load(handle)
-
-    # get the config file for the first test case in the suite
-    test_case = next(iter(test_suite['test_cases'].values()))
-    config_filename = os.path.join(test_case.work_dir,
-                                   test_case.config_filename)
-    config = CompassConfigParser()
-    config.add_from_file(config_filename)
-    available_resources = get_available_parallel_resources(config)
+    suite_name, test_suite, available_resources = _load_suite(suite_name)
 
     # start logging to stdout/stderr
     with LoggingContext(suite_name) as logger:
@@ -105,30 +89,11 @@ def run_tests(suite_name, quiet=False, is_test_case=False, steps_to_run=None,
 
         os.chdir(cwd)
 
-        logger.info('Test Runtimes:')
-        for test_name, test_time in test_times.items():
-            secs = round(test_time)
-            mins = secs // 60
-            secs -= 60 * mins
-            logger.info(f'{mins:02d}:{secs:02d} {success_strs[test_name]} '
-                        f'{test_name}')
-        secs = round(suite_time)
-        mins = secs // 60
-        secs -= 60 * mins
-        logger.info(f'Total runtime {mins:02d}:{secs:02d}')
-
-        if failures == 0:
-            logger.info('PASS: All passed successfully!')
-        else:
-            if failures == 1:
-                message = '1 test'
-            else:
-                message = f'{failures} tests'
-            logger.error(f'FAIL: {message} failed, see above.')
-            sys.exit(1)
+        _log_suite_summary(logger, test_times, success_strs, suite_time,
+                           failures)
 
 
-def run_single_step(step_is_subprocess=False):
+def run_single_step(step_is_subprocess=False, available_cores=None):
     """
     Used by the framework to run a step when ``compass run`` gets called in the
     step's work directory
@@ -137,6 +102,11 @@ def run_single_step(step_is_subprocess=False):
     ----------
     step_is_subprocess : bool, optional
         Whether the step is being run as a subprocess of a test case or suite
+
+    available_cores : int, optional
+        The maximum number of cores the step may use.  This is used by
+        :py:func:`compass.run.parallel.run_tests` to run a step on the cores
+        that it has been allotted, rather than all the cores in the job
     """
     with open('step.pickle', 'rb') as handle:
         test_case, step = pickle.load(handle)
@@ -150,6 +120,9 @@ def run_single_step(step_is_subprocess=False):
     config.add_from_file(step.config_filename)
 
     available_resources = get_available_parallel_resources(config)
+    if available_cores is not None:
+        available_resources['cores'] = min(available_resources['cores'],
+                                           available_cores)
 
     test_case.config = config
     set_cores_per_node(test_case.config, available_resources['cores_per_node'])
@@ -192,23 +165,38 @@ def main():
                              "output as the test suite progresses.  Has no "
                              "effect when running test cases or steps on "
                              "their own.")
+    parser.add_argument("--parallel", dest="parallel", action="store_true",
+                        help="If set, steps (and test cases in a suite) are "
+                             "run in task parallel as their inputs become "
+                             "available and there are enough cores.")
     parser.add_argument("--step_is_subprocess", dest="step_is_subprocess",
                         action="store_true",
                         help="Used internally by compass to indicate that"
                              "a step is being run as a subprocess.")
+    parser.add_argument("--available_cores", dest="available_cores",
+                        type=int,
+                        help="Used internally by compass to indicate the "
+                             "number of cores a step run as a subprocess "
+                             "may use.")
     args = parser.parse_args(sys.argv[2:])
+    if args.parallel:
+        from compass.run.parallel import run_tests as run_tests_parallel
+        run_tests_func = run_tests_parallel
+    else:
+        run_tests_func = run_tests
     if args.suite is not None:
-        run_tests(args.suite, quiet=args.quiet)
+        run_tests_func(args.suite, quiet=args.quiet)
     elif os.path.exists('test_case.pickle'):
-        run_tests(suite_name='test_case', quiet=args.quiet, is_test_case=True,
-                  steps_to_run=args.steps, steps_not_to_run=args.no_steps)
+        run_tests_func(suite_name='test_case', quiet=args.quiet,
+                       is_test_case=True, steps_to_run=args.steps,
+                       steps_not_to_run=args.no_steps)
     elif os.path.exists('step.pickle'):
-        run_single_step(args.step_is_subprocess)
+        run_single_step(args.step_is_subprocess, args.available_cores)
     else:
         pickles = glob.glob('*.pickle')
         if len(pickles) == 1:
             suite = os.path.splitext(os.path.basename(pickles[0]))[0]
-            run_tests(suite, quiet=args.quiet)
+            run_tests_func(suite, quiet=args.quiet)
         elif len(pickles) == 0:
             raise OSError('No pickle files were found. Are you sure this is '
                           'a compass suite, test-case or step work directory?')
@@ -217,6 +205,61 @@ def main():
                              'which to run: compass run <suite>')
 
 
+def _load_suite(suite_name):
+    """
+    Load the pickled test suite (or test case) and determine the parallel
+    resources available for running it
+    """
+    # Allow a suite name to either include or not the .pickle suffix
+    if suite_name.endswith('.pickle'):
+        # code below assumes no suffix, so remove it
+        suite_name = suite_name[:-len('.pickle')]
+    # Now open the the suite's pickle file
+    if not os.path.exists(f'{suite_name}.pickle'):
+        raise ValueError(f'The suite "{suite_name}" does not appear to have '
+                         f'been set up here.')
+    with open(f'{suite_name}.pickle', 'rb') as handle:
+        test_suite = pickle.load(handle)
+
+    # get the config file for the first test case in the suite
+    test_case = next(iter(test_suite['test_cases'].values()))
+    config_filename = os.path.join(test_case.work_dir,
+                                   test_case.config_filename)
+    config = CompassConfigParser()
+    config.add_from_file(config_filename)
+    available_resources = get_available_parallel_resources(config)
+    return suite_name, test_suite, available_resources
+
+
+def _log_suite_summary(logger, test_times, success_strs, suite_time,
+                       failures):
+    """
+    Log the runtime and status of each test case and of the full suite, then
+    exit with an error if any test cases failed
+    """
+    logger.info('Test Runtimes:')
+    for test_name, test_time in test_times.items():
+        secs = round(test_time)
+        mins = secs // 60
+        secs -= 60 * mins
+        logger.info(f'{mins:02d}:{secs:02d} {success_strs[test_name]} '
+                    f'{test_name}')
+    secs = round(suite_time)
+    mins = secs // 60
+    secs -= 60 * mins
+    logger.info(f'Total runtime {mins:02d}:{secs:02d}')
+
+    if failures == 0:
+        logger.info('PASS: All passed successfully!')
+    else:
+        if failures == 1:
+            message = '1 test'
+        else:
+            message = f'{failures} tests'
+        logger.error(f'FAIL: {message} failed, see above.')
+        sys.exit(1)
+
+
 def _update_steps_to_run(steps_to_run, steps_not_to_run, config, steps):
     """
     Update the steps to run
@@ -260,16 +303,6 @@ def _print_to_stdout(test_case, message):
 def _log_and_run_test(test_case, logger, test_logger, quiet,  # noqa: C901
                       log_filename, is_test_case, steps_to_run,
                       steps_not_to_run, available_resources):
-    # ANSI fail text: https://stackoverflow.com/a/287944/7728169
-    start_fail = '\033[91m'
-    start_pass = '\033[92m'
-    start_time_color = '\033[94m'
-    end = '\033[0m'
-    pass_str = f'{start_pass}PASS{end}'
-    success_str = f'{start_pass}SUCCESS{end}'
-    fail_str = f'{start_fail}FAIL{end}'
-    error_str = f'{start_fail}ERROR{end}'
-
     test_name = test_case.path.replace('/', '_')
     with LoggingContext(test_name, logger=test_logger,
                         log_filename=log_filename) as test_logger:
@@ -303,10 +336,8 @@ def _log_and_run_test(test_case, logger, test_logger, quiet,  # noqa: C901
         test_logger.info('')
         try:
             _test_case_run_deprecated(test_case)
-            run_status = success_str
             test_pass = True
         except BaseException:
-            run_status = error_str
             test_pass = False
             test_logger.exception('Exception raised in the test '
                                   'case\'s run() method')
@@ -318,10 +349,8 @@ def _log_and_run_test(test_case, logger, test_logger, quiet,  # noqa: C901
             test_logger.info(f'Running steps: {test_list}')
             try:
                 _run_test(test_case, available_resources)
-                run_status = success_str
                 test_pass = True
             except BaseException:
-                run_status = error_str
                 test_pass = False
                 test_logger.exception('Exception raised while running '
                                       'the steps of the test case')
@@ -334,60 +363,89 @@ def _log_and_run_test(test_case, logger, test_logger, quiet,  # noqa: C901
             try:
                 test_case.validate()
             except BaseException:
-                run_status = error_str
                 test_pass = False
                 test_logger.exception('Exception raised in the test '
                                       'case\'s validate() method')
 
-        baseline_status = None
-        internal_status = None
-        if test_case.validation is not None:
-            internal_pass = test_case.validation['internal_pass']
-            baseline_pass = test_case.validation['baseline_pass']
-
-            if internal_pass is not None:
-                if internal_pass:
-                    internal_status = pass_str
-                else:
-                    internal_status = fail_str
-                    test_logger.error(
-                        'Internal test case validation failed')
-                    test_pass = False
-
-            if baseline_pass is not None:
-                if baseline_pass:
-                    baseline_status = pass_str
-                else:
-                    baseline_status = fail_str
-                    test_logger.error('Baseline validation failed')
-                    test_pass = False
-
-        status = f'  test execution:      {run_status}'
-        if internal_status is not None:
-            status = f'{status}\n' \
-                     f'  test validation:     {internal_status}'
-        if baseline_status is not None:
-            status = f'{status}\n' \
-                     f'  baseline comparison: {baseline_status}'
+        success_str, success, test_time = _log_test_result(
+            test_case, logger, test_logger, test_pass, test_start,
+            is_test_case)
 
-        if test_pass:
-            logger.info(status)
-            success_str = pass_str
-            success = True
-        else:
-            logger.error(status)
-            if not is_test_case:
-                logger.error(f'  see: case_outputs/{test_name}.log')
-            success_str = fail_str
-            success = False
+    return success_str, success, test_time
 
-        test_time = time.time() - test_start
 
-        secs = round(test_time)
-        mins = secs // 60
-        secs -= 60 * mins
-        logger.info(f'  test runtime:        '
-                    f'{start_time_color}{mins:02d}:{secs:02d}{end}')
+def _log_test_result(test_case, logger, test_logger, test_pass, test_start,
+                     is_test_case):
+    """
+    Log the execution, validation and baseline status of a test case along
+    with its runtime
+    """
+    # ANSI fail text: https://stackoverflow.com/a/287944/7728169
+    start_fail = '\033[91m'
+    start_pass = '\033[92m'
+    start_time_color = '\033[94m'
+    end = '\033[0m'
+    pass_str = f'{start_pass}PASS{end}'
+    success_str = f'{start_pass}SUCCESS{end}'
+    fail_str = f'{start_fail}FAIL{end}'
+    error_str = f'{start_fail}ERROR{end}'
+
+    test_name = test_case.path.replace('/', '_')
+
+    if test_pass:
+        run_status = success_str
+    else:
+        run_status = error_str
+
+    baseline_status = None
+    internal_status = None
+    if test_case.validation is not None:
+        internal_pass = test_case.validation['internal_pass']
+        baseline_pass = test_case.validation['baseline_pass']
+
+        if internal_pass is not None:
+            if internal_pass:
+                internal_status = pass_str
+            else:
+                internal_status = fail_str
+                test_logger.error(
+                    'Internal test case validation failed')
+                test_pass = False
+
+        if baseline_pass is not None:
+            if baseline_pass:
+                baseline_status = pass_str
+            else:
+                baseline_status = fail_str
+                test_logger.error('Baseline validation failed')
+                test_pass = False
+
+    status = f'  test execution:      {run_status}'
+    if internal_status is not None:
+        status = f'{status}\n' \
+                 f'  test validation:     {internal_status}'
+    if baseline_status is not None:
+        status = f'{status}\n' \
+                 f'  baseline comparison: {baseline_status}'
+
+    if test_pass:
+        logger.info(status)
+        success_str = pass_str
+        success = True
+    else:
+        logger.error(status)
+        if not is_test_case:
+            logger.error(f'  see: case_outputs/{test_name}.log')
+        success_str = fail_str
+        success = False
+
+    test_time = time.time() - test_start
+
+    secs = round(test_time)
+    mins = secs // 60
+    secs -= 60 * mins
+    logger.info(f'  test runtime:        '
+                f'{start_time_color}{mins:02d}:{secs:02d}{end}')
 
     return success_str, success, test_time
 
@@ -457,15 +515,21 @@ def _run_step(test_case, step, new_log_file, available_resources):
         # runtime_setup() will perform small tasks that require knowing the
         # resources of the task before the step runs (such as creating
         # graph partitions)
-        step_logger.info('')
-        log_method_call(method=step.runtime_setup, logger=step_logger)
-        step_logger.info('')
-        step.runtime_setup()
-
-        step_logger.info('')
-        log_method_call(method=step.run, logger=step_logger)
-        step_logger.info('')
-        step.run()
+        step_start = time.time()
+        try:
+            step_logger.info('')
+            log_method_call(method=step.runtime_setup, logger=step_logger)
+            step_logger.info('')
+            step.runtime_setup()
+
+            step_logger.info('')
+            log_method_call(method=step.run, logger=step_logger)
+            step_logger.info('')
+            step.run()
+        except BaseException:
+            _record_step(step, step_start, success=False)
+            raise
+        _record_step(step, step_start, success=True)
 
     missing_files = list()
     for output_file in step.outputs:
@@ -479,6 +543,19 @@ def _run_step(test_case, step, new_log_file, available_resources):
             f'{step.test_case.subdir}: {missing_files}')
 
 
+def _record_step(step, step_start, success):
+    """
+    Record the performance of a step in the performance history, logging
+    (rather than raising) any errors
+    """
+    wall_time = time.time() - step_start
+    try:
+        record_step(step, step_start, wall_time, success)
+    except Exception:
+        step.logger.exception('Could not record the performance of step '
+                              f'{step.name}')
+
+
 def _run_step_as_subprocess(test_case, step, new_log_file):
     """
     Run the requested step as a subprocess
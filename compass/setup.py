@@ -2,20 +2,23 @@ import argparse
 import os
 import pickle
 import sys
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 from mache import discover_machine
 
 from compass import provenance
 from compass.config import CompassConfigParser
-from compass.io import symlink
+from compass.io import DownloadManager, symlink
 from compass.job import write_job_script
-from compass.mpas_cores import get_mpas_cores
+from compass.mpas_cores import get_test_cases, get_test_index
 
 
 def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noqa: C901, E501
                 work_dir=None, baseline_dir=None, mpas_model_path=None,
-                suite_name='custom', cached=None, copy_executable=False):
+                suite_name='custom', cached=None, copy_executable=False,
+                parallel_setup=None):
     """
     Set up one or more test cases
 
@@ -59,6 +62,11 @@ def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noq
     copy_executable : bool, optional
         Whether to copy the MPAS executable to the work directory
 
+    parallel_setup : int, optional
+        The number of test cases to set up at once in separate processes.  By
+        default, the ``parallel_setup`` config option in the ``setup``
+        section.
+
     Returns
     -------
     test_cases : dict of compass.TestCase
@@ -93,18 +101,12 @@ def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noq
         work_dir = os.getcwd()
     work_dir = os.path.abspath(work_dir)
 
-    mpas_cores = get_mpas_cores()
-
-    all_test_cases = dict()
-    for mpas_core in mpas_cores:
-        for test_group in mpas_core.test_groups.values():
-            for test_case in test_group.test_cases.values():
-                all_test_cases[test_case.path] = test_case
+    # only the test groups of the requested test cases are imported
+    all_paths = [entry['path'] for entry in get_test_index()]
 
-    test_cases = dict()
+    paths = list()
     cached_steps = dict()
     if numbers is not None:
-        keys = list(all_test_cases)
         for number in numbers:
             cache_all = False
             if number.endswith('c'):
@@ -113,26 +115,30 @@ def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noq
             else:
                 number = int(number)
 
-            if number >= len(keys):
+            if number >= len(all_paths):
                 raise ValueError('test number {} is out of range.  There are '
-                                 'only {} tests.'.format(number, len(keys)))
-            path = keys[number]
+                                 'only {} tests.'.format(number,
+                                                         len(all_paths)))
+            path = all_paths[number]
             if cache_all:
                 cached_steps[path] = ['_all']
             else:
                 cached_steps[path] = list()
-            test_cases[path] = all_test_cases[path]
+            paths.append(path)
 
     if tests is not None:
+        valid_paths = set(all_paths)
         for index, path in enumerate(tests):
-            if path not in all_test_cases:
+            if path not in valid_paths:
                 raise ValueError('Test case with path {} is not in '
                                  'test_cases'.format(path))
             if cached is not None:
                 cached_steps[path] = cached[index]
             else:
                 cached_steps[path] = list()
-            test_cases[path] = all_test_cases[path]
+            paths.append(path)
+
+    test_cases = get_test_cases(paths)
 
     # get the MPAS core of the first test case.  We'll assume all tests are
     # for this core
@@ -144,12 +150,39 @@ def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noq
 
     provenance.write(work_dir, test_cases, config=basic_config)
 
+    if parallel_setup is None:
+        parallel_setup = basic_config.getint('setup', 'parallel_setup')
+    parallel_setup = min(parallel_setup, len(test_cases))
+
     print('Setting up test cases:')
-    for path, test_case in test_cases.items():
-        setup_case(path, test_case, config_file, machine, work_dir,
-                   baseline_dir, mpas_model_path,
-                   cached_steps=cached_steps[path],
-                   copy_executable=copy_executable)
+    setup_times = dict()
+    if parallel_setup > 1:
+        # each process imports and sets up its own copy of the test case,
+        # which replaces the one we have here
+        with ProcessPoolExecutor(max_workers=parallel_setup) as executor:
+            futures = {path: executor.submit(
+                _setup_case_in_process, path, config_file, machine, work_dir,
+                baseline_dir, mpas_model_path, cached_steps[path],
+                copy_executable) for path in test_cases}
+            for path, future in futures.items():
+                test_cases[path], setup_times[path] = future.result()
+    else:
+        # download input files for all test cases concurrently
+        download_manager = DownloadManager(basic_config)
+        for path, test_case in test_cases.items():
+            start = time.time()
+            setup_case(path, test_case, config_file, machine, work_dir,
+                       baseline_dir, mpas_model_path,
+                       cached_steps=cached_steps[path],
+                       copy_executable=copy_executable,
+                       download_manager=download_manager)
+            setup_times[path] = time.time() - start
+
+        download_manager.wait()
+
+    print('Setup times:')
+    for path, setup_time in setup_times.items():
+        print(f'  {path}: {setup_time:.1f} s')
 
     test_suite = {'name': suite_name,
                   'test_cases': test_cases,
@@ -176,7 +209,8 @@ def setup_cases(tests=None, numbers=None, config_file=None, machine=None,  # noq
 
 
 def setup_case(path, test_case, config_file, machine, work_dir, baseline_dir,
-               mpas_model_path, cached_steps, copy_executable):
+               mpas_model_path, cached_steps, copy_executable,
+               download_manager=None):
     """
     Set up one or more test cases
 
@@ -212,6 +246,10 @@ def setup_case(path, test_case, config_file, machine, work_dir, baseline_dir,
 
     copy_executable : bool, optional
         Whether to copy the MPAS executable to the work directory
+
+    download_manager : compass.io.DownloadManager, optional
+        A manager for downloading input files concurrently.  If provided, the
+        caller must call its ``wait()`` method to finish downloading files.
     """
 
     print('  {}'.format(path))
@@ -296,7 +334,7 @@ def setup_case(path, test_case, config_file, machine, work_dir, baseline_dir,
         step.setup()
 
         # process input, output, namelist and streams files
-        step.process_inputs_and_outputs()
+        step.process_inputs_and_outputs(download_manager=download_manager)
 
     # wait until we've set up all the steps before pickling because steps may
     # need other steps to be set up
@@ -375,6 +413,11 @@ def main():
                         action="store_true",
                         help="If the MPAS executable should be copied to the "
                              "work directory")
+    parser.add_argument("-j", "--parallel_setup", dest="parallel_setup",
+                        type=int,
+                        help="The number of test cases to set up at once in "
+                             "separate processes",
+                        metavar="NUM")
 
     args = parser.parse_args(sys.argv[2:])
     cached = None
@@ -388,7 +431,27 @@ def main():
                 config_file=args.config_file, machine=args.machine,
                 work_dir=args.work_dir, baseline_dir=args.baseline_dir,
                 mpas_model_path=args.mpas_model, suite_name=args.suite_name,
-                cached=cached, copy_executable=args.copy_executable)
+                cached=cached, copy_executable=args.copy_executable,
+                parallel_setup=args.parallel_setup)
+
+
+def _setup_case_in_process(path, config_file, machine, work_dir, baseline_dir,
+                           mpas_model_path, cached_steps, copy_executable):
+    """
+    Set up a test case in a worker process, downloading its input files, and
+    return the test case and the time it took to set up
+    """
+    start = time.time()
+    test_case = get_test_cases([path])[path]
+    basic_config = _get_basic_config(config_file, machine, mpas_model_path,
+                                     test_case.mpas_core.name)
+    download_manager = DownloadManager(basic_config)
+    setup_case(path, test_case, config_file, machine, work_dir, baseline_dir,
+               mpas_model_path, cached_steps=cached_steps,
+               copy_executable=copy_executable,
+               download_manager=download_manager)
+    download_manager.wait()
+    return test_case, time.time() - start
 
 
 def _get_required_cores(test_cases):
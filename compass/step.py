@@ -354,7 +354,7 @@ class Step:
 
     def add_input_file(self, filename=None, target=None, database=None,
                        database_component=None, url=None, work_dir_target=None,
-                       package=None, copy=False):
+                       package=None, copy=False, checksum=None):
         """
         Add an input file to the step (but not necessarily to the MPAS model).
         The file can be local, a symlink to a file that will be created in
@@ -404,6 +404,11 @@ class Step:
 
         copy : bool, optional
             Whether to make a copy of the file, rather than a symlink
+
+        checksum : str, optional
+            The SHA-256 checksum of the file if it is downloaded, used to
+            verify the download.  If not provided, a checksum published on
+            the server (if any) is used.
         """
         if filename is None:
             if target is None:
@@ -415,7 +420,8 @@ class Step:
                                     database=database,
                                     database_component=database_component,
                                     url=url, work_dir_target=work_dir_target,
-                                    package=package, copy=copy))
+                                    package=package, copy=copy,
+                                    checksum=checksum))
 
     def add_output_file(self, filename):
         """
@@ -642,7 +648,7 @@ class Step:
                                     replacements=template_replacements)
         compass.streams.write(tree, filename)
 
-    def process_inputs_and_outputs(self):  # noqa: C901
+    def process_inputs_and_outputs(self, download_manager=None):  # noqa: C901, E501
         """
         Process the inputs to and outputs from a step added with
         :py:meth:`compass.Step.add_input_file` and
@@ -651,6 +657,15 @@ class Step:
         paths.
 
         Also generates namelist and streams files
+
+        Parameters
+        ----------
+        download_manager : compass.io.DownloadManager, optional
+            A manager for downloading files concurrently.  If provided, files
+            are downloaded in the background and symlinks are made to where
+            they will be downloaded, so the caller must call the manager's
+            ``wait()`` method before the files are used.  Otherwise, files are
+            downloaded one at a time before this method returns.
        """
         mpas_core = self.mpas_core.name
         step_dir = self.work_dir
@@ -687,6 +702,7 @@ class Step:
             work_dir_target = entry['work_dir_target']
             package = entry['package']
             copy = entry['copy']
+            checksum = entry['checksum']
 
             if filename == '<<<model>>>':
                 model = self.config.get('executables', 'model')
@@ -758,7 +774,12 @@ class Step:
                 download_path = download_target
 
             if url is not None:
-                download_target = download(url, download_path, config)
+                if download_manager is None:
+                    download_target = download(url, download_path, config,
+                                               checksum=checksum)
+                else:
+                    download_target = download_manager.add(
+                        url, download_path, config=config, checksum=checksum)
                 if target is not None:
                     # this is the absolute path that we presumably want
                     target = download_target
@@ -774,7 +795,11 @@ class Step:
                 inputs.append(filename)
 
         if len(databases_with_downloads) > 0:
-            self._fix_permissions(databases_with_downloads)
+            if download_manager is None:
+                self._fix_permissions(databases_with_downloads)
+            else:
+                download_manager.add_callback(self._fix_permissions,
+                                              databases_with_downloads)
 
         # convert inputs and outputs to absolute paths
         self.inputs = [os.path.abspath(os.path.join(step_dir, filename)) for
@@ -860,25 +885,10 @@ class Step:
             defaults_filename = config.get('streams', mode)
             out_filename = f'{step_work_dir}/{out_name}'
 
-            defaults_tree = etree.parse(defaults_filename)
-
-            defaults = next(defaults_tree.iter('streams'))
-            streams = next(tree.iter('streams'))
-
-            for stream in streams:
-                compass.streams.update_defaults(stream, defaults)
-
-            # remove any streams that aren't requested
-            for default in defaults:
-                found = False
-                for stream in streams:
-                    if stream.attrib['name'] == default.attrib['name']:
-                        found = True
-                        break
-                if not found:
-                    defaults.remove(default)
+            # start from the requested streams in the defaults file
+            defaults = compass.streams.read_defaults(defaults_filename, tree)
 
-            compass.streams.write(defaults_tree, out_filename)
+            compass.streams.write(defaults, out_filename)
 
     def _fix_permissions(self, databases):  # noqa: C901
         """
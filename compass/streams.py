@@ -1,8 +1,13 @@
+import os
 from lxml import etree
 from copy import deepcopy
 from importlib import resources
 from jinja2 import Template
 
+# defaults streams files that have already been parsed, keyed by absolute
+# path, with the modification time and size of the file when it was parsed
+_defaults_cache = dict()
+
 
 def read(package, streams_filename, tree=None, replacements=None):
     """
@@ -99,40 +104,56 @@ def write(streams, out_filename):
         stream_file.write('</streams>\n')
 
 
-def update_defaults(new_child, defaults):
+def read_defaults(defaults_filename, tree):
     """
-    Update a stream or its children (sub-stream, var, etc.) starting from the
-    defaults or add it if it's new.
+    Get the streams from a defaults file that are requested in the given
+    tree of streams, updated with the contents of the tree
+
+    Parameters
+    ----------
+    defaults_filename : str
+        The defaults streams file (e.g. from the MPAS component's
+        ``default_inputs`` directory).  Each file is only parsed once unless it
+        has changed.
+
+    tree : lxml.etree
+        A tree of XML data describing the requested MPAS i/o streams
+
+    Returns
+    -------
+    defaults : lxml.etree.Element
+        The requested streams, starting from the defaults.  Streams in the
+        defaults file that were not requested are left out.
     """
-    if 'name' not in new_child.attrib:
-        return
+    path = os.path.abspath(defaults_filename)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if path not in _defaults_cache or _defaults_cache[path][0] != key:
+        defaults_tree = etree.parse(defaults_filename)
+        _defaults_cache[path] = (key, next(defaults_tree.iter('streams')))
+    all_defaults = _defaults_cache[path][1]
 
-    name = new_child.attrib['name']
-    found = False
-    for child in defaults:
-        if child.attrib['name'] == name:
-            found = True
-            if child.tag != new_child.tag:
-                raise ValueError('Trying to update stream "{}" with '
-                                 'inconsistent tags {} vs. {}.'.format(
-                                     name, child.tag, new_child.tag))
+    streams = next(tree.iter('streams'))
+    names = set(stream.attrib['name'] for stream in streams
+                if 'name' in stream.attrib)
 
-            # copy the attributes
-            for attr, value in new_child.attrib.items():
-                child.attrib[attr] = value
+    # only copy the cached defaults for the requested streams
+    defaults = etree.Element(all_defaults.tag, all_defaults.attrib)
+    for default in all_defaults:
+        if default.attrib.get('name') in names:
+            defaults.append(deepcopy(default))
 
-            if len(new_child) > 0:
-                # we don't want default grandchildren
-                for grandchild in child:
-                    child.remove(grandchild)
+    _update_children(streams, defaults)
 
-            # copy or add the grandchildren's contents
-            for new_grandchild in new_child:
-                update_defaults(new_grandchild, child)
+    return defaults
 
-    if not found:
-        # add a deep copy of the element
-        defaults.append(deepcopy(new_child))
+
+def update_defaults(new_child, defaults):
+    """
+    Update a stream or its children (sub-stream, var, etc.) starting from the
+    defaults or add it if it's new.
+    """
+    _update_children([new_child], defaults)
 
 
 def _update_tree(tree, new_tree):
@@ -177,3 +198,45 @@ def _update_element(new_child, elements):
     if not found:
         # add a deep copy of the element
         elements.append(deepcopy(new_child))
+
+
+def _update_children(new_children, defaults):
+    """
+    Update streams or their children starting from the defaults or add them
+    if they're new, looking up defaults by name rather than searching for
+    each one
+    """
+    children = dict()
+    for child in defaults:
+        if 'name' in child.attrib:
+            children.setdefault(child.attrib['name'], list()).append(child)
+
+    for new_child in new_children:
+        if 'name' not in new_child.attrib:
+            continue
+
+        name = new_child.attrib['name']
+        if name not in children:
+            # add a deep copy of the element
+            child = deepcopy(new_child)
+            defaults.append(child)
+            children[name] = [child]
+            continue
+
+        for child in children[name]:
+            if child.tag != new_child.tag:
+                raise ValueError('Trying to update stream "{}" with '
+                                 'inconsistent tags {} vs. {}.'.format(
+                                     name, child.tag, new_child.tag))
+
+            # copy the attributes
+            for attr, value in new_child.attrib.items():
+                child.attrib[attr] = value
+
+            if len(new_child) > 0:
+                # we don't want default grandchildren
+                for grandchild in list(child):
+                    child.remove(grandchild)
+
+                # copy or add the grandchildren's contents
+                _update_children(new_child, child)
@@ -8,7 +8,7 @@ from compass.clean import clean_cases
 
 def setup_suite(mpas_core, suite_name, config_file=None, machine=None,
                 work_dir=None, baseline_dir=None, mpas_model_path=None,
-                copy_executable=False):
+                copy_executable=False, parallel_setup=None):
     """
     Set up a test suite
 
@@ -43,6 +43,11 @@ def setup_suite(mpas_core, suite_name, config_file=None, machine=None,
 
     copy_executable : bool, optional
         Whether to copy the MPAS executable to the work directory
+
+    parallel_setup : int, optional
+        The number of test cases to set up at once in separate processes.  By
+        default, the ``parallel_setup`` config option in the ``setup``
+        section.
     """
     text = resources.read_text('compass.{}.suites'.format(mpas_core),
                                '{}.txt'.format(suite_name))
@@ -52,7 +57,8 @@ def setup_suite(mpas_core, suite_name, config_file=None, machine=None,
     setup_cases(tests, config_file=config_file, machine=machine,
                 work_dir=work_dir, baseline_dir=baseline_dir,
                 mpas_model_path=mpas_model_path, suite_name=suite_name,
-                cached=cached, copy_executable=copy_executable)
+                cached=cached, copy_executable=copy_executable,
+                parallel_setup=parallel_setup)
 
 
 def clean_suite(mpas_core, suite_name, work_dir=None):
@@ -118,6 +124,11 @@ def main():
                         action="store_true",
                         help="If the MPAS executable should be copied to the "
                              "work directory")
+    parser.add_argument("-j", "--parallel_setup", dest="parallel_setup",
+                        type=int,
+                        help="The number of test cases to set up at once in "
+                             "separate processes",
+                        metavar="NUM")
     args = parser.parse_args(sys.argv[2:])
 
     if not args.clean and not args.setup:
@@ -133,7 +144,8 @@ def main():
                     config_file=args.config_file, machine=args.machine,
                     work_dir=args.work_dir, baseline_dir=args.baseline_dir,
                     mpas_model_path=args.mpas_model,
-                    copy_executable=args.copy_executable)
+                    copy_executable=args.copy_executable,
+                    parallel_setup=args.parallel_setup)
 
 
 def _parse_suite(text):
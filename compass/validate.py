@@ -1,8 +1,38 @@
+import fnmatch
+import hashlib
+import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import dask
 import numpy
 import xarray
-import re
-import fnmatch
+
+# the maximum number of values from each file to read into memory at once
+# when comparing a variable
+_max_chunk_size = 10000000
+
+# the maximum number of variables to compare concurrently
+_max_compare_workers = 4
+
+# the suffix of the file next to a baseline file where digests of its
+# variables are cached
+_digest_cache_suffix = '.digests.json'
+
+# for each file name pattern with timers, the indices of the name, count,
+# total, min and max of each timer on a line
+_timer_file_formats = {
+    # files written using built in MPAS timers
+    'log.*.out': dict(name=1, count=3, total=2, min=4, max=5),
+    # files written using GPTL timers
+    'timing.*': dict(name=0, count=1, total=3, min=5, max=4)}
+
+# the minimum number of columns on a line with a timer
+_timer_line_size = 6
+
+# timer tables that have already been read, keyed by directory
+_timer_tables = dict()
 
 
 def compare_variables(test_case, variables, filename1, filename2=None,
@@ -140,14 +170,15 @@ def compare_variables(test_case, variables, filename1, filename2=None,
         result = _compare_variables(
             variables, os.path.join(work_dir, filename1),
             os.path.join(baseline_root, filename1), l1_norm=0.0, l2_norm=0.0,
-            linf_norm=0.0, quiet=quiet, logger=logger)
+            linf_norm=0.0, quiet=quiet, logger=logger, cache_digests=True)
         baseline_pass = baseline_pass and result
 
         if filename2 is not None:
             result = _compare_variables(
                 variables, os.path.join(work_dir, filename2),
                 os.path.join(baseline_root, filename2), l1_norm=0.0,
-                l2_norm=0.0, linf_norm=0.0, quiet=quiet, logger=logger)
+                l2_norm=0.0, linf_norm=0.0, quiet=quiet, logger=logger,
+                cache_digests=True)
             baseline_pass = baseline_pass and result
 
         if validation['baseline_pass'] is None:
@@ -169,8 +200,9 @@ def compare_timers(test_case, timers, rundir1, rundir2=None):
     test_case : compass.TestCase
         An object describing a test case to validate
 
-    timers : list
-        A list of timer names to compare
+    timers : list or None
+        A list of timer names to compare, or ``None`` to compare all timers
+        found in both directories
 
     rundir1 : str
         The relative path to a directory within the ``work_dir``. If
@@ -203,108 +235,188 @@ def compare_timers(test_case, timers, rundir1, rundir2=None):
 
 
 def _compare_variables(variables, filename1, filename2, l1_norm, l2_norm,
-                       linf_norm, quiet, logger):
-    """ compare fields in the two files """
+                       linf_norm, quiet, logger, cache_digests=False):
+    """
+    compare fields in the two files, optionally caching digests of the
+    variables in ``filename2`` (typically a baseline file) next to the file
+    """
 
     for filename in [filename1, filename2]:
         if not os.path.exists(filename):
             logger.error(f'File {filename} does not exist.')
             return False
 
-    ds1 = xarray.open_dataset(filename1)
-    ds2 = xarray.open_dataset(filename2)
+    # if no differences are allowed, variables with identical digests can
+    # skip computing norms
+    bit_for_bit = all([norm is None or norm == 0.
+                       for norm in [l1_norm, l2_norm, linf_norm]])
 
-    all_pass = True
-
-    for variable in variables:
-        all_found = True
-        for ds, filename in [(ds1, filename1), (ds2, filename2)]:
-            if variable not in ds:
-                logger.error(f'Variable {variable} not in {filename}.')
-                all_found = False
-        if not all_found:
-            all_pass = False
-            continue
+    if bit_for_bit and cache_digests:
+        digests2 = _read_digest_cache(filename2)
+    else:
+        digests2 = dict()
+    digests_updated = False
 
-        da1 = ds1[variable]
-        da2 = ds2[variable]
+    all_pass = True
 
-        if not numpy.all(da1.dims == da2.dims):
-            logger.error(f"Dimensions for variable {variable} don't match "
-                         f"between files {filename1} and {filename2}.")
-            all_pass = False
-            continue
+    with xarray.open_dataset(filename1) as ds1, \
+            xarray.open_dataset(filename2) as ds2:
+        # variables are compared concurrently, but output is written in order
+        max_workers = max(1, min(len(variables), _max_compare_workers))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_compare_variable, variable, ds1, ds2,
+                                       filename1, filename2, l1_norm,
+                                       l2_norm, linf_norm, quiet, bit_for_bit,
+                                       digests2.get(variable))
+                       for variable in variables]
+            for variable, future in zip(variables, futures):
+                variable_pass, messages, digest2 = future.result()
+                if digest2 is not None and \
+                        digests2.get(variable) != digest2:
+                    digests2[variable] = digest2
+                    digests_updated = True
+                for is_error, message in messages:
+                    if is_error:
+                        logger.error(message)
+                    else:
+                        print(message)
+                all_pass = all_pass and variable_pass
+
+    if cache_digests and digests_updated:
+        _write_digest_cache(filename2, digests2)
 
-        all_match = True
-        for dim in da1.sizes:
-            if da1.sizes[dim] != da2.sizes[dim]:
-                logger.error(f"Field sizes for variable {variable} don't "
-                             f"match files {filename1} and {filename2}.")
-                all_match = False
-        if not all_match:
-            all_pass = False
-            continue
+    return all_pass
 
-        if not quiet:
-            print("    Pass thresholds are:")
-            if l1_norm is not None:
-                print("       L1: {:16.14e}".format(l1_norm))
-            if l2_norm is not None:
-                print("       L2: {:16.14e}".format(l2_norm))
-            if linf_norm is not None:
-                print("       L_Infinity: {:16.14e}".format(
-                    linf_norm))
-        variable_pass = True
-        if 'Time' in da1.dims:
-            time_range = range(0, da1.sizes['Time'])
-            time_str = ', '.join(['{}'.format(j) for j in time_range])
-            print('{} Time index: {}'.format(variable.ljust(20), time_str))
-            for time_index in time_range:
-                slice1 = da1.isel(Time=time_index)
-                slice2 = da2.isel(Time=time_index)
-                result = _compute_norms(slice1, slice2, quiet, l1_norm,
-                                        l2_norm, linf_norm,
-                                        time_index=time_index)
-                variable_pass = variable_pass and result
 
-        else:
-            print('{}'.format(variable))
-            result = _compute_norms(da1, da2, quiet, l1_norm, l2_norm,
-                                    linf_norm)
+def _compare_variable(variable, ds1, ds2, filename1, filename2, l1_norm,
+                      l2_norm, linf_norm, quiet, bit_for_bit, digest2):
+    """
+    Compare a variable between two datasets, returning whether the
+    comparison passed, a list of messages (and whether each is an error) and
+    the digest of the variable in ``ds2`` (if one was computed or supplied)
+    """
+    messages = list()
+
+    all_found = True
+    for ds, filename in [(ds1, filename1), (ds2, filename2)]:
+        if variable not in ds:
+            messages.append((True, f'Variable {variable} not in {filename}.'))
+            all_found = False
+    if not all_found:
+        return False, messages, digest2
+
+    da1 = ds1[variable]
+    da2 = ds2[variable]
+
+    if not numpy.all(da1.dims == da2.dims):
+        messages.append((True, f"Dimensions for variable {variable} don't "
+                               f"match between files {filename1} and "
+                               f"{filename2}."))
+        return False, messages, digest2
+
+    all_match = True
+    for dim in da1.sizes:
+        if da1.sizes[dim] != da2.sizes[dim]:
+            messages.append((True, f"Field sizes for variable {variable} "
+                                   f"don't match files {filename1} and "
+                                   f"{filename2}."))
+            all_match = False
+    if not all_match:
+        return False, messages, digest2
+
+    identical = False
+    if bit_for_bit:
+        # compare digests of the raw values before computing any norms
+        if digest2 is None:
+            digest2 = _compute_digest(da2)
+        identical = _compute_digest(da1) == digest2
+
+    if not quiet:
+        messages.extend(_threshold_messages(l1_norm, l2_norm, linf_norm))
+    variable_pass = True
+    if 'Time' in da1.dims:
+        time_range = range(0, da1.sizes['Time'])
+        time_str = ', '.join(['{}'.format(j) for j in time_range])
+        messages.append(
+            (False, '{} Time index: {}'.format(variable.ljust(20), time_str)))
+        for time_index in time_range:
+            slice1 = da1.isel(Time=time_index)
+            slice2 = da2.isel(Time=time_index)
+            result, diff_str = _compute_norms(slice1, slice2, quiet, l1_norm,
+                                              l2_norm, linf_norm,
+                                              time_index=time_index,
+                                              identical=identical)
+            if diff_str is not None:
+                messages.append((False, diff_str))
             variable_pass = variable_pass and result
 
-        # ANSI fail text: https://stackoverflow.com/a/287944/7728169
-        start_fail = '\033[91m'
-        start_pass = '\033[92m'
-        end = '\033[0m'
-        pass_str = '{}PASS{}'.format(start_pass, end)
-        fail_str = '{}FAIL{}'.format(start_fail, end)
+    else:
+        messages.append((False, '{}'.format(variable)))
+        result, diff_str = _compute_norms(da1, da2, quiet, l1_norm, l2_norm,
+                                          linf_norm, identical=identical)
+        if diff_str is not None:
+            messages.append((False, diff_str))
+        variable_pass = variable_pass and result
+
+    # ANSI fail text: https://stackoverflow.com/a/287944/7728169
+    start_fail = '\033[91m'
+    start_pass = '\033[92m'
+    end = '\033[0m'
+    pass_str = '{}PASS{}'.format(start_pass, end)
+    fail_str = '{}FAIL{}'.format(start_fail, end)
+
+    if variable_pass:
+        messages.append((False, '  {} {}\n'.format(pass_str, filename1)))
+    else:
+        messages.append((False, '  {} {}\n'.format(fail_str, filename1)))
+    messages.append((False, '       {}\n'.format(filename2)))
+
+    return variable_pass, messages, digest2
 
-        if variable_pass:
-            print('  {} {}\n'.format(pass_str, filename1))
-        else:
-            print('  {} {}\n'.format(fail_str, filename1))
-        print('       {}\n'.format(filename2))
-        all_pass = all_pass and variable_pass
 
-    return all_pass
+def _threshold_messages(l1_norm, l2_norm, linf_norm):
+    """ Messages with the thresholds that norms are compared against """
+    messages = [(False, "    Pass thresholds are:")]
+    if l1_norm is not None:
+        messages.append((False, "       L1: {:16.14e}".format(l1_norm)))
+    if l2_norm is not None:
+        messages.append((False, "       L2: {:16.14e}".format(l2_norm)))
+    if linf_norm is not None:
+        messages.append((False, "       L_Infinity: {:16.14e}".format(
+            linf_norm)))
+    return messages
 
 
 def _compute_norms(da1, da2, quiet, max_l1_norm, max_l2_norm, max_linf_norm,
-                   time_index=None):
-    """ Compute norms between variables in two DataArrays """
-
-    da1 = _rename_duplicate_dims(da1)
-    da2 = _rename_duplicate_dims(da2)
+                   time_index=None, identical=False):
+    """
+    Compute norms between variables in two DataArrays, returning whether
+    the norms are within the given thresholds and a string with the norms
+    (or ``None`` if they should not be printed).  If the variables are
+    already known to be identical, the norms are zero and the arrays aren't
+    read.
+    """
 
     result = True
-    diff = numpy.abs(da1 - da2).values.ravel()
-    # skip entries where one field or both are a fill value
-    diff = diff[numpy.isfinite(diff)]
 
-    l1_norm = numpy.linalg.norm(diff, ord=1)
-    l2_norm = numpy.linalg.norm(diff, ord=2)
-    linf_norm = numpy.linalg.norm(diff, ord=numpy.inf)
+    if identical:
+        l1_norm = 0.
+        l2_norm = 0.
+        linf_norm = 0.
+    else:
+        # large arrays are chunked with dask, so the norms are computed one
+        # chunk at a time in a single pass without the full difference array
+        # in memory
+        da1 = _chunk(_rename_duplicate_dims(da1))
+        da2 = _chunk(_rename_duplicate_dims(da2))
+        diff = numpy.abs(da1 - da2)
+        # skip entries where one field or both are a fill value
+        diff = diff.where(numpy.isfinite(diff))
+        l1_norm, l2_norm_squared, linf_norm = dask.compute(
+            diff.sum(), (diff**2).sum(), diff.max().fillna(0.))
+        l1_norm = float(l1_norm)
+        l2_norm = numpy.sqrt(float(l2_norm_squared))
+        linf_norm = float(linf_norm)
 
     if time_index is None:
         diff_str = ''
@@ -326,17 +438,161 @@ def _compute_norms(da1, da2, quiet, max_l1_norm, max_l2_norm, max_linf_norm,
             result = False
     diff_str = '{} linf: {:16.14e} '.format(diff_str, linf_norm)
 
-    if not quiet or not result:
-        print(diff_str)
+    if quiet and result:
+        diff_str = None
+
+    return result, diff_str
+
+
+def _get_chunk_stride(da):
+    """
+    The size of chunks along the first dimension of a DataArray with at most
+    ``_max_chunk_size`` values, or ``None`` if it needn't be chunked
+    """
+    if da.ndim == 0 or da.size <= _max_chunk_size:
+        return None
+    return max(1, _max_chunk_size // (da.size // da.sizes[da.dims[0]]))
+
+
+def _chunk(da):
+    """
+    Chunk a DataArray with dask along its first dimension if it is too large
+    to read at once
+    """
+    stride = _get_chunk_stride(da)
+    if stride is None:
+        return da
+    return da.chunk({da.dims[0]: stride})
+
+
+def _iterate_chunks(da):
+    """
+    Iterate over chunks of a DataArray along its first dimension, in order,
+    reading at most ``_max_chunk_size`` values at a time
+    """
+    stride = _get_chunk_stride(da)
+    if stride is None:
+        yield da.values
+        return
+
+    dim = da.dims[0]
+    for start in range(0, da.sizes[dim], stride):
+        yield da.isel({dim: slice(start, start + stride)}).values
+
+
+def _compute_digest(da):
+    """
+    Compute a digest of the dimensions, data type and raw values of a
+    DataArray
+    """
+    sha = hashlib.sha256()
+    header = [list(da.dims), list(da.shape), da.dtype.str]
+    sha.update(json.dumps(header).encode('utf-8'))
+    for chunk in _iterate_chunks(da):
+        sha.update(numpy.ascontiguousarray(chunk).tobytes())
+    return sha.hexdigest()
+
+
+def _read_digest_cache(filename):
+    """
+    Read the cached digests of variables in a file, returning an empty
+    dictionary if there are none or the file has changed since they were
+    cached
+    """
+    cache_filename = f'{filename}{_digest_cache_suffix}'
+    try:
+        with open(cache_filename) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return dict()
+
+    stat = os.stat(filename)
+    if cache.get('size') != stat.st_size or \
+            cache.get('mtime_ns') != stat.st_mtime_ns:
+        return dict()
 
-    return result
+    return dict(cache.get('digests', dict()))
+
+
+def _write_digest_cache(filename, digests):
+    """
+    Cache digests of variables in a file, skipping the cache if it can't be
+    written (e.g. because the baseline is read-only)
+    """
+    cache_filename = f'{filename}{_digest_cache_suffix}'
+    stat = os.stat(filename)
+    cache = {'size': stat.st_size,
+             'mtime_ns': stat.st_mtime_ns,
+             'digests': digests}
+    try:
+        with open(cache_filename, 'w') as cache_file:
+            json.dump(cache, cache_file, indent=4)
+    except OSError:
+        pass
+
+
+def read_timer_table(directory):
+    """
+    Read the timers from MPAS log files (``log.*.out``) and GPTL timing files
+    (``timing.*``) in a run directory.  Each file is only parsed once and the
+    table is cached until files in the directory are added, removed or
+    modified.
+
+    Parameters
+    ----------
+    directory : str
+        The run directory with the timer files
+
+    Returns
+    -------
+    table : dict
+        A dictionary with a table for each timer file, in the order the files
+        are listed in the directory.  Each table is a dictionary from timer
+        names (with spaces replaced by underscores) to a dictionary with the
+        ``count``, ``min``, ``max`` and ``total`` of that timer, any of which
+        may be ``None`` if it couldn't be parsed.  If a timer appears on
+        several lines of a file (e.g. for several threads), its counts and
+        totals are summed.
+    """
+    directory = os.path.abspath(directory)
+    files = list()
+    for filename in os.listdir(directory):
+        file_format = _get_timer_file_format(filename)
+        if file_format is None:
+            continue
+        stat = os.stat(os.path.join(directory, filename))
+        files.append((filename, stat.st_size, stat.st_mtime_ns))
+
+    if directory in _timer_tables:
+        cached_files, table = _timer_tables[directory]
+        if cached_files == files:
+            return table
+
+    table = dict()
+    for filename, _, _ in files:
+        table[filename] = _read_timer_file(os.path.join(directory, filename),
+                                           _get_timer_file_format(filename))
+
+    _timer_tables[directory] = (files, table)
+    return table
 
 
 def _compute_timers(base_directory, comparison_directory, timers):
     """ Find timers and compute speedup between two run directories """
+    table1 = read_timer_table(base_directory)
+    table2 = read_timer_table(comparison_directory)
+
+    exact = timers is None
+    if exact:
+        timers = list()
+        for file_table in table1.values():
+            for timer in file_table:
+                if timer not in timers:
+                    timers.append(timer)
+
     for timer in timers:
-        timer1_found, timer1 = _find_timer_value(timer, base_directory)
-        timer2_found, timer2 = _find_timer_value(timer, comparison_directory)
+        timer1_found, timer1 = _find_timer_value(timer, table1, exact)
+        timer2_found, timer2 = _find_timer_value(timer, table2, exact)
 
         if timer1_found and timer2_found:
             if timer2 > 0.:
@@ -352,45 +608,114 @@ def _compute_timers(base_directory, comparison_directory, timers):
             print("   Percent Change: {}%".format(percent * 100))
             print("          Speedup: {}".format(speedup))
 
+            for label, table in [('Base', table1), ('Compare', table2)]:
+                breakdown = _get_process_breakdown(timer, table, exact)
+                if len(breakdown) > 1:
+                    print("   {} per process:".format(label))
+                    for filename, total in breakdown:
+                        print("      {}: {}".format(filename, total))
+
+
+def _get_timer_file_format(filename):
+    """ The format of a file with timers, or ``None`` if it has no timers """
+    for pattern, file_format in _timer_file_formats.items():
+        if fnmatch.fnmatch(filename, pattern):
+            return file_format
+    return None
+
 
-def _find_timer_value(timer_name, directory):
-    """ Find a timer in the given directory """
+def _read_timer_file(filename, file_format):
+    """ Read a table of timers from a file with the given format """
     # Build a regular expression for any two characters with a space between
     # them.
     regex = re.compile(r'(\S) (\S)')
 
+    table = dict()
+    with open(filename, "r") as stats_file:
+        for block in stats_file:
+            new_block = regex.sub(r"\1_\2", block[2:])
+            new_block_arr = new_block.split()
+            if len(new_block_arr) < _timer_line_size:
+                continue
+            total = _parse_timer_value(new_block_arr[file_format['total']])
+            if total is None:
+                continue
+            name = new_block_arr[file_format['name']]
+            count = _parse_timer_value(new_block_arr[file_format['count']])
+            min_value = _parse_timer_value(new_block_arr[file_format['min']])
+            max_value = _parse_timer_value(new_block_arr[file_format['max']])
+            if name not in table:
+                table[name] = dict(count=count, min=min_value,
+                                   max=max_value, total=total)
+                continue
+            stats = table[name]
+            stats['total'] += total
+            if stats['count'] is not None and count is not None:
+                stats['count'] += count
+            if stats['min'] is not None and min_value is not None:
+                stats['min'] = min(stats['min'], min_value)
+            if stats['max'] is not None and max_value is not None:
+                stats['max'] = max(stats['max'], max_value)
+
+    return table
+
+
+def _parse_timer_value(value):
+    """ Parse a value in a timer table, or ``None`` if it isn't a number """
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _timer_matches(timer_name, name, exact):
+    """
+    Whether a timer in a table matches the requested timer.  Unless an exact
+    match is required, any timer whose name is part of the requested name
+    matches.
+    """
     sub_timer_name = timer_name.replace(' ', '_')
+    if exact:
+        return name == sub_timer_name
+    return sub_timer_name.find(name) >= 0
+
+
+def _find_timer_value(timer_name, table, exact=False):
+    """
+    Find a timer in a table of timers, summing all matching timers in the
+    first file that has any
+    """
+    for file_table in table.values():
+        timer_found, timer = _sum_timer(timer_name, file_table, exact)
+        if timer_found:
+            return timer_found, timer
+
+    return False, 0.0
 
-    timer = 0.0
-    timer_found = False
-    for file in os.listdir(directory):
-        if not timer_found:
-            # Compare files written using built in MPAS timers
-            if fnmatch.fnmatch(file, "log.*.out"):
-                timer_line_size = 6
-                name_index = 1
-                total_index = 2
-            # Compare files written using GPTL timers
-            elif fnmatch.fnmatch(file, "timing.*"):
-                timer_line_size = 6
-                name_index = 0
-                total_index = 3
-            else:
-                continue
 
-            with open(os.path.join(directory, file), "r") as stats_file:
-                for block in iter(lambda: stats_file.readline(), ""):
-                    new_block = regex.sub(r"\1_\2", block[2:])
-                    new_block_arr = new_block.split()
-                    if len(new_block_arr) >= timer_line_size:
-                        if sub_timer_name.find(new_block_arr[name_index]) >= 0:
-                            try:
-                                timer = \
-                                    timer + float(new_block_arr[total_index])
-                                timer_found = True
-                            except ValueError:
-                                pass
+def _get_process_breakdown(timer_name, table, exact=False):
+    """
+    The total of a timer from each GPTL timing file (one per process) that
+    has the timer
+    """
+    breakdown = list()
+    for filename, file_table in table.items():
+        if not fnmatch.fnmatch(filename, 'timing.*'):
+            continue
+        timer_found, timer = _sum_timer(timer_name, file_table, exact)
+        if timer_found:
+            breakdown.append((filename, timer))
+    return breakdown
 
+
+def _sum_timer(timer_name, file_table, exact):
+    """ Sum the totals of all timers in a file that match the given timer """
+    timer = 0.0
+    timer_found = False
+    for name, stats in file_table.items():
+        if _timer_matches(timer_name, name, exact):
+            timer = timer + stats['total']
+            timer_found = True
     return timer_found, timer
 
 